@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/dev/ref/settings/
 from __future__ import absolute_import, unicode_literals
 
 import environ
+from celery.schedules import crontab
 from .permissions import *
 
 ROOT_DIR = environ.Path(__file__) - 3  # (/a/b/myfile.py - 3 = /)
@@ -277,10 +278,28 @@ INSTALLED_APPS += ('phoenix.taskapp.celery.CeleryConfig',)
 # if you are not using the django database broker (e.g. rabbitmq, redis, memcached), you can remove the next line.
 INSTALLED_APPS += ('kombu.transport.django',)
 BROKER_URL = env("CELERY_BROKER_URL", default='django://')
+CELERYBEAT_SCHEDULE = {
+    'refresh-calendars': {
+        'task': 'phoenix.animals.tasks.refresh_calendars',
+        'schedule': crontab(hour=2, minute=0),
+    },
+    'fit-lactation-curves': {
+        'task': 'phoenix.animals.tasks.fit_lactation_curves',
+        'schedule': crontab(hour=2, minute=30),
+    },
+    'plan-matings': {
+        'task': 'phoenix.animals.tasks.plan_all_matings',
+        'schedule': crontab(hour=3, minute=0),
+    },
+}
 ########## END CELERY
 
 # SMARTMIN SETTINGS
 ANONYMOUS_USER_ID = -1
 
 # Select2 settings
-AUTO_RENDER_SELECT2_STATICS = False
\ No newline at end of file
+AUTO_RENDER_SELECT2_STATICS = False
+
+# MILK ALERTS
+# a milk record raises an alert when its yield is this many standard deviations below what the cow usually gives
+MILK_ALERT_Z_SCORE = 3.0
@@ -50,6 +50,19 @@ DEBUG_TOOLBAR_CONFIG = {
     'SHOW_TEMPLATE_CONTEXT': True,
 }
 
+# query budgets
+# ------------------------------------------------------------------------------
+MIDDLEWARE_CLASSES += ('phoenix.utils.query_utils.QueryBudgetMiddleware',)
+
+LOGGING['handlers']['console'] = {
+    'level': 'DEBUG',
+    'class': 'logging.StreamHandler',
+}
+LOGGING['loggers']['phoenix.utils.query_utils'] = {
+    'handlers': ['console'],
+    'level': 'WARNING',
+}
+
 # django-extensions
 # ------------------------------------------------------------------------------
 INSTALLED_APPS += ('django_extensions', )
@@ -59,3 +72,8 @@ INSTALLED_APPS += ('django_extensions', )
 TEST_RUNNER = 'django.test.runner.DiscoverRunner'
 
 # Your local stuff: Below this line define 3rd party library settings
+
+# CELERY
+# ------------------------------------------------------------------------------
+# run tasks in process so no worker is needed during development
+CELERY_ALWAYS_EAGER = True
@@ -4,7 +4,12 @@ PERMISSIONS = {'*': ('create', # can create an object
                      'update', # can update an object
                      'delete', # can delete an object,
                      'list'),  # can view a list of the objects
-               'animals.animal': ('add_offspring',),
+               'animals.animal': ('add_offspring', 'export', 'fertility'),
+               'animals.milkproduction': ('session', 'export'),
+               'animals.lactationperiod': ('dry_off',),
+               'animals.service': ('export',),
+               'animals.pregnancycheck': ('export',),
+               'health.treatment': ('export',),
                }
 
 # GROUPS
@@ -20,12 +25,18 @@ GROUP_PERMISSIONS = {
                       'services.service_read', 'services.service_list', 'categories.category_list', 'categories.category_read',
                       'animals.pregnancycheck_read', 'animals.pregnancycheck_list',
                       'animals.milkproduction_read', 'animals.milkproduction_list',
-                      'animals.lactationperiod_read', 'animals.lactationperiod_list',
+                      'animals.lactationperiod_read', 'animals.lactationperiod_list', 'animals.dueevent_list',
+                      'animals.milkalert_list',
                       'auth.user_list', 'auth.user_read', 'groups.group_read', 'groups.group_list',
                       # sires and dams
                       'animals.sire_list', 'animals.dam_list', 'animals.sire_read', 'animals.dam_read',
                       # breeder
                       'animals.breeder_list', 'animals.breeder_read',
+                      # fertility KPIs
+                      'animals.animal_fertility',
+                      # exports
+                      'animals.animal_export', 'animals.milkproduction_export', 'animals.service_export',
+                      'animals.pregnancycheck_export', 'health.treatment_export',
                       ),
 
     GROUP_MANAGE_LIVESTOCK: ('animals.animal_create', 'animals.animal_update', 'animals.animal_delete', 'animals.animals_add_offspring',
@@ -36,6 +47,8 @@ GROUP_PERMISSIONS = {
                              'animals.sire_create', 'animals.sire_update', 'animals.dam_create', 'animals.dam_update',
                              # breeder
                              'animals.breeder_create', 'animals.breeder_update',
+                             # herd imports
+                             'animals.animalimport_create', 'animals.animalimport_read', 'animals.animalimport_list',
                              ),
 
     GROUP_MANAGE_ACCOUNT: ('auth.user_create', 'auth.user_delete', 'auth.user_update',),
@@ -43,6 +56,8 @@ GROUP_PERMISSIONS = {
     GROUP_MANAGE_PRODUCTION: ('services.service_create', 'services.service_update', 'services.service_delete',
                               'animals.pregnancycheck_create', 'animals.pregnancycheck_update', 'animals.pregnancycheck_delete',
                               'animals.milkproduction_create', 'animals.milkproduction_update', 'animals.milkproduction_delete',
+                              'animals.milkproduction_session',
                               'animals.lactationperiod_create', 'animals.lactationperiod_update', 'animals.lactationperiod_delete',
+                              'animals.lactationperiod_dry_off',
                               ),
 }
\ No newline at end of file
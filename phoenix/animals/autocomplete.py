@@ -0,0 +1,25 @@
+from functools import partial
+from phoenix.utils.autocomplete_utils import Autocomplete
+from .models import Animal, Breeder, Color, Dam, Sire, get_farm_parents
+
+
+def get_animal_rows(owner_id):
+    return [(pk, name, '%s %s' % (ear_tag, name))
+            for pk, name, ear_tag in Animal.objects.filter(farm=owner_id).values_list('id', 'name', 'ear_tag')]
+
+
+def get_parent_rows(model, owner_id):
+    rows = get_farm_parents(model, owner_id)
+    return [(pk, name, '%s %s' % (name, code)) for pk, name, code in rows.values_list('id', 'name', 'code')]
+
+
+def get_name_rows(model, owner_id):
+    # names shared by every farm
+    return [(pk, name, name) for pk, name in model.objects.values_list('id', 'name')]
+
+
+animals = Autocomplete('animals', get_animal_rows)
+sires = Autocomplete('sires', partial(get_parent_rows, Sire))
+dams = Autocomplete('dams', partial(get_parent_rows, Dam))
+colors = Autocomplete('colors', partial(get_name_rows, Color), scoped=False)
+breeders = Autocomplete('breeders', partial(get_name_rows, Breeder), scoped=False)
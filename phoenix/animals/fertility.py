@@ -0,0 +1,180 @@
+import numpy as np
+from django.core.cache import cache
+from phoenix.utils.cache_utils import bump_generations, get_generation
+from .models import Animal, LactationPeriod, PregnancyCheck, Service
+
+CACHE_KEY = 'fertility:%d:%d'
+CACHE_TIMEOUT = 60 * 60 * 24
+GENERATION_NAME = 'fertility'
+
+# the sums each breakdown keeps, the KPIs are worked out from them so any number of rows can be added up
+COLUMNS = ('services', 'checked_services', 'conceptions', 'days_open', 'conceptions_after_calving',
+           'calving_interval', 'calving_intervals', 'age_at_first_calving', 'first_calvings')
+SERVICES, CHECKED, CONCEPTIONS, DAYS_OPEN, OPENED, INTERVAL, INTERVALS, AGE, FIRST_CALVINGS = range(len(COLUMNS))
+
+
+def bump_fertility(farm_ids):
+    """
+    Marks the KPIs of the given farms as stale, for when their services, checks, calvings or animals change
+    """
+    bump_generations(GENERATION_NAME, farm_ids)
+
+
+def sum_by(index, length, weights=None):
+    """
+    Returns the sum of the weights, or the count, of each index from 0 to length
+    """
+    # older numpy wants a minlength of at least 1
+    return np.bincount(index, weights=weights, minlength=max(length, 1)).astype(np.float64)[:length]
+
+
+def get_kpis(totals):
+    """
+    Returns the KPIs of a row of totals, None where there is nothing to work them out from
+    """
+    def ratio(numerator, denominator):
+        return float(totals[numerator]) / totals[denominator] if totals[denominator] else None
+
+    return dict(services=int(totals[SERVICES]),
+                conceptions=int(totals[CONCEPTIONS]),
+                conception_rate=ratio(CONCEPTIONS, CHECKED),
+                services_per_conception=ratio(SERVICES, CONCEPTIONS),
+                days_open=ratio(DAYS_OPEN, OPENED),
+                calving_interval=ratio(INTERVAL, INTERVALS),
+                age_at_first_calving=ratio(AGE, FIRST_CALVINGS))
+
+
+class FertilityEngine(object):
+    """
+    Fertility KPIs of a farm for the whole herd and broken down by animal, group and sire: conception rate, services
+    per conception, days open, calving interval and age at first calving, all in days.
+
+    The services, checks and calvings of the farm are loaded once as arrays, each service and calving is measured
+    in a vectorized pass and the measures are summed up per animal and per sire with bincount. Groups add up the
+    sums of their members. A service counts as a conception or not by the latest of its checks, and days open run
+    from a calving to the next service that conceived.
+    """
+    def __init__(self, animal_ids, animal_totals, sire_ids, sire_totals, group_ids, group_totals):
+        self.animal_ids, self.animal_totals = animal_ids, animal_totals
+        self.sire_ids, self.sire_totals = sire_ids, sire_totals
+        self.group_ids, self.group_totals = group_ids, group_totals
+
+    @classmethod
+    def build(cls, farm):
+        animals = list(Animal.objects.filter(farm=farm).values_list('id', 'birth_date'))
+        animal_ids = np.array([animal_id for animal_id, birth_date in animals], dtype=np.int64)
+        births = np.array([birth_date.toordinal() if birth_date else 0 for animal_id, birth_date in animals],
+                          dtype=np.int64)
+
+        services = list(Service.objects.filter(animal__farm=farm).order_by('animal', 'date', 'id')
+                        .values_list('id', 'animal', 'sire', 'date'))
+        results = dict(PregnancyCheck.objects.filter(animal__farm=farm).exclude(service=None)
+                       .order_by('date', 'created_on').values_list('service', 'result'))
+        calvings = list(LactationPeriod.objects.filter(animal__farm=farm).order_by('animal', 'start_date')
+                        .values_list('animal', 'start_date'))
+
+        # animals are numbered by their position in the sorted ids, so rows ordered by animal stay in order
+        order = np.argsort(animal_ids)
+        animal_ids, births = animal_ids[order], births[order]
+
+        def positions(ids):
+            return np.searchsorted(animal_ids, np.array(ids, dtype=np.int64))
+
+        service_animals = positions([row[1] for row in services])
+        service_dates = np.array([row[3].toordinal() for row in services], dtype=np.int64)
+        outcomes = [results.get(row[0]) for row in services]
+        checked = np.array([outcome is not None for outcome in outcomes], dtype=bool)
+        conceived = np.array([outcome == PregnancyCheck.RESULT_CHOICES.pregnant for outcome in outcomes], dtype=bool)
+        sire_ids, service_sires = np.unique(np.array([row[2] for row in services], dtype=np.int64),
+                                            return_inverse=True)
+
+        calving_animals = positions([animal_id for animal_id, start_date in calvings])
+        calving_dates = np.array([start_date.toordinal() for animal_id, start_date in calvings], dtype=np.int64)
+
+        # calvings are sorted by animal then date, so the one before each is the previous calving of the same cow
+        repeat = np.zeros(len(calvings), dtype=bool)
+        repeat[1:] = calving_animals[1:] == calving_animals[:-1]
+        intervals = np.zeros(len(calvings), dtype=np.int64)
+        intervals[1:] = calving_dates[1:] - calving_dates[:-1]
+        first = ~repeat & (births[calving_animals] > 0)
+
+        # the last calving of the same cow before each service, found by searching keys ordered the same way
+        span = max(calving_dates.max() if len(calvings) else 0, service_dates.max() if len(services) else 0) + 1
+        calving_keys = calving_animals * span + calving_dates
+        before = np.searchsorted(calving_keys, service_animals * span + service_dates, side='right') - 1
+        after_calving = np.zeros(len(services), dtype=bool)
+        days_open = np.zeros(len(services), dtype=np.int64)
+        if len(calvings):
+            found = before >= 0
+            after_calving[found] = calving_animals[before[found]] == service_animals[found]
+            days_open[after_calving] = service_dates[after_calving] - calving_dates[before[after_calving]]
+        # only the first conception after a calving ends her days open, services are in date order for each cow
+        conceptions = np.flatnonzero(conceived & after_calving)
+        firsts = np.unique(before[conceptions], return_index=True)[1]
+        opened = np.zeros(len(services), dtype=bool)
+        opened[conceptions[firsts]] = True
+
+        def totals(service_index, calving_index, length):
+            columns = np.zeros((length, len(COLUMNS)), dtype=np.float64)
+            columns[:, SERVICES] = sum_by(service_index, length)
+            columns[:, CHECKED] = sum_by(service_index, length, checked)
+            columns[:, CONCEPTIONS] = sum_by(service_index, length, conceived)
+            columns[:, DAYS_OPEN] = sum_by(service_index, length, np.where(opened, days_open, 0))
+            columns[:, OPENED] = sum_by(service_index, length, opened)
+            if calving_index is not None:
+                columns[:, INTERVAL] = sum_by(calving_index, length, np.where(repeat, intervals, 0))
+                columns[:, INTERVALS] = sum_by(calving_index, length, repeat)
+                columns[:, AGE] = sum_by(calving_index, length,
+                                         np.where(first, calving_dates - births[calving_animals], 0))
+                columns[:, FIRST_CALVINGS] = sum_by(calving_index, length, first)
+            return columns
+
+        animal_totals = totals(service_animals, calving_animals, len(animal_ids))
+        sire_totals = totals(service_sires, None, len(sire_ids))
+
+        # groups add up the totals of their members
+        memberships = list(Animal.objects.filter(farm=farm, group_memberships__isnull=False)
+                           .values_list('group_memberships__group', 'id'))
+        group_ids, member_groups = np.unique(np.array([group_id for group_id, animal_id in memberships],
+                                                      dtype=np.int64), return_inverse=True)
+        group_totals = np.zeros((len(group_ids), len(COLUMNS)), dtype=np.float64)
+        if memberships:
+            members = positions([animal_id for group_id, animal_id in memberships])
+            np.add.at(group_totals, member_groups, animal_totals[members])
+
+        return cls(animal_ids, animal_totals, sire_ids, sire_totals, group_ids, group_totals)
+
+    @classmethod
+    def for_farm(cls, farm):
+        """
+        Returns the engine of the given farm, from the cache until its services, checks, calvings or animals change
+        """
+        key = CACHE_KEY % (farm.pk, get_generation(GENERATION_NAME, farm.pk))
+        engine = cache.get(key)
+        if engine is None:
+            engine = cls.build(farm)
+            cache.set(key, engine, CACHE_TIMEOUT)
+        return engine
+
+    def get_herd(self):
+        return get_kpis(self.animal_totals.sum(axis=0))
+
+    def get_animal(self, animal_id):
+        position = np.searchsorted(self.animal_ids, animal_id)
+        if position == len(self.animal_ids) or self.animal_ids[position] != animal_id:
+            return None
+        return get_kpis(self.animal_totals[position])
+
+    def get_animals(self):
+        """
+        Returns (animal id, KPIs) of every animal of the farm that was served or calved
+        """
+        active = np.flatnonzero(self.animal_totals[:, SERVICES] + self.animal_totals[:, INTERVALS] +
+                                self.animal_totals[:, FIRST_CALVINGS])
+        return [(int(self.animal_ids[index]), get_kpis(self.animal_totals[index])) for index in active]
+
+    def get_sires(self):
+        return [(int(sire_id), get_kpis(totals)) for sire_id, totals in zip(self.sire_ids, self.sire_totals)]
+
+    def get_groups(self):
+        return [(int(group_id), get_kpis(totals)) for group_id, totals in zip(self.group_ids, self.group_totals)]
@@ -6,41 +6,60 @@ from django_select2.widgets import AutoHeavySelect2Widget
 from django_select2.fields import AutoSelect2MultipleField, AutoModelSelect2Field, AutoModelSelect2TagField
 from django.utils.html import format_html
 from django.forms.utils import flatatt, force_text
-from .models import Animal, Color, Breed, Breeder, Sire, Dam
+from . import autocomplete
+from .models import Color, Breed, Breeder, Sire, Dam, get_farm_parents
 
 
-class MultipleAnimalsField(AutoSelect2MultipleField):
+class AutocompleteFieldMixin(object):
+    """
+    Answers the lookups of a Select2 field from an Autocomplete, a page at a time and only for the rows of the farm
+    making them
+    """
+    autocomplete = None
+
+    def security_check(self, request, *args, **kwargs):
+        return request.user.is_authenticated()
+
     def get_results(self, request, term, page, context):
-        # Fetch all by default
-        animals = Animal.objects.all()
+        try:
+            page = max(int(page), 1)
+        except (TypeError, ValueError):
+            page = 1
+        has_more, results = self.autocomplete.search(request.user, term, page)
+        return NO_ERR_RESP, has_more, results
+
+
+class MultipleAnimalsField(AutocompleteFieldMixin, AutoSelect2MultipleField):
+    autocomplete = autocomplete.animals
 
-        # If there's actually a term, filter on it
-        if term.strip() != '':
-            animals = animals.filter(name__icontains=term)
 
-        res = [(animal.id, animal.name) for animal in animals]
-        return (NO_ERR_RESP, False, res)  # Any error response, Has more results, options list
+class ParentFieldMixin(AutocompleteFieldMixin):
+    """
+    A sire or dam field, which should only accept the parents that its autocomplete offers the farm
+    """
+    def limit_to_farm(self, farm):
+        self.queryset = get_farm_parents(self.queryset.model, farm)
 
 
-class BullField(AutoModelSelect2Field):
+class BullField(ParentFieldMixin, AutoModelSelect2Field):
     queryset = Sire.objects.all()
-    search_fields = ['name__icontains']
+    autocomplete = autocomplete.sires
     to_field = 'name'
 
 
-class CowField(AutoModelSelect2Field):
+class CowField(ParentFieldMixin, AutoModelSelect2Field):
     queryset = Dam.objects.all()
-    search_fields = ['name__icontains']
+    autocomplete = autocomplete.dams
     to_field = 'name'
 
 
-class ColorField(AutoModelSelect2Field):
+class ColorField(AutocompleteFieldMixin, AutoModelSelect2Field):
     queryset = Color.objects
-    search_fields = ['name__icontains']
+    autocomplete = autocomplete.colors
     to_field = 'name'
 
 
-class BreederField(AutoModelSelect2Field):
+class BreederField(AutocompleteFieldMixin, AutoModelSelect2Field):
     queryset = Breeder.objects
-    search_fields = ['name__icontains']
+    autocomplete = autocomplete.breeders
     to_field = 'name'
@@ -3,7 +3,9 @@ from django.utils.safestring import mark_safe
 from bootstrap3_datetime.widgets import DateTimePicker
 from django_select2.fields import Select2ChoiceField
 from django_select2.widgets import AutoHeavySelect2Widget, Select2Widget, AutoHeavySelect2TagWidget, HeavySelect2TagWidget
-from .models import Animal, Service, PregnancyCheck, MilkProduction, Sire, Dam
+from phoenix.utils.reference_utils import ReferenceChoiceField
+from .models import (Animal, AnimalImport, Service, PregnancyCheck, MilkProduction, Sire, Dam, Breed, Breeder,
+                     LactationPeriod)
 from .fields import BullField, CowField, ColorField, BreederField
 
 
@@ -13,6 +15,7 @@ class AnimalForm(forms.ModelForm):
     sire = BullField(required=False, widget=AutoHeavySelect2Widget(select2_options={'minimumInputLength': 0, 'width': '40px'}),
                      attrs={'add_button':mark_safe('<button id="comment-button" class="btn btn-primary" type="button"><span class="glyphicon glyphicon-plus" aria-hidden="true"></span> Add Category</button>')})
     dam = CowField(required=False, widget=AutoHeavySelect2Widget(select2_options={'minimumInputLength': 0}), help_text='')
+    breed = ReferenceChoiceField(Breed, required=False)
     breeder = BreederField(required=False, widget=AutoHeavySelect2Widget(select2_options={'minimumInputLength': 0}))
     birth_date = forms.DateField(widget=DateTimePicker(options={'format': 'YYYY-MM-DD', 'pickTime': False}))
     weaning_date = forms.DateField(widget=DateTimePicker(options={'format': 'YYYY-MM-DD', 'pickTime': False}), required=False)
@@ -42,6 +45,8 @@ class ServiceForm(forms.ModelForm):
 
 
 class SireForm(forms.ModelForm):
+    breed = ReferenceChoiceField(Breed, required=False)
+    breeder = ReferenceChoiceField(Breeder, required=False)
     birth_date = forms.DateField(widget=DateTimePicker(options={'format': 'YYYY-MM-DD', 'pickTime': False}))
 
     class Meta:
@@ -50,6 +55,8 @@ class SireForm(forms.ModelForm):
 
 
 class DamForm(forms.ModelForm):
+    breed = ReferenceChoiceField(Breed, required=False)
+    breeder = ReferenceChoiceField(Breeder, required=False)
     birth_date = forms.DateField(widget=DateTimePicker(options={'format': 'YYYY-MM-DD', 'pickTime': False}))
 
     class Meta:
@@ -72,3 +79,72 @@ class MilkProductionForm(forms.ModelForm):
     class Meta:
         model = MilkProduction
         fields = ( 'animal', 'date', 'time', 'amount', 'butterfat',)
+
+
+class MilkingSessionForm(forms.Form):
+    date = forms.DateField(widget=DateTimePicker(options={'format': 'YYYY-MM-DD', 'pickTime': False}))
+    time = forms.ChoiceField(choices=MilkProduction.TIME_CHOICES)
+
+    def __init__(self, *args, **kwargs):
+        self.animals = kwargs.pop('animals')
+        super(MilkingSessionForm, self).__init__(*args, **kwargs)
+        for animal in self.animals:
+            self.fields['amount_%d' % animal.id] = forms.DecimalField(max_digits=5, decimal_places=2, min_value=0,
+                                                                      required=False)
+            self.fields['butterfat_%d' % animal.id] = forms.DecimalField(max_digits=5, decimal_places=3, min_value=0,
+                                                                         required=False)
+
+    def clean(self):
+        cleaned_data = super(MilkingSessionForm, self).clean()
+        for animal in self.animals:
+            amount, butterfat = cleaned_data.get('amount_%d' % animal.id), cleaned_data.get('butterfat_%d' % animal.id)
+            if amount is None and butterfat is not None:
+                self.add_error('amount_%d' % animal.id, 'Amount is required when butterfat is given')
+        return cleaned_data
+
+    def get_rows(self):
+        return [(animal, self['amount_%d' % animal.id], self['butterfat_%d' % animal.id]) for animal in self.animals]
+
+    def get_records(self):
+        """
+        Returns unsaved records for every animal that has an amount, animals left blank weren't milked
+        """
+        records = []
+        for animal in self.animals:
+            amount = self.cleaned_data.get('amount_%d' % animal.id)
+            if amount is not None:
+                records.append(MilkProduction(animal=animal, amount=amount,
+                                              butterfat=self.cleaned_data.get('butterfat_%d' % animal.id)))
+        return records
+
+
+class DryOffForm(forms.ModelForm):
+    end_date = forms.DateField(widget=DateTimePicker(options={'format': 'YYYY-MM-DD', 'pickTime': False}))
+
+    def clean_end_date(self):
+        end_date = self.cleaned_data['end_date']
+        if self.instance.end_date is not None:
+            raise forms.ValidationError('This lactation was already dried off on %s' % self.instance.end_date)
+        if end_date < self.instance.start_date:
+            raise forms.ValidationError("A cow can't be dried off before she calved on %s" % self.instance.start_date)
+        return end_date
+
+    class Meta:
+        model = LactationPeriod
+        fields = ('end_date',)
+
+
+class AnimalImportForm(forms.ModelForm):
+    file = forms.FileField(help_text='A CSV or XLSX file with a header row of ear_tag, name, sex, breed, color, sire, '
+                                     'dam, birth_date, birth_weight, weaning_date, weaning_weight, yearling_date, '
+                                     'yearling_weight')
+
+    def clean_file(self):
+        file = self.cleaned_data['file']
+        if not file.name.lower().endswith(('.csv', '.xlsx')):
+            raise forms.ValidationError('Only CSV and XLSX files can be imported')
+        return file
+
+    class Meta:
+        model = AnimalImport
+        fields = ('file',)
@@ -0,0 +1,243 @@
+import numpy as np
+from django.core.cache import cache
+from .models import Animal
+
+CACHE_KEY = 'inbreeding:%d'
+CACHE_TIMEOUT = 60 * 60 * 24
+
+# far more generations than any herd book, only reached when bad data makes an animal its own ancestor
+MAX_GENERATIONS = 200
+
+
+class InbreedingEngine(object):
+    """
+    Inbreeding coefficients of every animal of a farm, calculated in one pass over the pedigree in topological
+    order with the algorithm of Meuwissen and Luo (1992). Each animal only visits its own ancestors, so herds of
+    100k animals take seconds. Additive relationships between any two animals are traced the same way on demand.
+
+    Animals are numbered by their position in the topological order starting at 1, 0 standing for an unknown
+    parent, and the sires, dams, inbreeding and variances arrays are indexed by that position. Calves added after
+    the engine was built are appended at the end, after their parents, without calculating the others again.
+    """
+    def __init__(self, ids, sires, dams):
+        self.ids = np.concatenate(([0], np.asarray(ids, dtype=np.int64)))
+        self.sires = np.concatenate(([0], np.asarray(sires, dtype=np.int32)))
+        self.dams = np.concatenate(([0], np.asarray(dams, dtype=np.int32)))
+        self.index_positions()
+        self.calculate()
+
+    def __getstate__(self):
+        # the positions are rebuilt from the ids rather than cached
+        state = self.__dict__.copy()
+        del state['positions']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.index_positions()
+
+    def index_positions(self):
+        self.positions = dict((animal_id, position) for position, animal_id in enumerate(self.ids.tolist()) if position)
+
+    @classmethod
+    def from_parents(cls, parents):
+        """
+        Builds the engine from a dict of animal id to the ids of its sire and dam animals. Parents that aren't
+        keys of parents are taken as unknown.
+        """
+        ids = np.array(sorted(parents), dtype=np.int64)
+        index = dict((animal_id, position) for position, animal_id in enumerate(ids.tolist(), 1))
+        sires = np.array([0] + [index.get(parents[animal_id][0], 0) for animal_id in ids.tolist()], dtype=np.int32)
+        dams = np.array([0] + [index.get(parents[animal_id][1], 0) for animal_id in ids.tolist()], dtype=np.int32)
+
+        # an animal's generation is one more than its parents', each pass settles at least one more generation
+        generations = np.zeros(len(ids) + 1, dtype=np.int32)
+        for i in range(MAX_GENERATIONS):
+            updated = np.maximum(generations[sires], generations[dams]) + 1
+            updated[0] = 0
+            if np.array_equal(updated, generations):
+                break
+            generations = updated
+
+        # parents first, with full sibs next to each other so they can share a coefficient
+        order = np.lexsort((dams[1:], sires[1:], generations[1:])) + 1
+        renumbered = np.zeros(len(ids) + 1, dtype=np.int32)
+        renumbered[order] = np.arange(1, len(ids) + 1, dtype=np.int32)
+        return cls(ids[order - 1], renumbered[sires[order]], renumbered[dams[order]])
+
+    @classmethod
+    def build(cls, farm):
+        rows = Animal.objects.filter(farm=farm).values_list('id', 'sire__animal', 'dam__animal')
+        return cls.from_parents(dict((animal_id, (sire_id, dam_id)) for animal_id, sire_id, dam_id in rows))
+
+    @classmethod
+    def for_farm(cls, farm, animal_ids=()):
+        """
+        Returns the engine of the given farm, from the cache when possible. The animals added to the farm since the
+        cached engine was built are appended to it, it is only built again when it can't place them or is still
+        missing any of the given animals.
+        """
+        engine = cache.get(CACHE_KEY % farm.pk)
+        appended = engine.append_new(farm) if engine is not None else None
+        if appended is None or any(animal_id not in engine.positions for animal_id in animal_ids):
+            engine = cls.build(farm)
+        elif not appended:
+            return engine
+        cache.set(CACHE_KEY % farm.pk, engine, CACHE_TIMEOUT)
+        return engine
+
+    @classmethod
+    def invalidate(cls, farm_ids):
+        cache.delete_many([CACHE_KEY % farm_id for farm_id in set(farm_ids) if farm_id])
+
+    def calculate(self):
+        # plain lists are a lot quicker than numpy arrays for element by element access
+        sires, dams = self.sires.tolist(), self.dams.tolist()
+        inbreeding = [-1.0] * len(sires)
+        variances = [0.0] * len(sires)
+
+        # the ancestors of parents with more calves to come are kept rather than traced again for each calf
+        remaining = np.bincount(np.concatenate((self.sires, self.dams)), minlength=len(sires)).tolist()
+        traces = {}
+
+        def trace_parent(parent):
+            contributions = traces.pop(parent, None) or self.trace(parent, sires, dams)
+            remaining[parent] -= 1
+            if remaining[parent] > 0:
+                traces[parent] = contributions
+            return contributions
+
+        for i in range(1, len(sires)):
+            sire, dam = sires[i], dams[i]
+            variances[i] = 0.5 - 0.25 * (inbreeding[sire] + inbreeding[dam])
+            if not sire or not dam:
+                inbreeding[i] = 0.0
+                remaining[sire] -= 1
+                remaining[dam] -= 1
+            elif sire == sires[i - 1] and dam == dams[i - 1]:
+                inbreeding[i] = inbreeding[i - 1]
+                remaining[sire] -= 1
+                remaining[dam] -= 1
+            else:
+                # F is half the relationship between the parents, summed over the ancestors they share
+                firsts, seconds = trace_parent(sire), trace_parent(dam)
+                if len(firsts) > len(seconds):
+                    firsts, seconds = seconds, firsts
+                inbreeding[i] = 0.5 * sum(value * seconds[j] * variances[j]
+                                          for j, value in firsts.items() if j in seconds)
+
+        self.inbreeding = np.array(inbreeding)
+        self.variances = np.array(variances)
+
+    def append_new(self, farm):
+        """
+        Appends the animals of the farm newer than any in this engine, and returns how many there were. Returns None
+        if one has a parent of the farm that this engine doesn't have, when it has to be built again.
+        """
+        rows = list(Animal.objects.filter(farm=farm, id__gt=int(self.ids.max())).order_by('id')
+                                  .values_list('id', 'sire__animal', 'sire__animal__farm',
+                                               'dam__animal', 'dam__animal__farm'))
+        for animal_id, sire_id, sire_farm_id, dam_id, dam_farm_id in rows:
+            # parents of other farms aren't part of the pedigree, as when it is built
+            if (sire_farm_id == farm.pk and sire_id not in self.positions) or \
+                    (dam_farm_id == farm.pk and dam_id not in self.positions):
+                return None
+            self.append(animal_id, sire_id, dam_id)
+        return len(rows)
+
+    def append(self, animal_id, sire_id, dam_id):
+        position = len(self.ids)
+        sire, dam = self.positions.get(sire_id, 0), self.positions.get(dam_id, 0)
+        self.ids = np.append(self.ids, animal_id)
+        self.sires = np.append(self.sires, sire)
+        self.dams = np.append(self.dams, dam)
+        self.positions[animal_id] = position
+
+        variance = 0.5 - 0.25 * ((self.inbreeding[sire] if sire else -1.0) + (self.inbreeding[dam] if dam else -1.0))
+        self.variances = np.append(self.variances, variance)
+        self.inbreeding = np.append(self.inbreeding, 0.0)
+        if sire and dam:
+            self.inbreeding[position] = self.relationship_of(sire, dam) / 2
+
+    def trace(self, position, sires, dams):
+        """
+        Returns the contribution of each ancestor to the genes of the animal at position, including the animal
+        itself. Ancestors are visited youngest first so each has received everything from its descendants
+        before passing half of it on to its own parents.
+        """
+        ancestors = [position]
+        seen = set(ancestors)
+        for j in ancestors:
+            for parent in (sires[j], dams[j]):
+                # parents always come first, anything else is a loop in the data
+                if parent and parent < j and parent not in seen:
+                    seen.add(parent)
+                    ancestors.append(parent)
+        ancestors.sort(reverse=True)
+
+        contributions = dict.fromkeys(ancestors, 0.0)
+        contributions[position] = 1.0
+        for j in ancestors:
+            half = 0.5 * contributions[j]
+            sire, dam = sires[j], dams[j]
+            if sire and sire < j:
+                contributions[sire] += half
+            if dam and dam < j:
+                contributions[dam] += half
+        return contributions
+
+    def relationship_of(self, first, second, contributions=None):
+        if first == second:
+            return 1.0 + float(self.inbreeding[first])
+        return self.combine(contributions or self.trace(first, self.sires, self.dams),
+                            self.trace(second, self.sires, self.dams))
+
+    def combine(self, firsts, seconds):
+        """
+        Returns the additive relationship of two different animals from the contributions of their ancestors
+        """
+        if len(firsts) > len(seconds):
+            firsts, seconds = seconds, firsts
+        return float(sum(value * seconds[j] * self.variances[j] for j, value in firsts.items() if j in seconds))
+
+    def contributions(self, animal_id):
+        """
+        Returns the contributions of the ancestors of the given animal, for combine, or None if it isn't part of
+        this pedigree
+        """
+        position = self.positions.get(animal_id)
+        return self.trace(position, self.sires, self.dams) if position else None
+
+    def coefficient(self, animal_id):
+        """
+        Returns the inbreeding coefficient of the given animal, or None if it isn't part of this pedigree
+        """
+        position = self.positions.get(animal_id)
+        return float(self.inbreeding[position]) if position else None
+
+    def coefficients(self):
+        return dict(zip(self.ids[1:].tolist(), self.inbreeding[1:].tolist()))
+
+    def relationship(self, first_id, second_id):
+        """
+        Returns the additive relationship between two animals, or None if either isn't part of this pedigree
+        """
+        first, second = self.positions.get(first_id), self.positions.get(second_id)
+        if not first or not second:
+            return None
+        return self.relationship_of(first, second)
+
+    def relationships(self, animal_id, others):
+        """
+        Returns a dict of the additive relationship of the given animal with each of the others that is known
+        """
+        position = self.positions.get(animal_id)
+        if not position:
+            return {}
+        contributions = self.trace(position, self.sires, self.dams)
+        results = {}
+        for other_id in others:
+            other = self.positions.get(other_id)
+            if other:
+                results[other_id] = self.relationship_of(position, other, contributions)
+        return results
@@ -0,0 +1,197 @@
+import csv
+import datetime
+from django.db import transaction, DatabaseError
+from phoenix.groups.models import Group
+from phoenix.utils.autocomplete_utils import bump_autocomplete
+from phoenix.utils.cache_utils import bump_generations
+from .genetics import InbreedingEngine
+from .models import Animal, AnimalStats, Breed, Color, Sire, Dam, Pedigree, build_pedigree_links, get_search_text
+
+COLUMNS = ('ear_tag', 'name', 'sex', 'breed', 'color', 'sire', 'dam', 'birth_date', 'birth_weight',
+           'weaning_date', 'weaning_weight', 'yearling_date', 'yearling_weight')
+DATE_COLUMNS = ('birth_date', 'weaning_date', 'yearling_date')
+INTEGER_COLUMNS = ('birth_weight', 'weaning_weight', 'yearling_weight')
+
+
+def read_rows(file, filename):
+    """
+    Yields a dict for each row of an uploaded CSV or XLSX file, keyed by the lowercased headers of its first row
+    """
+    if filename.lower().endswith('.xlsx'):
+        from openpyxl import load_workbook
+        rows = load_workbook(file, read_only=True, data_only=True).active.iter_rows()
+        rows = ([cell.value for cell in row] for row in rows)
+    else:
+        rows = csv.reader(file)
+
+    headers = None
+    for row in rows:
+        if headers is None:
+            headers = [('%s' % header).strip().lower().replace(' ', '_') if header else '' for header in row]
+            continue
+        yield dict(zip(headers, row))
+
+
+class RowError(Exception):
+    pass
+
+
+class HerdImporter(object):
+    """
+    Imports animals for a farm in batches. Breeds, colors, sires and dams are resolved by name against
+    maps loaded once, animals are inserted with bulk_create and the dam records of females are created in the same
+    batch along with their pedigree, instead of through post_save signals per animal.
+    """
+    def __init__(self, farm, user, batch_size=1000):
+        self.farm = farm
+        self.user = user
+        self.batch_size = batch_size
+        self.batch = []
+        self.errors = []
+        self.rows = 0
+        self.created = 0
+
+        self.lookups = {}
+        for model in (Breed, Color, Sire, Dam):
+            names = model.objects.values_list('id', 'name')
+            self.lookups[model] = dict((name.strip().lower(), pk) for pk, name in names)
+        self.ear_tags = set(tag.lower() for tag in Animal.objects.filter(farm=farm).values_list('ear_tag', flat=True))
+
+    def run(self, rows, progress=None):
+        for row in rows:
+            self.rows += 1
+            try:
+                self.batch.append(self.build_animal(row))
+            except RowError as e:
+                # the header is row 1
+                self.errors.append((self.rows + 1, '%s' % e))
+
+            if len(self.batch) >= self.batch_size:
+                self.flush()
+                if progress:
+                    progress(self)
+
+        self.flush()
+        InbreedingEngine.invalidate([self.farm.pk])
+        # bulk_create sends no signals for the autocomplete indexes of the farm
+        bump_autocomplete('animals', [self.farm.pk])
+        bump_autocomplete('dams', [self.farm.pk, self.user.pk])
+        Group.update_farm(self.farm)
+        if progress:
+            progress(self)
+
+    def flush(self):
+        if not self.batch:
+            return
+
+        batch, self.batch = self.batch, []
+        herd = [animal for animal, names in batch]
+        created = []
+        try:
+            with transaction.atomic():
+                for animal, names in batch:
+                    self.resolve(animal, names, created)
+                Animal.objects.bulk_create(herd)
+
+                # bulk_create doesn't give us ids back, ear tags are unique within the farm so use them instead
+                animals = dict((animal.ear_tag, animal) for animal in herd)
+                ids = dict(Animal.objects.filter(farm=self.farm, ear_tag__in=animals.keys())
+                                         .values_list('ear_tag', 'id'))
+                Dam.objects.bulk_create([self.build_dam(animals[ear_tag], animal_id)
+                                         for ear_tag, animal_id in ids.items()
+                                         if animals[ear_tag].sex == Animal.SEX_CHOICES.female])
+                # mirrors the add_animal_stats signal, new animals have nothing to count yet
+                AnimalStats.objects.bulk_create([AnimalStats(animal_id=animal_id) for animal_id in ids.values()])
+                self.build_pedigree(ids.values())
+        except DatabaseError as e:
+            # the rows created for new names were rolled back with the batch
+            for model, key in created:
+                del self.lookups[model][key]
+            for animal in herd:
+                self.ear_tags.discard(animal.ear_tag.lower())
+            self.errors.append((None, 'Could not save animals %s to %s: %s' % (herd[0].ear_tag, herd[-1].ear_tag, e)))
+        else:
+            self.created += len(batch)
+
+    def build_pedigree(self, animal_ids):
+        # parents of imported animals are always existing animals, never others from the same batch
+        parents = Pedigree.get_parents(animal_ids)
+        known = Pedigree.get_links(set(parent_id for ids in parents.values() for parent_id in ids if parent_id))
+        Pedigree.create_links(build_pedigree_links(parents, known=known))
+        # the offspring lists of the parents
+        bump_generations('animal', [parent_id for ids in parents.values() for parent_id in ids])
+
+    def build_dam(self, animal, animal_id):
+        # mirrors the add_dam signal which bulk_create doesn't fire
+        return Dam(animal_id=animal_id, name=animal.name, breed_id=animal.breed_id, birth_date=animal.birth_date,
+                   created_by=self.user, modified_by=self.user)
+
+    def build_animal(self, row):
+        values = {}
+        for column in COLUMNS:
+            value = row.get(column)
+            if isinstance(value, str):
+                value = value.decode('utf-8')
+            if isinstance(value, basestring):
+                value = value.strip()
+            values[column] = value if value not in ('', None) else None
+
+        for column in ('ear_tag', 'name', 'sex'):
+            if not values[column]:
+                raise RowError('%s is required' % column.replace('_', ' ').capitalize())
+
+        ear_tag = '%s' % values['ear_tag']
+        if ear_tag.lower() in self.ear_tags:
+            raise RowError("An animal with ear tag '%s' already exists" % ear_tag)
+
+        sex = values['sex'].lower()
+        if sex not in (Animal.SEX_CHOICES.female, Animal.SEX_CHOICES.male):
+            raise RowError("Sex must be female or male, not '%s'" % values['sex'])
+
+        animal = Animal(ear_tag=ear_tag, name='%s' % values['name'], sex=sex, farm=self.farm, created_by=self.user,
+                        modified_by=self.user)
+        for column in DATE_COLUMNS:
+            setattr(animal, column, self.parse_date(column, values[column]))
+        for column in INTEGER_COLUMNS:
+            setattr(animal, column, self.parse_integer(column, values[column]))
+
+        animal.search_text = get_search_text(ear_tag, animal.name, values['breed'], values['sire'], values['dam'])
+
+        self.ear_tags.add(ear_tag.lower())
+        # the breed, color, sire and dam are resolved when the batch is saved, so new names roll back with it
+        return animal, dict((column, values[column]) for column in ('breed', 'color', 'sire', 'dam'))
+
+    def resolve(self, animal, names, created):
+        animal.breed_id = self.lookup(Breed, names['breed'], created)
+        animal.color_id = self.lookup(Color, names['color'], created)
+        animal.sire_id = self.lookup(Sire, names['sire'], created)
+        animal.dam_id = self.lookup(Dam, names['dam'], created)
+
+    def lookup(self, model, name, created):
+        """
+        Returns the id of the named row, creating it the first time a new name is seen
+        """
+        if not name:
+            return None
+        lookups = self.lookups[model]
+        key = ('%s' % name).lower()
+        if key not in lookups:
+            lookups[key] = model.objects.create(name=name, created_by=self.user, modified_by=self.user).id
+            created.append((model, key))
+        return lookups[key]
+
+    def parse_date(self, column, value):
+        if value is None or isinstance(value, datetime.date):
+            return value.date() if isinstance(value, datetime.datetime) else value
+        try:
+            return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise RowError("%s '%s' is not a YYYY-MM-DD date" % (column.replace('_', ' ').capitalize(), value))
+
+    def parse_integer(self, column, value):
+        if value is None:
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            raise RowError("%s '%s' is not a number" % (column.replace('_', ' ').capitalize(), value))
@@ -0,0 +1,134 @@
+import numpy as np
+from decimal import Decimal
+from phoenix.utils.model_utils import values_by_pk
+from .milk_series import get_series
+from .models import LactationPeriod
+
+# lactations fitted together, which bounds the memory a fit takes however many are stale
+BATCH_SIZE = 500
+
+# the days of yields a lactation needs before a curve of three parameters fitted to them means anything
+MIN_DAYS = 7
+
+# days in milk and the lactation they are of are packed into one key as lactation * KEY_SPAN + day
+KEY_SPAN = 100000
+
+# the largest yield the projected yield column holds
+MAX_YIELD = 10 ** 10
+
+FIELDS = ('curve_a', 'curve_b', 'curve_c', 'projected_yield', 'persistency')
+
+
+def fit_curves(index, days, yields, length):
+    """
+    Fits a Wood's curve, y = a * t ** b * e ** (-c * t), to the daily yields of each of length lactations, given as
+    flat arrays of the lactation index, day in milk from 1 and yield of every day. Taking logs makes it linear in ln
+    a, b and c, so the normal equations of every lactation are summed up with bincount and solved as one stack.
+    Returns arrays of a, b and c, NaN for lactations with too few days to fit.
+    """
+    positive = yields > 0
+    index, days, yields = index[positive], days[positive].astype(np.float64), yields[positive]
+    columns = [np.ones(len(days)), np.log(days), -days]
+    target = np.log(yields)
+
+    def sums(weights):
+        return np.bincount(index, weights=weights, minlength=max(length, 1))[:length]
+
+    normal = np.zeros((length, 3, 3))
+    right = np.zeros((length, 3))
+    for i in range(3):
+        right[:, i] = sums(columns[i] * target)
+        for j in range(i, 3):
+            normal[:, i, j] = normal[:, j, i] = sums(columns[i] * columns[j])
+
+    fitted = normal[:, 0, 0] >= MIN_DAYS
+    parameters = np.full((length, 3), np.nan)
+    if fitted.any():
+        parameters[fitted] = np.linalg.solve(normal[fitted], right[fitted])
+    return np.exp(parameters[:, 0]), parameters[:, 1], parameters[:, 2]
+
+
+def project(a, b, c, days=LactationPeriod.STANDARD_DAYS):
+    """
+    Returns the yield of each curve over the given number of days in milk, and its persistency as Wood defined it,
+    -(b + 1) ln c, which is only meaningful for curves that decline, NaN for the others
+    """
+    t = np.arange(1, days + 1, dtype=np.float64)
+    with np.errstate(invalid='ignore', over='ignore', divide='ignore'):
+        projected = (a[:, None] * t ** b[:, None] * np.exp(-c[:, None] * t)).sum(axis=1)
+        persistency = np.where(c > 0, -(b + 1) * np.log(c), np.nan)
+    return projected, persistency
+
+
+class LactationCurves(object):
+    """
+    Fits lactation curves to the milk records of the lactations of a farm, or of the given lactations, that had
+    records added, changed or removed since they were last fitted. Their daily yields are summed up from the milk
+    series of their cows and every lactation of a batch is fitted at once, then the curves, projected 305-day yields
+    and persistency are saved in a single update.
+    """
+    def __init__(self, farm=None, lactation_ids=None):
+        self.farm = farm
+        self.lactation_ids = lactation_ids
+
+    def get_stale(self):
+        lactations = LactationPeriod.objects.filter(curve_stale=True)
+        if self.farm is not None:
+            lactations = lactations.filter(animal__farm=self.farm)
+        if self.lactation_ids is not None:
+            lactations = lactations.filter(pk__in=self.lactation_ids)
+        return list(lactations.order_by('pk').values_list('pk', 'animal', 'start_date', 'end_date'))
+
+    def get_daily_yields(self, lactations):
+        """
+        Returns the lactation index, day in milk from 1 and yield of every day the given lactations had records,
+        summed up from the milk series of their cows
+        """
+        series = get_series([animal_id for lactation_id, animal_id, start_date, end_date in lactations])
+        keys, amounts = [np.zeros(0, dtype=np.int64)], [np.zeros(0)]
+        for position, (lactation_id, animal_id, start_date, end_date) in enumerate(lactations):
+            records = series[animal_id]
+            start = start_date.toordinal()
+            within = records['date'] >= start
+            if end_date:
+                within &= records['date'] <= end_date.toordinal()
+            keys.append(position * KEY_SPAN + records['date'][within].astype(np.int64) - start + 1)
+            amounts.append(records['amount'][within].astype(np.float64))
+
+        # the mornings and evenings of a day add up to its yield
+        days, inverse = np.unique(np.concatenate(keys), return_inverse=True)
+        return days // KEY_SPAN, days % KEY_SPAN, np.bincount(inverse, weights=np.concatenate(amounts))
+
+    def fit_batch(self, lactations):
+        ids = [lactation[0] for lactation in lactations]
+        # cleared before reading, so records that come in meanwhile leave it stale for the next run
+        LactationPeriod.objects.filter(pk__in=ids).update(curve_stale=False)
+
+        index, days, yields = self.get_daily_yields(lactations)
+        a, b, c = fit_curves(index, days, yields, len(ids))
+        projected, persistency = project(a, b, c)
+
+        def value(values, position, decimal=False):
+            # a curve that runs away outside the days it was fitted to projects nothing worth keeping
+            if not np.isfinite(values[position]) or (decimal and abs(values[position]) >= MAX_YIELD):
+                return None
+            return Decimal('%.2f' % values[position]) if decimal else float(values[position])
+
+        values = dict((name, {}) for name in FIELDS)
+        for position, lactation_id in enumerate(ids):
+            values['curve_a'][lactation_id] = value(a, position)
+            values['curve_b'][lactation_id] = value(b, position)
+            values['curve_c'][lactation_id] = value(c, position)
+            values['projected_yield'][lactation_id] = value(projected, position, decimal=True)
+            values['persistency'][lactation_id] = value(persistency, position)
+        LactationPeriod.objects.filter(pk__in=ids).update(**dict(
+            (name, values_by_pk(LactationPeriod, values[name], LactationPeriod._meta.get_field(name)))
+            for name in FIELDS))
+        return int(np.isfinite(a).sum())
+
+    def fit(self):
+        """
+        Fits every stale lactation, returning how many got a curve
+        """
+        lactations = self.get_stale()
+        return sum(self.fit_batch(lactations[i:i + BATCH_SIZE]) for i in range(0, len(lactations), BATCH_SIZE))
@@ -0,0 +1,137 @@
+import random
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from phoenix.animals.models import Animal, Breed, Sire, Dam, MilkProduction, Service, PregnancyCheck, get_search_text
+from phoenix.animals.search import search_animals
+from phoenix.records.models import AnimalDocument
+from phoenix.users.models import User
+
+# indexes created by animals 0010_hot_path_indexes, 0014_animal_search_text and records
+# 0004_animaldocument_active_index
+HOT_PATH_INDEXES = (
+    'animals_animal_farm_id_id',
+    'animals_milkproduction_animal_date_time',
+    'animals_service_animal_created_on',
+    'animals_pregnancycheck_animal_service_result',
+    'animals_animal_active_farm_state',
+    'animals_animal_name_trgm',
+    'animals_animal_ear_tag_trgm',
+    'animals_breed_name_trgm',
+    'animals_sire_name_trgm',
+    'animals_dam_name_trgm',
+    'animals_animal_search_vector',
+    'records_animaldocument_active_animal',
+)
+
+
+class Command(BaseCommand):
+    """
+    Dropping the indexes takes ACCESS EXCLUSIVE locks on the animal, milk, service, check and document tables that
+    are held until the transaction is rolled back, blocking every other reader and writer of them meanwhile. Only
+    run it against a development or staging copy of the database, never production.
+    """
+    help = ('Seeds a synthetic herd inside a transaction and prints the EXPLAIN ANALYZE plans of the hot queries '
+            'with and without the hot path indexes. Nothing is kept, the transaction is always rolled back. The '
+            'indexes are dropped inside it, locking the hot tables until then, so never run it on production.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--animals', type=int, default=100000, help='Number of animals in the herd')
+        parser.add_argument('--milkings', type=int, default=4, help='Milk records per female')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('The hot path indexes only exist on PostgreSQL')
+
+        with transaction.atomic():
+            farm, sample = self.seed(options['animals'], options['milkings'])
+            cursor = connection.cursor()
+            cursor.execute('ANALYZE')
+
+            queries = self.get_queries(farm, sample)
+            after = [(name, self.explain(cursor, queryset)) for name, queryset in queries]
+
+            savepoint = transaction.savepoint()
+            for index in HOT_PATH_INDEXES:
+                cursor.execute('DROP INDEX IF EXISTS %s' % index)
+            before = [(name, self.explain(cursor, queryset)) for name, queryset in queries]
+            transaction.savepoint_rollback(savepoint)
+
+            for (name, before_plan), (_, after_plan) in zip(before, after):
+                self.stdout.write('=' * 80)
+                self.stdout.write(name)
+                self.stdout.write('-- without indexes --')
+                self.stdout.write(before_plan)
+                self.stdout.write('-- with indexes --')
+                self.stdout.write(after_plan)
+
+            transaction.set_rollback(True)
+
+    def explain(self, cursor, queryset):
+        sql, params = queryset.query.sql_with_params()
+        cursor.execute('EXPLAIN ANALYZE ' + sql, params)
+        return '\n'.join(row[0] for row in cursor.fetchall())
+
+    def get_queries(self, farm, sample):
+        service = Service.objects.filter(animal=sample).first()
+        return (
+            ('Animal list for a farm', Animal.objects.filter(farm=farm).order_by('-id')[:25]),
+            ('Active lactating animals of a farm', Animal.objects.filter(farm=farm, is_active=True, state='lactating')),
+            ('Milk records of an animal for a milking',
+             MilkProduction.objects.filter(animal=sample, date=date.today(), time='am')),
+            ('Latest service of an animal', Service.objects.filter(animal=sample).order_by('-created_on')[:1]),
+            ('Pregnancy checks of a service',
+             PregnancyCheck.objects.filter(animal=sample, service=service, result='pregnant')),
+            ('Documents of an animal', AnimalDocument.objects.filter(animal=sample, deleted=False)),
+            ('Animal search', search_animals(Animal.objects.filter(farm=farm), 'animal 4217')[:25]),
+        )
+
+    def seed(self, number_of_animals, milkings):
+        rand = random.Random(42)
+        user = User.objects.create(username='explain-hot-queries')
+        audit = dict(created_by=user, modified_by=user)
+
+        Breed.objects.bulk_create([Breed(name='Breed %d' % i, **audit) for i in range(20)])
+        breeds = dict(Breed.objects.values_list('id', 'name'))
+        breed_ids = sorted(breeds)
+        Sire.objects.bulk_create([Sire(name='Sire %d' % i, breed_id=rand.choice(breed_ids), **audit)
+                                  for i in range(200)])
+        sires = dict(Sire.objects.values_list('id', 'name'))
+        sire_ids = sorted(sires)
+        Dam.objects.bulk_create([Dam(name='Dam %d' % i, breed_id=rand.choice(breed_ids), **audit)
+                                 for i in range(2000)])
+        dams = dict(Dam.objects.values_list('id', 'name'))
+        dam_ids = sorted(dams)
+
+        states = ('open', 'served', 'pregnant', 'lactating')
+
+        def make_animal(i):
+            breed_id, sire_id, dam_id = rand.choice(breed_ids), rand.choice(sire_ids), rand.choice(dam_ids)
+            ear_tag, name = 'T%06d' % i, 'Animal %d' % i
+            return Animal(ear_tag=ear_tag, name=name, farm=user, sex='female' if i % 2 else 'male',
+                          state=rand.choice(states), breed_id=breed_id, sire_id=sire_id, dam_id=dam_id,
+                          birth_date=date(2010, 1, 1) + timedelta(days=rand.randint(0, 2000)),
+                          search_text=get_search_text(ear_tag, name, breeds[breed_id], sires[sire_id], dams[dam_id]),
+                          **audit)
+
+        Animal.objects.bulk_create([make_animal(i) for i in range(number_of_animals)], batch_size=5000)
+        females = list(Animal.objects.filter(farm=user, sex='female').values_list('id', flat=True))
+
+        today = date.today()
+        MilkProduction.objects.bulk_create([
+            MilkProduction(animal_id=animal_id, date=today - timedelta(days=day // 2), time='am' if day % 2 else 'pm',
+                           amount=rand.randint(5, 30), **audit)
+            for animal_id in females for day in range(milkings)], batch_size=5000)
+        Service.objects.bulk_create([
+            Service(animal_id=animal_id, sire_id=rand.choice(sire_ids), date=today - timedelta(days=60), **audit)
+            for animal_id in females], batch_size=5000)
+        PregnancyCheck.objects.bulk_create([
+            PregnancyCheck(animal_id=animal_id, service_id=service_id, result=rand.choice(('pregnant', 'open')),
+                           check_method='palpation', date=today, **audit)
+            for animal_id, service_id in Service.objects.filter(animal__farm=user).values_list('animal', 'id')],
+            batch_size=5000)
+        AnimalDocument.objects.bulk_create([
+            AnimalDocument(animal_id=animal_id, file='documents/%d.pdf' % animal_id, deleted=bool(animal_id % 2))
+            for animal_id in females[::10]], batch_size=5000)
+
+        return user, Animal.objects.get(id=rand.choice(females))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from phoenix.animals.lactation_curves import LactationCurves
+from phoenix.animals.models import LactationPeriod
+
+
+class Command(BaseCommand):
+    help = 'Fits lactation curves to the lactations with new milk records since they were last fitted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--farm', type=int, help='Only fit the lactations of the farm with this id')
+        parser.add_argument('--all', action='store_true', help='Fit every lactation again, not only the stale ones')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            lactations = LactationPeriod.objects.all()
+            if options['farm']:
+                lactations = lactations.filter(animal__farm=options['farm'])
+            lactations.update(curve_stale=True)
+
+        count = LactationCurves(farm=options['farm']).fit()
+        self.stdout.write('Fitted %d lactation curves' % count)
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from phoenix.users.models import User
+from phoenix.animals.matings import MatingPlanner
+
+
+class Command(BaseCommand):
+    help = 'Ranks the sires for every open or served cow, for use when the cows are served'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--farm', type=int, help='Only plan the matings of the farm with this id')
+        parser.add_argument('--processes', type=int,
+                            help='Number of processes to rank cows in, defaults to one per CPU')
+
+    def handle(self, *args, **options):
+        farms = User.objects.filter(animal__isnull=False).distinct()
+        if options['farm']:
+            farms = farms.filter(pk=options['farm'])
+
+        for farm in farms:
+            count = MatingPlanner(farm, processes=options['processes']).run()
+            self.stdout.write('Ranked sires for %d cows of %s' % (count, farm))
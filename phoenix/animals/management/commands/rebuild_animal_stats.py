@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from phoenix.animals.models import AnimalStats
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the reproductive statistics of every animal from its services and pregnancy checks'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = AnimalStats.rebuild()
+        self.stdout.write('Rebuilt statistics for %d animals' % count)
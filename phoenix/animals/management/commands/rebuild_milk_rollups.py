@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from phoenix.animals.models import MilkProduction, MilkStats
+
+
+class Command(BaseCommand):
+    help = ('Rebuilds the daily, weekly, monthly and all-time milk production rollups, lactation yields and yield '
+            'statistics from scratch')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            MilkProduction.rebuild_rollups()
+            MilkStats.rebuild()
+        self.stdout.write('Rebuilt milk production rollups, lactation yields and yield statistics')
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from phoenix.animals.models import Pedigree
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the pedigree closure table from the sires and dams of every animal'
+
+    def handle(self, *args, **options):
+        count = Pedigree.rebuild()
+        self.stdout.write('Rebuilt the pedigree of %d animals' % count)
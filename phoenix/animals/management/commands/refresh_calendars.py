@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from phoenix.users.models import User
+from phoenix.animals.reproduction import ReproductiveCalendar
+
+
+class Command(BaseCommand):
+    help = 'Works out the heats, pregnancy checks, dry offs and calvings due for every cow'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--farm', type=int, help='Only refresh the calendar of the farm with this id')
+
+    def handle(self, *args, **options):
+        farms = User.objects.filter(animal__isnull=False).distinct()
+        if options['farm']:
+            farms = farms.filter(pk=options['farm'])
+
+        for farm in farms:
+            count = ReproductiveCalendar(farm).refresh()
+            self.stdout.write('%d events due for %s' % (count, farm))
@@ -0,0 +1,109 @@
+from billiard import Pool
+from django.db import connection, connections, transaction
+from django.db.models import Count
+from .genetics import InbreedingEngine
+from .models import Animal, Sire, PregnancyCheck, MatingRecommendation, get_farm_parents
+
+# the inbreeding of a calf from a half sib mating, anything above it is only recommended as a last resort
+INBREEDING_LIMIT = 0.0625
+RECOMMENDATIONS = 10
+CHUNK_SIZE = 100
+
+# set in each worker process by setup_worker
+worker_state = {}
+
+
+def get_conception_rates(sire_ids):
+    """
+    Returns the share of checked services of each sire that resulted in a pregnancy, smoothed towards one half so
+    that a sire with a single lucky service doesn't outrank proven ones
+    """
+    checked = dict((sire_id, 0) for sire_id in sire_ids)
+    successful = dict((sire_id, 0) for sire_id in sire_ids)
+    rows = PregnancyCheck.objects.filter(service__sire__in=sire_ids).values('service__sire', 'result')\
+                                 .annotate(count=Count('id'))
+    for row in rows:
+        if row['result'] == PregnancyCheck.RESULT_CHOICES.pregnant:
+            successful[row['service__sire']] += row['count']
+        checked[row['service__sire']] += row['count']
+    return dict((sire_id, (successful[sire_id] + 1.0) / (checked[sire_id] + 2.0)) for sire_id in sire_ids)
+
+
+def setup_worker(engine, sires, conception_rates):
+    worker_state['engine'] = engine
+    worker_state['conception_rates'] = conception_rates
+    # sires are shared by every cow so their ancestors are traced once per worker
+    worker_state['sires'] = [(sire_id, engine.contributions(animal_id) if animal_id else None)
+                             for sire_id, animal_id in sires]
+
+
+def rank_cows(cow_ids):
+    """
+    Returns the best sires for each of the given cows as (cow id, [(sire id, expected inbreeding, conception rate)])
+    """
+    engine, conception_rates = worker_state['engine'], worker_state['conception_rates']
+    results = []
+    for cow_id in cow_ids:
+        cow = engine.contributions(cow_id)
+        candidates = []
+        for sire_id, sire in worker_state['sires']:
+            # the calf's inbreeding is half the relationship of its parents, unrelated if either is unknown
+            inbreeding = engine.combine(cow, sire) / 2 if cow and sire else 0.0
+            candidates.append((inbreeding > INBREEDING_LIMIT, -conception_rates[sire_id], inbreeding, sire_id))
+        candidates.sort()
+        results.append((cow_id, [(sire_id, inbreeding, -rate) for over, rate, inbreeding, sire_id
+                                 in candidates[:RECOMMENDATIONS]]))
+    return results
+
+
+class MatingPlanner(object):
+    """
+    Ranks the sires for every open or served cow of a farm by the expected inbreeding of their calves and their
+    conception rate. Cows are ranked in chunks across a pool of processes and the results replace the farm's
+    previous recommendations.
+    """
+    def __init__(self, farm, processes=None, chunk_size=CHUNK_SIZE):
+        self.farm = farm
+        self.processes = processes
+        self.chunk_size = chunk_size
+
+    def get_cows(self):
+        cows = Animal.objects.filter(farm=self.farm, is_active=True, sex=Animal.SEX_CHOICES.female,
+                                     state__in=('open', 'served'))
+        return list(cows.values_list('id', flat=True))
+
+    def get_sires(self):
+        # only the sires the farm can pick when serving a cow
+        return list(get_farm_parents(Sire, self.farm).filter(is_active=True).values_list('id', 'animal'))
+
+    def rank(self, cows, sires, conception_rates):
+        engine = InbreedingEngine.for_farm(self.farm)
+        chunks = [cows[i:i + self.chunk_size] for i in range(0, len(cows), self.chunk_size)]
+
+        # closing the connection for the workers would also end a transaction we are in
+        if self.processes == 1 or len(chunks) < 2 or connection.in_atomic_block:
+            setup_worker(engine, sires, conception_rates)
+            return [result for chunk in chunks for result in rank_cows(chunk)]
+
+        # forked workers mustn't share our database connections
+        connections.close_all()
+        pool = Pool(self.processes, initializer=setup_worker, initargs=(engine, sires, conception_rates))
+        try:
+            return [result for results in pool.map(rank_cows, chunks) for result in results]
+        finally:
+            pool.close()
+            pool.join()
+
+    def run(self):
+        cows, sires = self.get_cows(), self.get_sires()
+        conception_rates = get_conception_rates([sire_id for sire_id, animal_id in sires])
+        results = self.rank(cows, sires, conception_rates) if sires else []
+
+        with transaction.atomic():
+            MatingRecommendation.objects.filter(animal__farm=self.farm).delete()
+            MatingRecommendation.objects.bulk_create([
+                MatingRecommendation(animal_id=cow_id, sire_id=sire_id, rank=rank, expected_inbreeding=inbreeding,
+                                     conception_rate=conception_rate)
+                for cow_id, candidates in results
+                for rank, (sire_id, inbreeding, conception_rate) in enumerate(candidates, 1)], batch_size=1000)
+        return len(results)
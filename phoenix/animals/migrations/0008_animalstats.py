@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('animals', '0007_remove_sire_animal'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnimalStats',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('date_of_first_service', models.DateField(null=True, blank=True)),
+                ('number_of_services', models.PositiveIntegerField(default=0)),
+                ('number_of_successful_services', models.PositiveIntegerField(default=0)),
+                ('number_of_failed_services', models.PositiveIntegerField(default=0)),
+                ('animal', models.OneToOneField(related_name='stats', to='animals.Animal')),
+            ],
+        ),
+    ]
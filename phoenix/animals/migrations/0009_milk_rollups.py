@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('animals', '0008_animalstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnimalMilkRollup',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('period', models.CharField(max_length=10, choices=[(b'day', 'Daily'), (b'week', 'Weekly'), (b'month', 'Monthly'), (b'all', 'All time')])),
+                ('start_date', models.DateField()),
+                ('amount', models.DecimalField(default=0, max_digits=12, decimal_places=2)),
+                ('butterfat', models.DecimalField(default=0, max_digits=12, decimal_places=3)),
+                ('butterfat_count', models.IntegerField(default=0)),
+                ('count', models.IntegerField(default=0)),
+                ('animal', models.ForeignKey(related_name='milk_rollups', to='animals.Animal')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FarmMilkRollup',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('period', models.CharField(max_length=10, choices=[(b'day', 'Daily'), (b'week', 'Weekly'), (b'month', 'Monthly'), (b'all', 'All time')])),
+                ('start_date', models.DateField()),
+                ('amount', models.DecimalField(default=0, max_digits=12, decimal_places=2)),
+                ('butterfat', models.DecimalField(default=0, max_digits=12, decimal_places=3)),
+                ('butterfat_count', models.IntegerField(default=0)),
+                ('count', models.IntegerField(default=0)),
+                ('farm', models.ForeignKey(related_name='milk_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='farmmilkrollup',
+            unique_together=set([('farm', 'period', 'start_date')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='animalmilkrollup',
+            unique_together=set([('animal', 'period', 'start_date')]),
+        ),
+    ]
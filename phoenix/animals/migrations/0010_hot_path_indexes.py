@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Indexes for the most common access paths. These are PostgreSQL specific (partial and pg_trgm indexes)
+    so they are created with raw SQL rather than declared on the models.
+    """
+
+    dependencies = [
+        ('animals', '0009_milk_rollups'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+            migrations.RunSQL.noop,
+        ),
+
+        # composite indexes
+        migrations.RunSQL(
+            'CREATE INDEX animals_animal_farm_id_id ON animals_animal (farm_id, id)',
+            'DROP INDEX animals_animal_farm_id_id',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX animals_milkproduction_animal_date_time ON animals_milkproduction (animal_id, date, time)',
+            'DROP INDEX animals_milkproduction_animal_date_time',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX animals_service_animal_created_on ON animals_service (animal_id, created_on)',
+            'DROP INDEX animals_service_animal_created_on',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX animals_pregnancycheck_animal_service_result '
+            'ON animals_pregnancycheck (animal_id, service_id, result)',
+            'DROP INDEX animals_pregnancycheck_animal_service_result',
+        ),
+
+        # partial indexes
+        migrations.RunSQL(
+            'CREATE INDEX animals_animal_active_farm_state ON animals_animal (farm_id, state) WHERE is_active',
+            'DROP INDEX animals_animal_active_farm_state',
+        ),
+
+        # trigram indexes for the icontains searches, Django compares UPPER(column::text)
+        migrations.RunSQL(
+            'CREATE INDEX animals_animal_name_trgm ON animals_animal USING gin (UPPER(name::text) gin_trgm_ops)',
+            'DROP INDEX animals_animal_name_trgm',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX animals_animal_ear_tag_trgm ON animals_animal USING gin (UPPER(ear_tag::text) gin_trgm_ops)',
+            'DROP INDEX animals_animal_ear_tag_trgm',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX animals_breed_name_trgm ON animals_breed USING gin (UPPER(name::text) gin_trgm_ops)',
+            'DROP INDEX animals_breed_name_trgm',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX animals_sire_name_trgm ON animals_sire USING gin (UPPER(name::text) gin_trgm_ops)',
+            'DROP INDEX animals_sire_name_trgm',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX animals_dam_name_trgm ON animals_dam USING gin (UPPER(name::text) gin_trgm_ops)',
+            'DROP INDEX animals_dam_name_trgm',
+        ),
+    ]
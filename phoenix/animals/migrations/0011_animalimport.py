@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('animals', '0010_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnimalImport',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('is_active', models.BooleanField(default=True, help_text=b'Whether this item is active, use this instead of deleting')),
+                ('created_on', models.DateTimeField(help_text=b'When this item was originally created', auto_now_add=True)),
+                ('modified_on', models.DateTimeField(help_text=b'When this item was last modified', auto_now=True)),
+                ('file', models.FileField(upload_to=b'imports')),
+                ('status', models.CharField(default=b'pending', max_length=20, choices=[(b'pending', 'Pending'), (b'processing', 'Processing'), (b'complete', 'Complete'), (b'failed', 'Failed')])),
+                ('rows_processed', models.PositiveIntegerField(default=0)),
+                ('animals_created', models.PositiveIntegerField(default=0)),
+                ('errors', models.TextField(blank=True)),
+                ('task_id', models.CharField(max_length=50, blank=True)),
+                ('created_by', models.ForeignKey(related_name='animals_animalimport_creations', to=settings.AUTH_USER_MODEL, help_text=b'The user which originally created this item')),
+                ('farm', models.ForeignKey(related_name='animal_imports', to=settings.AUTH_USER_MODEL)),
+                ('modified_by', models.ForeignKey(related_name='animals_animalimport_modifications', to=settings.AUTH_USER_MODEL, help_text=b'The user which last modified this item')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
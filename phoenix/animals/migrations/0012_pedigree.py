@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def build_pedigree_links(parents):
+    # a copy of phoenix.animals.models.build_pedigree_links as it was when this migration was written
+    links = {}
+
+    def resolve(animal_id, visiting):
+        if animal_id in links:
+            return links[animal_id]
+
+        result = set([(animal_id, 0)])
+        visiting.add(animal_id)
+        for parent_id in parents.get(animal_id, ()):
+            # ignore unknown parents and bad data where an animal is its own ancestor
+            if parent_id is None or parent_id in visiting:
+                continue
+            for ancestor_id, depth in resolve(parent_id, visiting):
+                result.add((ancestor_id, depth + 1))
+        visiting.discard(animal_id)
+
+        links[animal_id] = result
+        return result
+
+    return dict((animal_id, resolve(animal_id, set())) for animal_id in parents)
+
+
+def build_pedigree(apps, schema_editor):
+    Animal = apps.get_model('animals', 'Animal')
+    Pedigree = apps.get_model('animals', 'Pedigree')
+
+    parents = dict((animal_id, (sire_id, dam_id)) for animal_id, sire_id, dam_id
+                   in Animal.objects.values_list('id', 'sire__animal', 'dam__animal'))
+    links = build_pedigree_links(parents)
+    Pedigree.objects.bulk_create([Pedigree(ancestor_id=ancestor_id, descendant_id=animal_id, depth=depth)
+                                  for animal_id, ancestors in links.items() for ancestor_id, depth in ancestors],
+                                 batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('animals', '0011_animalimport'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Pedigree',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('depth', models.PositiveSmallIntegerField()),
+                ('ancestor', models.ForeignKey(related_name='descendant_links', to='animals.Animal')),
+                ('descendant', models.ForeignKey(related_name='ancestor_links', to='animals.Animal')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='sire',
+            name='animal',
+            field=models.ForeignKey(related_name='sire_animal', blank=True, to='animals.Animal', null=True),
+        ),
+        migrations.AlterUniqueTogether(
+            name='pedigree',
+            unique_together=set([('ancestor', 'descendant', 'depth')]),
+        ),
+        migrations.RunPython(build_pedigree, migrations.RunPython.noop),
+    ]
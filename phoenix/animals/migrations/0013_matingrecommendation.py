@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('animals', '0012_pedigree'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MatingRecommendation',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('expected_inbreeding', models.FloatField()),
+                ('conception_rate', models.FloatField()),
+                ('created_on', models.DateTimeField(default=django.utils.timezone.now)),
+                ('animal', models.ForeignKey(related_name='mating_recommendations', to='animals.Animal')),
+                ('sire', models.ForeignKey(related_name='mating_recommendations', to='animals.Sire')),
+            ],
+            options={
+                'ordering': ('animal', 'rank'),
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='matingrecommendation',
+            unique_together=set([('animal', 'rank')]),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def build_search_text(apps, schema_editor):
+    Animal = apps.get_model('animals', 'Animal')
+
+    for animal in Animal.objects.select_related('breed', 'sire', 'dam').iterator():
+        values = (animal.ear_tag, animal.name, animal.breed.name if animal.breed_id else None,
+                  animal.sire.name if animal.sire_id else None, animal.dam.name if animal.dam_id else None)
+        search_text = ' '.join(('%s' % value).strip().lower() for value in values if value)
+        Animal.objects.filter(pk=animal.pk).update(search_text=search_text)
+
+
+class Migration(migrations.Migration):
+    """
+    The search text of animals, with a full text index for prefix matches on its words. Ear tags and names already
+    have the trigram indexes the typo tolerant matches use.
+    """
+
+    dependencies = [
+        ('animals', '0013_matingrecommendation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='animal',
+            name='search_text',
+            field=models.TextField(default='', editable=False),
+        ),
+        migrations.RunPython(build_search_text, migrations.RunPython.noop),
+        migrations.RunSQL(
+            "CREATE INDEX animals_animal_search_vector ON animals_animal USING gin (to_tsvector('simple', search_text))",
+            'DROP INDEX animals_animal_search_vector',
+        ),
+    ]
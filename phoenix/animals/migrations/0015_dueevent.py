@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('animals', '0014_animal_search_text'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DueEvent',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('event', models.CharField(max_length=20, choices=[(b'heat', 'Heat'), (b'pregnancy_check', 'Pregnancy Check'), (b'dry_off', 'Dry Off'), (b'calving', 'Calving')])),
+                ('date', models.DateField()),
+                ('animal', models.ForeignKey(related_name='due_events', to='animals.Animal')),
+                ('farm', models.ForeignKey(related_name='due_events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ('date', 'animal'),
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='dueevent',
+            unique_together=set([('animal', 'event')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='dueevent',
+            index_together=set([('farm', 'date')]),
+        ),
+    ]
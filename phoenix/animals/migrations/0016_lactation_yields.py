@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('animals', '0015_dueevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lactationperiod',
+            name='butterfat',
+            field=models.DecimalField(default=0, max_digits=12, decimal_places=3),
+        ),
+        migrations.AddField(
+            model_name='lactationperiod',
+            name='butterfat_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='lactationperiod',
+            name='count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='lactationperiod',
+            name='peak_yield',
+            field=models.DecimalField(default=0, max_digits=12, decimal_places=2),
+        ),
+        migrations.AddField(
+            model_name='lactationperiod',
+            name='standard_yield',
+            field=models.DecimalField(default=0, max_digits=12, decimal_places=2),
+        ),
+        migrations.AddField(
+            model_name='lactationperiod',
+            name='total_yield',
+            field=models.DecimalField(default=0, max_digits=12, decimal_places=2),
+        ),
+        migrations.AddField(
+            model_name='milkproduction',
+            name='lactation',
+            field=models.ForeignKey(related_name='milk_records', on_delete=django.db.models.deletion.SET_NULL, blank=True, editable=False, to='animals.LactationPeriod', null=True),
+        ),
+    ]
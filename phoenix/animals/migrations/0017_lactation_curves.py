@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('animals', '0016_lactation_yields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lactationperiod',
+            name='curve_a',
+            field=models.FloatField(null=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='lactationperiod',
+            name='curve_b',
+            field=models.FloatField(null=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='lactationperiod',
+            name='curve_c',
+            field=models.FloatField(null=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='lactationperiod',
+            name='curve_stale',
+            field=models.BooleanField(default=False, db_index=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='lactationperiod',
+            name='persistency',
+            field=models.FloatField(null=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='lactationperiod',
+            name='projected_yield',
+            field=models.DecimalField(null=True, editable=False, max_digits=12, decimal_places=2),
+        ),
+    ]
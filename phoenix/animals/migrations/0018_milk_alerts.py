@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('animals', '0017_lactation_curves'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MilkAlert',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('date', models.DateField()),
+                ('time', models.CharField(max_length=10, choices=[(b'am', 'Morning'), (b'pm', 'Evening')])),
+                ('amount', models.DecimalField(max_digits=5, decimal_places=2)),
+                ('expected', models.FloatField()),
+                ('z_score', models.FloatField()),
+                ('created_on', models.DateTimeField(default=django.utils.timezone.now)),
+                ('animal', models.ForeignKey(related_name='milk_alerts', to='animals.Animal')),
+                ('farm', models.ForeignKey(related_name='milk_alerts', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ('-date', '-id'),
+            },
+        ),
+        migrations.CreateModel(
+            name='MilkStats',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('time', models.CharField(max_length=10, choices=[(b'am', 'Morning'), (b'pm', 'Evening')])),
+                ('count', models.IntegerField(default=0)),
+                ('mean', models.FloatField(default=0)),
+                ('m2', models.FloatField(default=0)),
+                ('ewma', models.FloatField(null=True)),
+                ('animal', models.ForeignKey(related_name='milk_stats', to='animals.Animal')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='milkstats',
+            unique_together=set([('animal', 'time')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='milkalert',
+            index_together=set([('farm', 'date')]),
+        ),
+    ]
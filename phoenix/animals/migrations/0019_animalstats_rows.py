@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def add_stats(apps, schema_editor):
+    # animals get their statistics when they are created now, rather than when they are first shown
+    Animal = apps.get_model('animals', 'Animal')
+    AnimalStats = apps.get_model('animals', 'AnimalStats')
+    Service = apps.get_model('animals', 'Service')
+    PregnancyCheck = apps.get_model('animals', 'PregnancyCheck')
+
+    stats = dict((animal_id, AnimalStats(animal_id=animal_id))
+                 for animal_id in Animal.objects.filter(stats=None).values_list('id', flat=True))
+
+    services = Service.objects.values('animal').annotate(count=Count('id'), first=Min('date'))
+    for row in services:
+        if row['animal'] in stats:
+            stats[row['animal']].number_of_services = row['count']
+            stats[row['animal']].date_of_first_service = row['first']
+
+    checks = PregnancyCheck.objects.exclude(service=None).values('animal', 'result').annotate(count=Count('id'))
+    for row in checks:
+        if row['animal'] not in stats:
+            continue
+        if row['result'] == 'pregnant':
+            stats[row['animal']].number_of_successful_services = row['count']
+        elif row['result'] == 'open':
+            stats[row['animal']].number_of_failed_services = row['count']
+
+    AnimalStats.objects.bulk_create(stats.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('animals', '0018_milk_alerts'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+import numpy as np
+from collections import defaultdict
+from .models import MilkProduction
+
+# animals loaded from the database in one query
+LOAD_BATCH_SIZE = 500
+
+# a record packs into 13 bytes, where a model instance with its Decimals takes well over a kilobyte. Dates are day
+# ordinals, times the position in TIMES and missing butterfat is NaN.
+RECORD_DTYPE = np.dtype([('date', '<i4'), ('time', 'u1'), ('amount', '<f4'), ('butterfat', '<f4')])
+TIMES = (MilkProduction.TIME_CHOICES.am, MilkProduction.TIME_CHOICES.pm)
+
+
+def pack_records(rows):
+    """
+    Returns the given (date, time, amount, butterfat) as a series, ordered by date and time
+    """
+    series = np.zeros(len(rows), dtype=RECORD_DTYPE)
+    if rows:
+        series['date'] = [date.toordinal() for date, time, amount, butterfat in rows]
+        series['time'] = [TIMES.index(time) for date, time, amount, butterfat in rows]
+        series['amount'] = [float(amount) for date, time, amount, butterfat in rows]
+        series['butterfat'] = [float(butterfat) if butterfat not in (None, '') else np.nan
+                               for date, time, amount, butterfat in rows]
+    return sort_series(series)
+
+
+def sort_series(series):
+    return series[np.argsort(series['date'].astype(np.int64) * len(TIMES) + series['time'], kind='mergesort')]
+
+
+def get_series(animal_ids):
+    """
+    Returns the milk records of each of the given animals as a series of RECORD_DTYPE ordered by date and time,
+    read as values in batches of animals rather than as model instances
+    """
+    rows = defaultdict(list)
+    animal_ids = list(set(animal_ids))
+    for i in range(0, len(animal_ids), LOAD_BATCH_SIZE):
+        records = MilkProduction.objects.filter(animal__in=animal_ids[i:i + LOAD_BATCH_SIZE]).order_by()\
+            .values_list('animal', 'date', 'time', 'amount', 'butterfat')
+        for record in records.iterator():
+            rows[record[0]].append(record[1:])
+    return dict((animal_id, pack_records(rows[animal_id])) for animal_id in animal_ids)
@@ -1,17 +1,46 @@
-from django.db import models
-from django.db.models import Sum
+import datetime
+import math
+import threading
+from collections import defaultdict
+from decimal import Decimal
+from django.conf import settings
+from django.db import models, transaction, IntegrityError
+from django.db.models import Count, Max, Min, F, Q, Sum
 from django.utils.translation import ugettext as _
-from django.db.models.signals import post_save
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, post_init
 from django.dispatch import receiver
+from django.utils import timezone
 from smartmin.models import SmartModel
 from model_utils import Choices
 from model_utils.models import TimeStampedModel
 from django_fsm import FSMField, transition
+from phoenix.utils.datetime_utils import week_range
+from phoenix.utils.autocomplete_utils import bump_autocomplete
+from phoenix.utils.cache_utils import bump_generations
+from phoenix.utils.model_utils import TrackedFieldsMixin, remember_tracked_fields, values_by_pk
+from phoenix.utils.reference_utils import register
 
 
-class Breed(SmartModel):
+def get_search_text(*values):
+    """
+    Returns the text an animal is searched by, from its ear tag, its name and the names of its breed, sire and dam
+    """
+    return ' '.join((u'%s' % value).strip().lower() for value in values if value)
+
+
+def get_farm_parents(model, farm):
+    """
+    Returns the sires or dams of a farm, those it added or whose animal it owns
+    """
+    return model.objects.filter(Q(created_by=farm) | Q(animal__farm=farm)).distinct()
+
+
+class Breed(TrackedFieldsMixin, SmartModel):
     name = models.CharField(max_length=30)
 
+    # the names of breeds, sires and dams are part of the search text of their animals
+    TRACKED_FIELDS = ('name',)
+
     def __unicode__(self):
         return self.name
 
@@ -31,18 +60,28 @@ class Breeder(SmartModel):
         return self.name
 
 
-class Sire(SmartModel):
+# few rows read on nearly every page, so each process holds them rather than joining or querying for them
+register(Breed)
+register(Color)
+register(Breeder)
+
+
+class Sire(TrackedFieldsMixin, SmartModel):
     name = models.CharField(max_length=30, blank=False)
     code = models.CharField(max_length=10, blank=True)
     breed = models.ForeignKey(Breed, null=True, blank=True)
     birth_date = models.DateField(null=True, blank=True)
     breeder = models.ForeignKey(Breeder, null=True, blank=True, related_name='sire_breeder')
+    animal = models.ForeignKey('animals.Animal', null=True, blank=True, related_name='sire_animal')
+
+    # the animal it is linked to places it in the pedigree of its offspring
+    TRACKED_FIELDS = ('name', 'animal_id')
 
     def __unicode__(self):
         return self.name
 
 
-class Dam(SmartModel):
+class Dam(TrackedFieldsMixin, SmartModel):
     name = models.CharField(max_length=30)
     breed = models.ForeignKey(Breed, null=True, blank=True)
     code = models.CharField(max_length=10, blank=True)
@@ -50,11 +89,13 @@ class Dam(SmartModel):
     animal = models.ForeignKey('animals.Animal', null=True, blank=True, related_name='dam_animal')
     breeder = models.ForeignKey(Breeder, null=True, blank=True, related_name='dam_breeder')
 
+    TRACKED_FIELDS = ('name', 'animal_id')
+
     def __unicode__(self):
         return self.name
 
 
-class Animal(SmartModel):
+class Animal(TrackedFieldsMixin, SmartModel):
 
     state = FSMField(default='open')
 
@@ -101,32 +142,81 @@ class Animal(SmartModel):
     yearling_weight = models.IntegerField(null=True, blank=True)
     farm = models.ForeignKey('users.User', null=True, blank=True)
 
+    # kept in line with the fields it is built from on save, see search.py
+    search_text = models.TextField(default='', editable=False)
+
+    # fields whose changes are picked up by the post_save signals that maintain the pedigree, groups and autocomplete
+    TRACKED_FIELDS = ('sex', 'breed_id', 'birth_date', 'sire_id', 'dam_id', 'farm_id', 'ear_tag', 'name')
+
+    SEARCH_FIELDS = ('ear_tag', 'name', 'breed', 'sire', 'dam')
+
     def __unicode__(self):
         return '%s-%s' % (self.ear_tag, self.name)
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or set(update_fields) & set(self.SEARCH_FIELDS):
+            self.search_text = self.get_search_text()
+            if update_fields is not None:
+                kwargs['update_fields'] = list(update_fields) + ['search_text']
+        super(Animal, self).save(*args, **kwargs)
+
+    def get_search_text(self):
+        return get_search_text(self.ear_tag, self.name, self.breed.name if self.breed_id else None,
+                               self.sire.name if self.sire_id else None, self.dam.name if self.dam_id else None)
+
+    @classmethod
+    def update_search_text(cls, animals):
+        """
+        Rebuilds the search text of the given animals, after the name of their breed, sire or dam changed
+        """
+        for animal in animals.select_related('breed', 'sire', 'dam'):
+            search_text = animal.get_search_text()
+            if search_text != animal.search_text:
+                cls.objects.filter(pk=animal.pk).update(search_text=search_text)
+
+    def get_stats(self):
+        """
+        Returns the reproductive statistics record for this animal, created along with it. Animals saved without
+        signals have empty statistics until rebuild_animal_stats is run.
+        """
+        try:
+            return self.stats
+        except AnimalStats.DoesNotExist:
+            return AnimalStats(animal=self)
+
     @property
     def date_of_first_service(self):
-        try:
-            date = self.animal_services.earliest('date').date
-        except Service.DoesNotExist:
-            date = ''
-        return date
+        return self.get_stats().date_of_first_service or ''
 
     @property
     def number_of_services(self):
-        return self.animal_services.count()
+        return self.get_stats().number_of_services
 
     @property
     def number_of_successful_services(self):
-        return self.pregnancy_checks.filter(result=PregnancyCheck.RESULT_CHOICES.pregnant).exclude(service=None).count()
+        return self.get_stats().number_of_successful_services
 
     @property
     def number_of_failed_services(self):
-        return self.pregnancy_checks.filter(result=PregnancyCheck.RESULT_CHOICES.open).exclude(service=None).count()
+        return self.get_stats().number_of_failed_services
 
     @property
     def all_time_production(self):
-        return self.milkproduction.aggregate(Sum('amount'))['amount__sum']
+        return self.milk_rollups.filter(period=MilkRollup.PERIOD_CHOICES.all).values_list('amount', flat=True).first()
+
+    def get_offspring(self):
+        return Animal.objects.filter(ancestor_links__ancestor=self, ancestor_links__depth=1)
+
+    def get_descendants(self):
+        return Animal.objects.filter(ancestor_links__ancestor=self, ancestor_links__depth__gt=0).distinct()
+
+    def get_pedigree(self, generations=3):
+        """
+        Returns the known ancestors up to the given number of generations back, nearest first
+        """
+        return Pedigree.objects.filter(descendant=self, depth__range=(1, generations)).select_related('ancestor')\
+                               .order_by('depth', 'ancestor__sex')
 
 
 @receiver(post_save, sender=Animal)
@@ -147,6 +237,374 @@ class MilkProduction(SmartModel):
     amount = models.DecimalField(max_digits=5, decimal_places=2)
     butterfat = models.DecimalField(max_digits=5, decimal_places=3, null=True)
     date = models.DateField()
+    lactation = models.ForeignKey('animals.LactationPeriod', null=True, blank=True, editable=False,
+                                  related_name='milk_records', on_delete=models.SET_NULL)
+
+    @property
+    def days_in_milk(self):
+        return (self.date - self.lactation.start_date).days if self.lactation else None
+
+    @classmethod
+    def get_graph_data(cls, animal, weeks=52):
+        """
+        Returns (week start, amount) pairs for the most recent weeks of production, oldest first
+        """
+        rollups = animal.milk_rollups.filter(period=MilkRollup.PERIOD_CHOICES.week).order_by('-start_date')[:weeks]
+        return [(rollup.start_date, rollup.amount) for rollup in reversed(rollups)]
+
+    @classmethod
+    def get_farm_production(cls, farm, period=None, start_date=None):
+        """
+        Returns the farm's total production for the period starting on the given date, or of all time
+        """
+        if period is None:
+            period, start_date = MilkRollup.PERIOD_CHOICES.all, MilkRollup.ALL_TIME_START
+        else:
+            start_date = MilkRollup.get_period_start(period, start_date)
+        return farm.milk_rollups.filter(period=period, start_date=start_date).values_list('amount', flat=True).first()
+
+    @classmethod
+    def record_session(cls, date, time, records, user):
+        """
+        Saves the records of a whole milking session in bulk. Animals that already have a record for the
+        session get it updated in place, every other record is inserted in a single query.
+        """
+        previous = dict((record.animal_id, record) for record in
+                        cls.objects.filter(date=date, time=time, animal_id__in=[r.animal_id for r in records]))
+
+        created, updated = [], []
+        for record in records:
+            record.date, record.time, record.modified_by = date, time, user
+            if record.animal_id in previous:
+                record.pk = previous[record.animal_id].pk
+                record.lactation_id = previous[record.animal_id].lactation_id
+                updated.append(record)
+            else:
+                record.created_by = user
+                created.append(record)
+        LactationPeriod.assign(created)
+
+        for i in range(0, len(updated), MilkRollup.UPDATE_BATCH_SIZE):
+            batch = updated[i:i + MilkRollup.UPDATE_BATCH_SIZE]
+            values = dict((name, values_by_pk(cls, dict((r.pk, getattr(r, name)) for r in batch),
+                                              cls._meta.get_field(name)))
+                          for name in ('amount', 'butterfat'))
+            cls.objects.filter(pk__in=[r.pk for r in batch]).update(modified_by=user, modified_on=timezone.now(),
+                                                                    **values)
+        cls.update_rollups([previous[record.animal_id] for record in updated], sign=-1)
+
+        cls.objects.bulk_create(created)
+        cls.update_rollups(updated + created)
+        MilkStats.update(created)
+
+        # neither bulk_create nor update send the signals that do this per record
+        bump_generations('animal', [record.animal_id for record in records])
+
+    @classmethod
+    def update_rollups(cls, records, sign=1):
+        """
+        Adds (or with a sign of -1 removes) the given records to the animal and farm rollups
+        """
+        records = list(records)
+        farms = dict(Animal.objects.filter(id__in=set(r.animal_id for r in records)).values_list('id', 'farm'))
+
+        animal_deltas = defaultdict(MilkRollup.empty_delta)
+        farm_deltas = defaultdict(MilkRollup.empty_delta)
+        for record in records:
+            delta = MilkRollup.get_delta(record, sign)
+            farm_id = farms.get(record.animal_id)
+            for period, label in MilkRollup.PERIOD_CHOICES:
+                start_date = MilkRollup.get_period_start(period, record.date)
+                MilkRollup.add_delta(animal_deltas[(record.animal_id, period, start_date)], delta)
+                if farm_id:
+                    MilkRollup.add_delta(farm_deltas[(farm_id, period, start_date)], delta)
+
+        # removals only ever touch rows that an earlier addition created
+        AnimalMilkRollup.apply_deltas('animal', animal_deltas, create=sign > 0)
+        FarmMilkRollup.apply_deltas('farm', farm_deltas, create=sign > 0)
+        LactationPeriod.update_aggregates(records, sign)
+
+    @classmethod
+    def rebuild_rollups(cls):
+        AnimalMilkRollup.objects.all().delete()
+        FarmMilkRollup.objects.all().delete()
+        records = []
+        for record in cls.objects.all().iterator():
+            records.append(record)
+            if len(records) == 5000:
+                cls.update_rollups(records)
+                records = []
+        cls.update_rollups(records)
+
+        # the yields of lactations are worked out again from scratch over the new rollups
+        for animal_id in LactationPeriod.objects.order_by().values_list('animal', flat=True).distinct():
+            LactationPeriod.relink(animal_id)
+
+
+@receiver(pre_save, sender=MilkProduction)
+def remember_milk_production(sender, **kwargs):
+    instance = kwargs['instance']
+    instance._previous = None
+    if instance.pk:
+        instance._previous = MilkProduction.objects.filter(pk=instance.pk).first()
+    LactationPeriod.assign([instance])
+
+
+@receiver(post_save, sender=MilkProduction)
+def add_milk_production_to_rollups(sender, **kwargs):
+    instance = kwargs['instance']
+    if getattr(instance, '_previous', None):
+        MilkProduction.update_rollups([instance._previous], sign=-1)
+    MilkProduction.update_rollups([instance])
+
+
+@receiver(post_delete, sender=MilkProduction)
+def remove_milk_production_from_rollups(sender, **kwargs):
+    MilkProduction.update_rollups([kwargs['instance']], sign=-1)
+
+
+class MilkRollup(models.Model):
+    """
+    Daily, weekly, monthly and all-time sums of milk production, maintained incrementally as
+    records are saved and deleted so that charts and totals never scan the raw history.
+    """
+    PERIOD_CHOICES = Choices(('day', _('Daily')), ('week', _('Weekly')), ('month', _('Monthly')),
+                             ('all', _('All time')))
+    ALL_TIME_START = datetime.date(1900, 1, 1)
+    UPDATE_BATCH_SIZE = 100
+
+    period = models.CharField(choices=PERIOD_CHOICES, max_length=10)
+    start_date = models.DateField()
+    amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    butterfat = models.DecimalField(max_digits=12, decimal_places=3, default=0)
+    butterfat_count = models.IntegerField(default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def mean_butterfat(self):
+        if self.butterfat_count:
+            return self.butterfat / self.butterfat_count
+        return None
+
+    @classmethod
+    def get_period_start(cls, period, date):
+        if period == cls.PERIOD_CHOICES.day:
+            return date
+        if period == cls.PERIOD_CHOICES.week:
+            return week_range(date)[0]
+        if period == cls.PERIOD_CHOICES.month:
+            return date.replace(day=1)
+        return cls.ALL_TIME_START
+
+    @staticmethod
+    def empty_delta():
+        return [Decimal(0), Decimal(0), 0, 0]
+
+    @staticmethod
+    def get_delta(record, sign):
+        amount = Decimal(str(record.amount)) * sign
+        if record.butterfat in (None, ''):
+            return [amount, Decimal(0), 0, sign]
+        return [amount, Decimal(str(record.butterfat)) * sign, sign, sign]
+
+    @staticmethod
+    def add_delta(total, delta):
+        for i, value in enumerate(delta):
+            total[i] += value
+
+    @classmethod
+    def apply_deltas(cls, owner_field, deltas, create=True):
+        """
+        Adds the deltas, keyed by (owner id, period, start date), to their rollup rows. Existing rows are
+        updated in a few batched queries and missing rows are created in one.
+        """
+        if not deltas:
+            return
+
+        existing = {}
+        rows = cls.objects.filter(**{'%s__in' % owner_field: set(key[0] for key in deltas),
+                                     'start_date__in': set(key[2] for key in deltas)})
+        for row_id, owner_id, period, start_date in rows.values_list('id', owner_field, 'period', 'start_date'):
+            if (owner_id, period, start_date) in deltas:
+                existing[(owner_id, period, start_date)] = row_id
+
+        keys = list(existing.keys())
+        for i in range(0, len(keys), cls.UPDATE_BATCH_SIZE):
+            batch = keys[i:i + cls.UPDATE_BATCH_SIZE]
+            updates = {}
+            for index, (name, field) in enumerate(cls.get_delta_fields()):
+                updates[name] = F(name) + values_by_pk(cls, dict((existing[key], deltas[key][index]) for key in batch),
+                                                       field)
+            cls.objects.filter(pk__in=[existing[key] for key in batch]).update(**updates)
+
+        missing = [key for key in deltas if key not in existing]
+        if not create or not missing:
+            return
+        rollups = []
+        for owner_id, period, start_date in missing:
+            amount, butterfat, butterfat_count, count = deltas[(owner_id, period, start_date)]
+            rollups.append(cls(period=period, start_date=start_date, amount=amount, butterfat=butterfat,
+                               butterfat_count=butterfat_count, count=count, **{'%s_id' % owner_field: owner_id}))
+        try:
+            with transaction.atomic():
+                cls.objects.bulk_create(rollups)
+        except IntegrityError:
+            # someone else created some of these rows in the meantime, add to them instead
+            cls.apply_deltas(owner_field, dict((key, deltas[key]) for key in missing), create=create)
+
+    @classmethod
+    def get_delta_fields(cls):
+        """
+        Returns the (name, field) pairs that deltas are made of, in delta order
+        """
+        return [(name, cls._meta.get_field(name)) for name in ('amount', 'butterfat', 'butterfat_count', 'count')]
+
+
+class AnimalMilkRollup(MilkRollup):
+    animal = models.ForeignKey(Animal, related_name='milk_rollups')
+
+    class Meta:
+        unique_together = ('animal', 'period', 'start_date')
+
+
+class FarmMilkRollup(MilkRollup):
+    farm = models.ForeignKey('users.User', related_name='milk_rollups')
+
+    class Meta:
+        unique_together = ('farm', 'period', 'start_date')
+
+
+class MilkStats(models.Model):
+    """
+    Running statistics of the yields of a cow at one milking time, a Welford mean and variance and an exponentially
+    weighted moving average, taken a reading at a time as milk records are added. A reading is compared with them
+    before it is taken in, without looking back at her earlier records, and one that falls too far below the
+    moving average raises a MilkAlert.
+    """
+    # the weight of each new reading in the moving average
+    EWMA_WEIGHT = 0.2
+    # the readings it takes before the spread of a cow's yields is worth comparing against
+    MIN_READINGS = 10
+
+    animal = models.ForeignKey(Animal, related_name='milk_stats')
+    time = models.CharField(choices=MilkProduction.TIME_CHOICES, max_length=10)
+    count = models.IntegerField(default=0)
+    mean = models.FloatField(default=0)
+    m2 = models.FloatField(default=0)
+    ewma = models.FloatField(null=True)
+
+    class Meta:
+        unique_together = ('animal', 'time')
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else None
+
+    def get_z_score(self, amount):
+        """
+        Returns how many standard deviations the given yield is from the moving average, None if it is too early to
+        tell or the yields haven't varied at all
+        """
+        std = self.std
+        if self.count < self.MIN_READINGS or not std:
+            return None
+        return (amount - self.ewma) / std
+
+    def add(self, amount):
+        self.count += 1
+        delta = amount - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (amount - self.mean)
+        self.ewma = amount if self.ewma is None else self.ewma + self.EWMA_WEIGHT * (amount - self.ewma)
+
+    @classmethod
+    def update(cls, records):
+        """
+        Takes in the yields of the given new milk records, in the order they were milked, raising an alert for each
+        that falls below the moving average of her yields at that time by more than MILK_ALERT_Z_SCORE standard
+        deviations. The statistics of every cow in them are read in one query and saved in bulk, locked until the
+        transaction ends so that concurrent saves for the same cow take their readings in turn.
+        """
+        records = sorted([record for record in records if record.animal_id and record.amount is not None],
+                         key=lambda record: (record.date, record.time))
+        if not records:
+            return []
+        animal_ids = set(record.animal_id for record in records)
+        keys = set((record.animal_id, record.time) for record in records)
+        farms = dict(Animal.objects.filter(id__in=animal_ids).values_list('id', 'farm'))
+
+        with transaction.atomic():
+            # the first reading of a cow at a time creates her row, which another save may be creating as well
+            for animal_id, time in keys - set(cls.objects.filter(animal__in=animal_ids).values_list('animal', 'time')):
+                cls.objects.get_or_create(animal_id=animal_id, time=time)
+            rows = cls.objects.select_for_update().filter(animal__in=animal_ids).order_by('pk')
+            stats = dict(((row.animal_id, row.time), row) for row in rows if (row.animal_id, row.time) in keys)
+
+            alerts = []
+            for record in records:
+                key = (record.animal_id, record.time)
+                amount = float(record.amount)
+                z_score = stats[key].get_z_score(amount)
+                if z_score is not None and z_score <= -settings.MILK_ALERT_Z_SCORE and farms.get(record.animal_id):
+                    alerts.append(MilkAlert(animal_id=record.animal_id, farm_id=farms[record.animal_id],
+                                            date=record.date, time=record.time, amount=record.amount,
+                                            expected=stats[key].ewma, z_score=z_score))
+                stats[key].add(amount)
+
+            rows = list(stats.values())
+            fields = [(name, cls._meta.get_field(name)) for name in ('count', 'mean', 'm2', 'ewma')]
+            for i in range(0, len(rows), MilkRollup.UPDATE_BATCH_SIZE):
+                batch = rows[i:i + MilkRollup.UPDATE_BATCH_SIZE]
+                cls.objects.filter(pk__in=[row.pk for row in batch]).update(**dict(
+                    (name, values_by_pk(cls, dict((row.pk, getattr(row, name)) for row in batch), field))
+                    for name, field in fields))
+            MilkAlert.objects.bulk_create(alerts)
+        return alerts
+
+    @classmethod
+    def rebuild(cls):
+        """
+        Works the statistics of every cow out again from all of her records, without raising alerts
+        """
+        cls.objects.all().delete()
+        stats = {}
+        records = MilkProduction.objects.order_by('date', 'time').values_list('animal', 'time', 'amount')
+        for animal_id, time, amount in records.iterator():
+            if (animal_id, time) not in stats:
+                stats[(animal_id, time)] = cls(animal_id=animal_id, time=time)
+            stats[(animal_id, time)].add(float(amount))
+        cls.objects.bulk_create(stats.values(), batch_size=1000)
+
+
+class MilkAlert(models.Model):
+    """
+    A milk record whose yield fell well below what the cow was giving at that milking, often the first sign of
+    mastitis. Alerts carry their farm so the latest of a farm are a single indexed query.
+    """
+    animal = models.ForeignKey(Animal, related_name='milk_alerts')
+    farm = models.ForeignKey('users.User', related_name='milk_alerts')
+    date = models.DateField()
+    time = models.CharField(choices=MilkProduction.TIME_CHOICES, max_length=10)
+    amount = models.DecimalField(max_digits=5, decimal_places=2)
+    expected = models.FloatField()
+    z_score = models.FloatField()
+    created_on = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ('-date', '-id')
+        index_together = ('farm', 'date')
+
+    def __unicode__(self):
+        return u"%s gave %s on %s" % (self.animal, self.amount, self.date)
+
+
+@receiver(post_save, sender=MilkProduction)
+def add_milk_production_to_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        MilkStats.update([instance])
 
 
 class Service(SmartModel):
@@ -162,6 +620,16 @@ class Service(SmartModel):
     def __unicode__(self):
         return 'Sire: ' + str(self.sire)
 
+    def get_latest_check(self):
+        """
+        Returns the latest pregnancy check of this service, picked from its checks so prefetching them spares a
+        query per service
+        """
+        if not hasattr(self, 'latest_check'):
+            checks = self.pregnancy_checks.all()
+            self.latest_check = max(checks, key=lambda check: check.created_on) if checks else None
+        return self.latest_check
+
 
 class PregnancyCheck(SmartModel):
     # Choices
@@ -175,12 +643,658 @@ class PregnancyCheck(SmartModel):
     date = models.DateField()
 
 
+class AnimalStats(models.Model):
+    """
+    Denormalized reproductive statistics for an animal. Updated as services and pregnancy checks
+    are recorded so that lists and reports can show them without counting rows per animal. New ones are
+    counted in, changed or deleted ones have the statistics of their animal counted again.
+    """
+    animal = models.OneToOneField(Animal, related_name='stats')
+    date_of_first_service = models.DateField(null=True, blank=True)
+    number_of_services = models.PositiveIntegerField(default=0)
+    number_of_successful_services = models.PositiveIntegerField(default=0)
+    number_of_failed_services = models.PositiveIntegerField(default=0)
+
+    def __unicode__(self):
+        return u"Stats of '%s'" % self.animal
+
+    @classmethod
+    def record_service(cls, service):
+        stats, created = cls.objects.get_or_create(animal_id=service.animal_id)
+        if created:
+            # first time we see this animal, count everything including this service
+            return cls.rebuild_for_animal(service.animal_id)
+
+        updates = dict(number_of_services=F('number_of_services') + 1)
+        if stats.date_of_first_service is None or service.date < stats.date_of_first_service:
+            updates['date_of_first_service'] = service.date
+        cls.objects.filter(pk=stats.pk).update(**updates)
+
+    @classmethod
+    def record_pregnancy_check(cls, check):
+        stats, created = cls.objects.get_or_create(animal_id=check.animal_id)
+        if created:
+            return cls.rebuild_for_animal(check.animal_id)
+
+        if check.service_id is None:
+            return
+        if check.result == PregnancyCheck.RESULT_CHOICES.pregnant:
+            cls.objects.filter(pk=stats.pk).update(number_of_successful_services=F('number_of_successful_services') + 1)
+        elif check.result == PregnancyCheck.RESULT_CHOICES.open:
+            cls.objects.filter(pk=stats.pk).update(number_of_failed_services=F('number_of_failed_services') + 1)
+
+    @classmethod
+    def rebuild_for_animal(cls, animal_id):
+        services = Service.objects.filter(animal=animal_id).aggregate(count=Count('id'), first=Min('date'))
+        checks = PregnancyCheck.objects.filter(animal=animal_id).exclude(service=None)
+
+        stats, created = cls.objects.get_or_create(animal_id=animal_id)
+        stats.date_of_first_service = services['first']
+        stats.number_of_services = services['count']
+        stats.number_of_successful_services = checks.filter(result=PregnancyCheck.RESULT_CHOICES.pregnant).count()
+        stats.number_of_failed_services = checks.filter(result=PregnancyCheck.RESULT_CHOICES.open).count()
+        stats.save()
+        return stats
+
+    @classmethod
+    def rebuild(cls):
+        """
+        Rebuilds the statistics of every animal from scratch in a fixed number of queries
+        """
+        stats = {}
+        for animal_id in Animal.objects.values_list('id', flat=True):
+            stats[animal_id] = cls(animal_id=animal_id)
+
+        services = Service.objects.values('animal').annotate(count=Count('id'), first=Min('date'))
+        for row in services:
+            stats[row['animal']].number_of_services = row['count']
+            stats[row['animal']].date_of_first_service = row['first']
+
+        checks = PregnancyCheck.objects.exclude(service=None).values('animal', 'result').annotate(count=Count('id'))
+        for row in checks:
+            if row['result'] == PregnancyCheck.RESULT_CHOICES.pregnant:
+                stats[row['animal']].number_of_successful_services = row['count']
+            elif row['result'] == PregnancyCheck.RESULT_CHOICES.open:
+                stats[row['animal']].number_of_failed_services = row['count']
+
+        cls.objects.all().delete()
+        cls.objects.bulk_create(stats.values(), batch_size=1000)
+        return len(stats)
+
+
+class AnimalImport(SmartModel):
+    """
+    An uploaded CSV or XLSX file of animals, imported in the background by the import_animals task
+    """
+    STATUS_CHOICES = Choices(('pending', _('Pending')), ('processing', _('Processing')), ('complete', _('Complete')),
+                             ('failed', _('Failed')))
+
+    file = models.FileField(upload_to='imports')
+    farm = models.ForeignKey('users.User', related_name='animal_imports')
+    status = models.CharField(choices=STATUS_CHOICES, max_length=20, default=STATUS_CHOICES.pending)
+    rows_processed = models.PositiveIntegerField(default=0)
+    animals_created = models.PositiveIntegerField(default=0)
+    errors = models.TextField(blank=True)
+    task_id = models.CharField(max_length=50, blank=True)
+
+    def __unicode__(self):
+        return u"%s" % self.file.name
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_CHOICES.complete, self.STATUS_CHOICES.failed)
+
+    def get_errors(self):
+        return [error for error in self.errors.split('\n') if error]
+
+    def run(self, progress=None):
+        from .imports import HerdImporter, read_rows
+
+        AnimalImport.objects.filter(pk=self.pk).update(status=self.STATUS_CHOICES.processing)
+        importer = HerdImporter(self.farm, self.created_by)
+
+        def save_progress(importer):
+            self.rows_processed = importer.rows
+            self.animals_created = importer.created
+            self.errors = '\n'.join(self.format_error(row, message) for row, message in importer.errors)
+            AnimalImport.objects.filter(pk=self.pk).update(rows_processed=self.rows_processed, errors=self.errors,
+                                                           animals_created=self.animals_created)
+            if progress:
+                progress(self)
+
+        try:
+            self.file.open('rb')
+            importer.run(read_rows(self.file, self.file.name), progress=save_progress)
+        except Exception as e:
+            importer.errors.append((None, '%s' % e))
+            save_progress(importer)
+            self.status = self.STATUS_CHOICES.failed
+        else:
+            self.status = self.STATUS_CHOICES.complete
+        finally:
+            self.file.close()
+
+        AnimalImport.objects.filter(pk=self.pk).update(status=self.status)
+        return importer
+
+    @staticmethod
+    def format_error(row, message):
+        return 'row %d: %s' % (row, message) if row else message
+
+
+def build_pedigree_links(parents, known=None):
+    """
+    Given a dict of animal id to the ids of its parent animals, returns a dict of animal id to the set of
+    (ancestor id, depth) pairs of that animal, including itself at depth 0. Parents that aren't keys of parents
+    must have their links in known, anything else is taken to have no known ancestors.
+    """
+    links = dict(known or {})
+
+    def resolve(animal_id, visiting):
+        if animal_id in links:
+            return links[animal_id]
+
+        result = set([(animal_id, 0)])
+        visiting.add(animal_id)
+        for parent_id in parents.get(animal_id, ()):
+            # ignore unknown parents and bad data where an animal is its own ancestor
+            if parent_id is None or parent_id in visiting:
+                continue
+            for ancestor_id, depth in resolve(parent_id, visiting):
+                result.add((ancestor_id, depth + 1))
+        visiting.discard(animal_id)
+
+        links[animal_id] = result
+        return result
+
+    return dict((animal_id, resolve(animal_id, set())) for animal_id in parents)
+
+
+class Pedigree(models.Model):
+    """
+    Closure table of the pedigree, with a row for every ancestor of every animal and one for the animal itself
+    at depth 0. Sires and dams are resolved to their animals where they have one, so offspring, descendants and
+    pedigrees of any depth are each a single query.
+    """
+    ancestor = models.ForeignKey(Animal, related_name='descendant_links')
+    descendant = models.ForeignKey(Animal, related_name='ancestor_links')
+    depth = models.PositiveSmallIntegerField()
+
+    class Meta:
+        unique_together = ('ancestor', 'descendant', 'depth')
+
+    @classmethod
+    def get_parents(cls, animals):
+        """
+        Returns a dict of animal id to the ids of the sire and dam animals of the given animals
+        """
+        rows = Animal.objects.filter(pk__in=animals).values_list('id', 'sire__animal', 'dam__animal')
+        return dict((animal_id, (sire_id, dam_id)) for animal_id, sire_id, dam_id in rows)
+
+    @classmethod
+    def get_links(cls, animals):
+        links = defaultdict(set)
+        for ancestor_id, descendant_id, depth in cls.objects.filter(descendant__in=animals)\
+                                                            .values_list('ancestor', 'descendant', 'depth'):
+            links[descendant_id].add((ancestor_id, depth))
+        return links
+
+    @classmethod
+    def create_links(cls, links):
+        cls.objects.bulk_create([cls(ancestor_id=ancestor_id, descendant_id=animal_id, depth=depth)
+                                 for animal_id, ancestors in links.items() for ancestor_id, depth in ancestors],
+                                batch_size=1000)
+
+    @classmethod
+    def relink(cls, animals):
+        """
+        Recalculates the ancestors of the given animals and of all their descendants, after their parents changed
+        """
+        animal_ids = set(animal.pk if isinstance(animal, Animal) else animal for animal in animals)
+        subtree = set(cls.objects.filter(ancestor__in=animal_ids).values_list('descendant', flat=True)) | animal_ids
+
+        parents = cls.get_parents(subtree)
+        outside = set(parent_id for ids in parents.values() for parent_id in ids
+                      if parent_id and parent_id not in subtree)
+        links = build_pedigree_links(parents, known=cls.get_links(outside))
+
+        with transaction.atomic():
+            cls.objects.filter(descendant__in=subtree).delete()
+            cls.create_links(dict((animal_id, links[animal_id]) for animal_id in subtree if animal_id in parents))
+
+    @classmethod
+    def rebuild(cls):
+        parents = dict((animal_id, (sire_id, dam_id)) for animal_id, sire_id, dam_id
+                       in Animal.objects.values_list('id', 'sire__animal', 'dam__animal'))
+        links = build_pedigree_links(parents)
+
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.create_links(links)
+        return len(links)
+
+
+post_init.connect(remember_tracked_fields, sender=Animal)
+post_init.connect(remember_tracked_fields, sender=Breed)
+post_init.connect(remember_tracked_fields, sender=Sire)
+post_init.connect(remember_tracked_fields, sender=Dam)
+
+
+@receiver(post_save, sender=Animal)
+def update_pedigree(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+
+    from .genetics import InbreedingEngine
+
+    if created:
+        parents = Pedigree.get_parents([instance.pk])
+        known = Pedigree.get_links([parent_id for parent_id in parents[instance.pk] if parent_id])
+        Pedigree.create_links(build_pedigree_links(parents, known=known))
+        # the cached engine of the farm appends new calves when it is next read
+    elif instance.get_changed_fields() & set(['sire_id', 'dam_id']):
+        Pedigree.relink([instance])
+        InbreedingEngine.invalidate([instance.farm_id])
+
+
+@receiver(post_save, sender=Sire)
+@receiver(post_save, sender=Dam)
+def update_offspring_pedigree(sender, instance, created, raw=False, **kwargs):
+    # a sire or dam now linked to a different animal changes the ancestors of all their offspring
+    if created or raw or 'animal_id' not in instance.get_changed_fields():
+        return
+    from .genetics import InbreedingEngine
+
+    field = 'sire' if sender == Sire else 'dam'
+    offspring = list(Animal.objects.filter(**{field: instance}).values_list('id', 'farm'))
+    if offspring:
+        Pedigree.relink([animal_id for animal_id, farm_id in offspring])
+        InbreedingEngine.invalidate([farm_id for animal_id, farm_id in offspring])
+
+
+@receiver(post_save, sender=Breed)
+@receiver(post_save, sender=Sire)
+@receiver(post_save, sender=Dam)
+def update_animal_search_text(sender, instance, created, raw=False, **kwargs):
+    # nothing refers to a new one yet
+    if created or raw or 'name' not in instance.get_changed_fields():
+        return
+    field = {Breed: 'breed', Sire: 'sire', Dam: 'dam'}[sender]
+    Animal.update_search_text(Animal.objects.filter(**{field: instance}))
+
+
+@receiver(post_save, sender=Animal)
+@receiver(post_delete, sender=Animal)
+def bump_animal_autocomplete(sender, instance, signal, created=False, **kwargs):
+    if signal == post_delete or created or instance.get_changed_fields() & set(['ear_tag', 'name', 'farm_id']):
+        bump_autocomplete('animals', [instance.farm_id, getattr(instance, '_original', {}).get('farm_id')])
+
+
+@receiver(post_save, sender=Sire)
+@receiver(post_delete, sender=Sire)
+@receiver(post_save, sender=Dam)
+@receiver(post_delete, sender=Dam)
+def bump_parent_autocomplete(sender, instance, **kwargs):
+    farms = [instance.created_by_id]
+    if instance.animal_id:
+        farms += Animal.objects.filter(pk=instance.animal_id).values_list('farm', flat=True)
+    bump_autocomplete('sires' if sender == Sire else 'dams', farms)
+
+
+@receiver(post_save, sender=Color)
+@receiver(post_delete, sender=Color)
+@receiver(post_save, sender=Breeder)
+@receiver(post_delete, sender=Breeder)
+def bump_name_autocomplete(sender, instance, **kwargs):
+    bump_autocomplete('colors' if sender == Color else 'breeders', [0])
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+@receiver(post_save, sender=PregnancyCheck)
+@receiver(post_delete, sender=PregnancyCheck)
+@receiver(post_save, sender=MilkProduction)
+@receiver(post_delete, sender=MilkProduction)
+def bump_animal_fragments(sender, instance, **kwargs):
+    bump_generations('animal', [instance.animal_id])
+
+
+@receiver(post_save, sender=Animal)
+@receiver(post_delete, sender=Animal)
+def bump_parent_fragments(sender, instance, **kwargs):
+    # the offspring lists of its parents, and of the parents it had before this save
+    original = getattr(instance, '_original', {})
+    sire_ids = [sire_id for sire_id in (instance.sire_id, original.get('sire_id')) if sire_id]
+    dam_ids = [dam_id for dam_id in (instance.dam_id, original.get('dam_id')) if dam_id]
+    if sire_ids or dam_ids:
+        parents = Animal.objects.filter(models.Q(sire_animal__in=sire_ids) | models.Q(dam_animal__in=dam_ids))
+        bump_generations('animal', parents.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Breed)
+@receiver(post_save, sender=Sire)
+@receiver(post_save, sender=Dam)
+def bump_renamed_fragments(sender, instance, created, raw=False, **kwargs):
+    # offspring and group lists show the names of the breeds, sires and dams of their animals
+    if created or raw or 'name' not in instance.get_changed_fields():
+        return
+    field = {Breed: 'breed', Sire: 'sire', Dam: 'dam'}[sender]
+    animals = Animal.objects.filter(**{field: instance})
+    parents = Pedigree.objects.filter(descendant__in=animals, depth=1)
+    bump_generations('animal', parents.values_list('ancestor', flat=True))
+    bump_generations('group', animals.values_list('group_memberships__group', flat=True))
+
+
+class MatingRecommendation(models.Model):
+    """
+    A sire ranked for a cow by the mating planner, rank 1 being the best
+    """
+    animal = models.ForeignKey(Animal, related_name='mating_recommendations')
+    sire = models.ForeignKey(Sire, related_name='mating_recommendations')
+    rank = models.PositiveSmallIntegerField()
+    expected_inbreeding = models.FloatField()
+    conception_rate = models.FloatField()
+    created_on = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ('animal', 'rank')
+        unique_together = ('animal', 'rank')
+
+    def __unicode__(self):
+        return u"%s for %s" % (self.sire, self.animal)
+
+
 class LactationPeriod(SmartModel):
+    """
+    A lactation of a cow, opened when she calves and closed when she is dried off. Its yields are maintained
+    incrementally as milk records are saved and deleted, so reports never scan the records of a lactation.
+    """
+    # the standard lactation that yields are compared over
+    STANDARD_DAYS = 305
+    # twins born this many days apart are taken for the same calving
+    CALVING_WINDOW = 2
+
     animal = models.ForeignKey(Animal, null=False, blank=False, related_name='animal_lactation_periods')
     calves = models.ManyToManyField(Animal, null=False, blank=False, related_name='calf_lactation_periods')
     start_date = models.DateField()
     end_date = models.DateField(null=True, blank=True)
+    total_yield = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    standard_yield = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    peak_yield = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    butterfat = models.DecimalField(max_digits=12, decimal_places=3, default=0)
+    butterfat_count = models.IntegerField(default=0)
+    count = models.IntegerField(default=0)
+    # the Wood's curve fitted to the daily yields, a * t ** b * e ** (-c * t) on day t in milk
+    curve_a = models.FloatField(null=True, editable=False)
+    curve_b = models.FloatField(null=True, editable=False)
+    curve_c = models.FloatField(null=True, editable=False)
+    projected_yield = models.DecimalField(max_digits=12, decimal_places=2, null=True, editable=False)
+    persistency = models.FloatField(null=True, editable=False)
+    # set when milk records change, until the curve is fitted again
+    curve_stale = models.BooleanField(default=False, db_index=True, editable=False)
+
+    def __unicode__(self):
+        return u"%s from %s" % (self.animal, self.start_date)
+
+    @property
+    def days_in_milk(self):
+        return ((self.end_date or datetime.date.today()) - self.start_date).days
+
+    @property
+    def mean_butterfat(self):
+        if self.butterfat_count:
+            return self.butterfat / self.butterfat_count
+        return None
+
+    @classmethod
+    def record_calving(cls, cow, calf, date, user):
+        """
+        Opens a lactation for a cow that calved, closing the one she was still in, or adds the calf to the lactation
+        its twin opened. A backdated calving before a later lactation is closed the day before that one started.
+        """
+        window = datetime.timedelta(cls.CALVING_WINDOW)
+        lactation = cls.objects.filter(animal=cow, start_date__range=(date - window, date + window)).first()
+        if lactation is None:
+            with transaction.atomic():
+                for previous in cls.objects.filter(animal=cow, start_date__lt=date).exclude(end_date__lt=date):
+                    previous.end_date = date - datetime.timedelta(1)
+                    previous.modified_by = user
+                    previous.save()
+                following = cls.objects.filter(animal=cow, start_date__gt=date).order_by('start_date').first()
+                end_date = following.start_date - datetime.timedelta(1) if following else None
+                lactation = cls.objects.create(animal=cow, start_date=date, end_date=end_date,
+                                               created_by=user, modified_by=user)
+            if following is None:
+                cow.lactating()
+                cow.save()
+        lactation.calves.add(calf)
+        return lactation
+
+    def dry_off(self, date, user):
+        """
+        Closes this lactation, the cow going back to pregnant or open by her latest check
+        """
+        self.end_date, self.modified_by = date, user
+        self.save()
+
+        cow = self.animal
+        check = cow.pregnancy_checks.order_by('-date', '-created_on').first()
+        if check and check.result == PregnancyCheck.RESULT_CHOICES.pregnant:
+            cow.pregnant()
+        else:
+            cow.open()
+        cow.save()
+
+    @classmethod
+    def assign(cls, records):
+        """
+        Sets the lactation of each of the given milk records, the one of its cow that its date falls in
+        """
+        records = [record for record in records if record.animal_id and record.date]
+        if not records:
+            return
+        lactations = defaultdict(list)
+        rows = cls.objects.filter(animal__in=set(record.animal_id for record in records),
+                                  start_date__lte=max(record.date for record in records))\
+                          .exclude(end_date__lt=min(record.date for record in records))\
+                          .order_by('-start_date').values_list('id', 'animal', 'start_date', 'end_date')
+        for lactation_id, animal_id, start_date, end_date in rows:
+            lactations[animal_id].append((lactation_id, start_date, end_date))
+
+        for record in records:
+            record.lactation_id = next((lactation_id
+                                        for lactation_id, start_date, end_date in lactations[record.animal_id]
+                                        if start_date <= record.date and (end_date is None or record.date <= end_date)),
+                                       None)
+
+    @classmethod
+    def update_aggregates(cls, records, sign=1):
+        """
+        Adds (or with a sign of -1 removes) the given milk records to the yields of their lactations. Peaks are
+        raised from the daily rollups of the days added to, and only looked for again when a peak day is lowered.
+        """
+        records = [record for record in records if record.lactation_id]
+        lactations = dict((row[0], row[1:]) for row in cls.objects.filter(pk__in=set(r.lactation_id for r in records))
+                          .values_list('id', 'animal', 'start_date', 'end_date', 'peak_yield'))
+        if not lactations:
+            return
+
+        deltas = defaultdict(lambda: [Decimal(0), Decimal(0), Decimal(0), 0, 0])
+        days = defaultdict(set)
+        for record in records:
+            if record.lactation_id not in lactations:
+                continue
+            animal_id, start_date, end_date, peak = lactations[record.lactation_id]
+            amount, butterfat, butterfat_count, count = MilkRollup.get_delta(record, sign)
+            standard = amount if (record.date - start_date).days < cls.STANDARD_DAYS else Decimal(0)
+            MilkRollup.add_delta(deltas[record.lactation_id], [amount, standard, butterfat, butterfat_count, count])
+            days[record.lactation_id].add(record.date)
+
+        keys = list(deltas.keys())
+        fields = [(name, cls._meta.get_field(name))
+                  for name in ('total_yield', 'standard_yield', 'butterfat', 'butterfat_count', 'count')]
+        for i in range(0, len(keys), MilkRollup.UPDATE_BATCH_SIZE):
+            batch = keys[i:i + MilkRollup.UPDATE_BATCH_SIZE]
+            cls.objects.filter(pk__in=batch).update(curve_stale=True, **dict(
+                (name, F(name) + values_by_pk(cls, dict((key, deltas[key][index]) for key in batch), field))
+                for index, (name, field) in enumerate(fields)))
+
+        # the rollups already include these records, so they hold the totals of the days after the change
+        totals = dict(((animal_id, start_date), amount) for animal_id, start_date, amount in
+                      AnimalMilkRollup.objects.filter(animal__in=set(row[0] for row in lactations.values()),
+                                                      period=MilkRollup.PERIOD_CHOICES.day,
+                                                      start_date__in=set(d for ds in days.values() for d in ds))
+                      .values_list('animal', 'start_date', 'amount'))
+        peaks = {}
+        for lactation_id, dates in days.items():
+            animal_id, start_date, end_date, peak = lactations[lactation_id]
+            day_totals = [totals.get((animal_id, date), Decimal(0)) for date in dates]
+            if sign > 0 and max(day_totals) > peak:
+                peaks[lactation_id] = max(day_totals)
+            elif sign < 0 and max(day_totals) - deltas[lactation_id][0] >= peak:
+                peaks[lactation_id] = cls.get_peak(animal_id, start_date, end_date)
+        if peaks:
+            cls.objects.filter(pk__in=peaks.keys()).update(
+                peak_yield=values_by_pk(cls, peaks, cls._meta.get_field('peak_yield')))
+
+    @classmethod
+    def get_peak(cls, animal_id, start_date, end_date):
+        days = AnimalMilkRollup.objects.filter(animal=animal_id, period=MilkRollup.PERIOD_CHOICES.day,
+                                               start_date__gte=start_date)
+        if end_date:
+            days = days.filter(start_date__lte=end_date)
+        return days.aggregate(peak=Max('amount'))['peak'] or Decimal(0)
+
+    @classmethod
+    def relink(cls, animal_id):
+        """
+        Links the milk records of a cow to her lactations again and works their yields out from scratch, for when
+        a lactation is opened, closed or moved
+        """
+        lactations = list(cls.objects.filter(animal=animal_id).order_by('start_date'))
+        records = MilkProduction.objects.filter(animal=animal_id)
+        with transaction.atomic():
+            records.update(lactation=None)
+            for lactation in lactations:
+                lactation_records = records.filter(date__gte=lactation.start_date)
+                if lactation.end_date:
+                    lactation_records = lactation_records.filter(date__lte=lactation.end_date)
+                lactation_records.update(lactation=lactation)
+            for lactation in lactations:
+                lactation.rebuild()
+
+    def rebuild(self):
+        records = MilkProduction.objects.filter(lactation=self)
+        totals = records.aggregate(total=Sum('amount'), butterfat=Sum('butterfat'), butterfat_count=Count('butterfat'),
+                                   count=Count('id'))
+        standard_end = self.start_date + datetime.timedelta(self.STANDARD_DAYS - 1)
+        standard = records.filter(date__lte=standard_end).aggregate(total=Sum('amount'))['total']
+        LactationPeriod.objects.filter(pk=self.pk).update(
+            total_yield=totals['total'] or 0, standard_yield=standard or 0, butterfat=totals['butterfat'] or 0,
+            butterfat_count=totals['butterfat_count'], count=totals['count'], curve_stale=True,
+            peak_yield=self.get_peak(self.animal_id, self.start_date, self.end_date))
 
 
+@receiver(post_save, sender=LactationPeriod)
+def relink_lactation_records(sender, instance, raw=False, **kwargs):
+    if not raw:
+        LactationPeriod.relink(instance.animal_id)
 
 
+class DueEvent(models.Model):
+    """
+    An event of the reproductive cycle a cow is next expected to reach, worked out from her services, pregnancy
+    checks and calvings by the ReproductiveCalendar. A cow has at most one of each, so the events due on a farm
+    over any number of days are a single range query.
+    """
+    EVENT_CHOICES = Choices(('heat', _('Heat')), ('pregnancy_check', _('Pregnancy Check')), ('dry_off', _('Dry Off')),
+                            ('calving', _('Calving')))
+
+    animal = models.ForeignKey(Animal, related_name='due_events')
+    farm = models.ForeignKey('users.User', related_name='due_events')
+    event = models.CharField(choices=EVENT_CHOICES, max_length=20)
+    date = models.DateField()
+
+    class Meta:
+        ordering = ('date', 'animal')
+        unique_together = ('animal', 'event')
+        index_together = ('farm', 'date')
+
+    def __unicode__(self):
+        return u"%s of %s on %s" % (self.EVENT_CHOICES[self.event], self.animal, self.date)
+
+
+# the animals being deleted by this thread, whose services and checks are deleted before them
+_deleting = threading.local()
+
+
+@receiver(pre_delete, sender=Animal)
+def remember_deleted_animal(sender, instance, **kwargs):
+    if not hasattr(_deleting, 'animals'):
+        _deleting.animals = set()
+    _deleting.animals.add(instance.pk)
+
+
+@receiver(post_delete, sender=Animal)
+def forget_deleted_animal(sender, instance, **kwargs):
+    getattr(_deleting, 'animals', set()).discard(instance.pk)
+
+
+@receiver(post_save, sender=Animal)
+def add_animal_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        AnimalStats.objects.create(animal=instance)
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+@receiver(post_save, sender=PregnancyCheck)
+@receiver(post_delete, sender=PregnancyCheck)
+def update_animal_stats(sender, instance, created=False, raw=False, **kwargs):
+    # the statistics of an animal being deleted go with it
+    if raw or instance.animal_id in getattr(_deleting, 'animals', ()):
+        return
+    if not created:
+        # an edit can move a service date or change a result, either way the animal is counted again
+        AnimalStats.rebuild_for_animal(instance.animal_id)
+    elif sender == Service:
+        AnimalStats.record_service(instance)
+    else:
+        AnimalStats.record_pregnancy_check(instance)
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+@receiver(post_save, sender=PregnancyCheck)
+@receiver(post_delete, sender=PregnancyCheck)
+@receiver(post_save, sender=LactationPeriod)
+@receiver(post_delete, sender=LactationPeriod)
+def update_due_events(sender, instance, raw=False, **kwargs):
+    # the events of an animal being deleted go with it, working them out again would leave rows pointing at nothing
+    if raw or instance.animal_id in getattr(_deleting, 'animals', ()):
+        return
+    from .reproduction import ReproductiveCalendar
+
+    ReproductiveCalendar(animal_ids=[instance.animal_id]).refresh()
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+@receiver(post_save, sender=PregnancyCheck)
+@receiver(post_delete, sender=PregnancyCheck)
+@receiver(post_save, sender=LactationPeriod)
+@receiver(post_delete, sender=LactationPeriod)
+def bump_record_fertility(sender, instance, **kwargs):
+    from .fertility import bump_fertility
+
+    bump_fertility(Animal.objects.filter(pk=instance.animal_id).values_list('farm', flat=True))
+
+
+@receiver(post_save, sender=Animal)
+@receiver(post_delete, sender=Animal)
+def bump_animal_fertility(sender, instance, signal, created=False, **kwargs):
+    from .fertility import bump_fertility
+
+    # birth dates count towards age at first calving, and the other tracked fields can move her between groups
+    if created or signal == post_delete or instance.get_changed_fields():
+        bump_fertility([instance.farm_id, getattr(instance, '_original', {}).get('farm_id')])
@@ -0,0 +1,39 @@
+from django.db.models import Prefetch
+from .models import PregnancyCheck
+
+
+class AnimalProfile(object):
+    """
+    The related lists of the page of an animal, each a queryset that loads in a fixed number of queries however
+    many services, checks, treatments, notes, milk records and offspring the animal has. The checks of services
+    are prefetched so the latest check of each is picked from them rather than looked up per service.
+    """
+    def __init__(self, animal):
+        self.animal = animal
+
+    @property
+    def services(self):
+        checks = Prefetch('pregnancy_checks', queryset=PregnancyCheck.objects.order_by('-id'))
+        return self.animal.animal_services.select_related('sire').prefetch_related(checks).order_by('-id')
+
+    @property
+    def pregnancy_checks(self):
+        return self.animal.pregnancy_checks.order_by('-id')
+
+    @property
+    def treatments(self):
+        return self.animal.treatments.order_by('-id')
+
+    @property
+    def notes(self):
+        return self.animal.notes.order_by('-id')
+
+    @property
+    def milk_production(self):
+        # a cow can have thousands of records, these are paged
+        return self.animal.milkproduction.order_by('-id')
+
+    @property
+    def offspring(self):
+        offspring = self.animal.get_offspring().filter(farm=self.animal.farm_id)
+        return offspring.select_related('breed', 'sire', 'dam').order_by('-id')
@@ -0,0 +1,124 @@
+import datetime
+import numpy as np
+from django.db import transaction
+from django.db.models import Max
+from .models import Animal, DueEvent, LactationPeriod, PregnancyCheck, Service
+
+# days, as kept by most herd books
+ESTROUS_CYCLE = 21
+PREGNANCY_CHECK_AFTER = 45
+GESTATION = 283
+DRY_PERIOD = 60
+VOLUNTARY_WAITING_PERIOD = 50
+
+# dates are worked out as day ordinals, where 0 is no date
+NO_DATE = 0
+
+
+def next_in_cycle(start, after):
+    """
+    Returns the first day from start, in whole estrous cycles, that is on or after the given day
+    """
+    cycles = np.maximum(0, -((start - after) // ESTROUS_CYCLE))
+    return start + cycles * ESTROUS_CYCLE
+
+
+def get_due_dates(today, states, services, checks, pregnant, calvings):
+    """
+    Works out the next heat, pregnancy check, dry off and calving of each cow in a single pass over arrays of day
+    ordinals of her last service, last check and last calving, with whether that check found her pregnant. Returns
+    the due day of each event for each cow, NO_DATE where it isn't expected.
+
+    A service counts only if it is later than the last calving. A served cow is due a check some days after it and
+    back in heat a cycle after it, unless her state says she is pregnant. A check after the service decides whether
+    she calves a gestation later, going dry a dry period before, or comes back in heat the next cycle after the
+    check. A cow that calved and hasn't been served since comes in heat after the voluntary waiting period. Heats
+    already past are moved on by whole cycles to the next one from today.
+    """
+    served = (services != NO_DATE) & (services > calvings)
+    checked = served & (checks >= services)
+    confirmed = (checked & pregnant) | (served & ~checked & (states == 'pregnant'))
+    unchecked = served & ~checked & ~confirmed
+    failed = checked & ~pregnant
+    recovering = ~served & (calvings != NO_DATE)
+
+    return {
+        DueEvent.EVENT_CHOICES.heat: np.select([unchecked, failed, recovering],
+                                               [next_in_cycle(services + ESTROUS_CYCLE, today),
+                                                next_in_cycle(services, np.maximum(today, checks + 1)),
+                                                next_in_cycle(calvings + VOLUNTARY_WAITING_PERIOD, today)], NO_DATE),
+        DueEvent.EVENT_CHOICES.pregnancy_check: np.where(unchecked, services + PREGNANCY_CHECK_AFTER, NO_DATE),
+        DueEvent.EVENT_CHOICES.dry_off: np.where(confirmed, services + GESTATION - DRY_PERIOD, NO_DATE),
+        DueEvent.EVENT_CHOICES.calving: np.where(confirmed, services + GESTATION, NO_DATE),
+    }
+
+
+class ReproductiveCalendar(object):
+    """
+    Keeps the due events of the cows of a farm, or of the given animals, in line with their latest services, checks
+    and calvings. The whole herd is read in a few aggregate queries and worked out in one vectorized pass, then its
+    events replace the ones stored.
+    """
+    def __init__(self, farm=None, animal_ids=None, today=None):
+        self.farm = farm
+        self.animal_ids = animal_ids
+        self.today = today or datetime.date.today()
+
+    def filter(self, queryset, prefix=''):
+        if self.farm is not None:
+            queryset = queryset.filter(**{prefix + 'farm': self.farm})
+        if self.animal_ids is not None:
+            queryset = queryset.filter(**{prefix + 'pk__in': self.animal_ids})
+        return queryset
+
+    def get_cows(self):
+        cows = Animal.objects.filter(is_active=True, sex=Animal.SEX_CHOICES.female).exclude(state='disposed')
+        return list(self.filter(cows.exclude(farm=None)).values_list('id', 'farm', 'state'))
+
+    def get_last_dates(self, queryset, field):
+        return dict(self.filter(queryset, 'animal__').order_by().values_list('animal').annotate(last=Max(field)))
+
+    def get_last_checks(self):
+        checks = {}
+        # the latest of each cow's checks is the one that counts, ties on the date go to the last recorded
+        for animal_id, date, result in self.filter(PregnancyCheck.objects.all(), 'animal__')\
+                .order_by('date', 'created_on').values_list('animal', 'date', 'result'):
+            checks[animal_id] = (date, result == PregnancyCheck.RESULT_CHOICES.pregnant)
+        return checks
+
+    def get_due_dates(self, cows):
+        services = self.get_last_dates(Service.objects.all(), 'date')
+        calvings = self.get_last_dates(LactationPeriod.objects.all(), 'start_date')
+        checks = self.get_last_checks()
+
+        def ordinals(dates):
+            return np.array([dates[animal_id].toordinal() if dates.get(animal_id) else NO_DATE
+                             for animal_id, farm_id, state in cows], dtype=np.int64)
+
+        last_checks = [checks.get(animal_id, (None, False)) for animal_id, farm_id, state in cows]
+        return get_due_dates(self.today.toordinal(),
+                             np.array([state for animal_id, farm_id, state in cows]),
+                             ordinals(services),
+                             np.array([date.toordinal() if date else NO_DATE for date, pregnant in last_checks],
+                                      dtype=np.int64),
+                             np.array([pregnant for date, pregnant in last_checks], dtype=bool),
+                             ordinals(calvings))
+
+    def refresh(self):
+        """
+        Replaces the stored events of the cows, returning how many are due
+        """
+        cows = self.get_cows()
+        events = []
+        if cows:
+            for event, dates in self.get_due_dates(cows).items():
+                for index in np.flatnonzero(dates):
+                    animal_id, farm_id, state = cows[index]
+                    events.append(DueEvent(animal_id=animal_id, farm_id=farm_id, event=event,
+                                           date=datetime.date.fromordinal(int(dates[index]))))
+
+        with transaction.atomic():
+            # animals no longer cows of the farm, like those disposed of, lose their events too
+            self.filter(DueEvent.objects.all(), 'animal__').delete()
+            DueEvent.objects.bulk_create(events, batch_size=1000)
+        return len(events)
@@ -0,0 +1,46 @@
+import re
+from django.db import connections
+from .models import Animal
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+# the search text is matched word by word, each word of the search as a prefix
+MATCH_SQL = "to_tsvector('simple', {table}.search_text) @@ to_tsquery('simple', %s)"
+
+# a close enough ear tag or name also matches, which is how typos are forgiven
+SIMILAR_SQL = "UPPER({table}.ear_tag::text) %% UPPER(%s) OR UPPER({table}.name::text) %% UPPER(%s)"
+
+RANK_SQL = ("ts_rank(to_tsvector('simple', {table}.search_text), to_tsquery('simple', %s)) + "
+            "similarity(UPPER({table}.ear_tag::text), UPPER(%s)) + similarity(UPPER({table}.name::text), UPPER(%s)) + "
+            "CASE WHEN UPPER({table}.ear_tag::text) = UPPER(%s) THEN 1 ELSE 0 END")
+
+
+def get_search_terms(text):
+    return [term.lower() for term in TERM_RE.findall(text)]
+
+
+def search_animals(queryset, text):
+    """
+    Filters a queryset of animals down to those matching a search over their ear tag, name, breed, sire and dam.
+
+    On PostgreSQL the search text of each animal is matched against the words of the search as prefixes through its
+    full text GIN index, ear tags and names that are only close to the search through their trigram indexes, and the
+    animals are ranked with exact ear tags first. Other databases match each word anywhere in the search text.
+    """
+    terms = get_search_terms(text)
+    if not terms:
+        return queryset
+
+    if connections[queryset.db].vendor != 'postgresql':
+        for term in terms:
+            queryset = queryset.filter(search_text__contains=term)
+        return queryset
+
+    table = Animal._meta.db_table
+    tsquery = ' & '.join('%s:*' % term for term in terms)
+    text = text.strip()
+    where = '(%s OR %s)' % (MATCH_SQL.format(table=table), SIMILAR_SQL.format(table=table))
+    queryset = queryset.extra(select={'search_rank': RANK_SQL.format(table=table)},
+                              select_params=(tsquery, text, text, text),
+                              where=[where], params=(tsquery, text, text))
+    return queryset.order_by('-search_rank', '-id')
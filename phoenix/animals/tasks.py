@@ -0,0 +1,74 @@
+from __future__ import absolute_import
+from phoenix.taskapp.celery import app
+from phoenix.users.models import User
+from .lactation_curves import LactationCurves
+from .matings import MatingPlanner
+from .models import Animal, AnimalImport, LactationPeriod
+from .reproduction import ReproductiveCalendar
+
+
+@app.task(bind=True, max_retries=5, default_retry_delay=2)
+def import_animals(self, import_id):
+    try:
+        animal_import = AnimalImport.objects.get(pk=import_id)
+    except AnimalImport.DoesNotExist as e:
+        # the request that queued us may not have committed yet
+        raise self.retry(exc=e)
+
+    def report_progress(animal_import):
+        if self.request.id:
+            self.update_state(state='PROGRESS', meta=dict(rows_processed=animal_import.rows_processed,
+                                                          animals_created=animal_import.animals_created))
+
+    importer = animal_import.run(progress=report_progress)
+    return dict(rows_processed=importer.rows, animals_created=importer.created, errors=len(importer.errors))
+
+
+@app.task
+def plan_matings(farm_id):
+    farm = User.objects.get(pk=farm_id)
+    return MatingPlanner(farm).run()
+
+
+@app.task
+def plan_all_matings():
+    """
+    Ranks the sires for the cows of every farm again, run nightly so new sires, services and checks are taken in
+    """
+    farm_ids = list(Animal.objects.exclude(farm=None).order_by().values_list('farm', flat=True).distinct())
+    for farm_id in farm_ids:
+        plan_matings.delay(farm_id)
+    return len(farm_ids)
+
+
+@app.task
+def refresh_calendar(farm_id):
+    return ReproductiveCalendar(farm=farm_id).refresh()
+
+
+@app.task
+def refresh_calendars():
+    """
+    Works the due events of every farm out again, run nightly so heats move on with the days
+    """
+    farm_ids = list(Animal.objects.exclude(farm=None).order_by().values_list('farm', flat=True).distinct())
+    for farm_id in farm_ids:
+        refresh_calendar.delay(farm_id)
+    return len(farm_ids)
+
+
+@app.task
+def fit_lactation_curve(farm_id):
+    return LactationCurves(farm=farm_id).fit()
+
+
+@app.task
+def fit_lactation_curves():
+    """
+    Fits the lactations with new milk records since the last run, one task per farm so the workers share them
+    """
+    farm_ids = list(LactationPeriod.objects.filter(curve_stale=True).exclude(animal__farm=None).order_by()
+                    .values_list('animal__farm', flat=True).distinct())
+    for farm_id in farm_ids:
+        fit_lactation_curve.delay(farm_id)
+    return len(farm_ids)
@@ -1,31 +1,83 @@
 from django.test import TestCase
 from django.test.client import RequestFactory
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
 from model_mommy import mommy
 from phoenix.animals.models import Animal
-from phoenix.animals.fields import MultipleAnimalsField, BullField
+from phoenix.animals.fields import MultipleAnimalsField, BullField, ColorField
 
 
 class AnimalFieldTestCase(TestCase):
 
     def setUp(self):
-        self.dam = mommy.make('animals.Dam', name='dam')
-        self.sire = mommy.make('animals.Sire', name='sire')
-        self.animal = mommy.make('animals.Animal', ear_tag='tagie', name='tagie', sex=Animal.SEX_CHOICES.male)
+        cache.clear()
+        self.farm = mommy.make('users.User')
+        self.dam = mommy.make('animals.Dam', name='dam', created_by=self.farm)
+        self.sire = mommy.make('animals.Sire', name='sire', created_by=self.farm)
+        self.animal = mommy.make('animals.Animal', ear_tag='tagie', name='tagie', sex=Animal.SEX_CHOICES.male,
+                                 farm=self.farm)
         self.factory = RequestFactory()
 
-    def test_multiple_animal_field(self):
+    def get_request(self):
         request = self.factory.get(reverse('django_select2_central_json'))
-        # result looks like this: ('nil', False, [(1L, u'dam'), (2L, u'sire')])
-        results = MultipleAnimalsField().get_results(request, term='', page='1', context='')
-        res = [(animal.id, animal.name) for animal in Animal.objects.all()]
-        self.assertEqual(res, results[2])
-        # result looks like this: ('nil', False, [(1L, u'dam')])
-        results = MultipleAnimalsField().get_results(request, term='t', page='1', context='')
-        self.assertEqual([(1L, u'tagie')], results[2])
+        request.user = self.farm
+        return request
+
+    def test_multiple_animal_field(self):
+        other = mommy.make('animals.Animal', ear_tag='other', name='other', sex=Animal.SEX_CHOICES.male,
+                           farm=mommy.make('users.User'))
+        # result looks like this: ('nil', False, [(1L, u'tagie')])
+        results = MultipleAnimalsField().get_results(self.get_request(), term='', page='1', context='')
+        self.assertEqual(('nil', False, [(self.animal.id, u'tagie')]), results)
+        results = MultipleAnimalsField().get_results(self.get_request(), term='t', page='1', context='')
+        self.assertEqual([(self.animal.id, u'tagie')], results[2])
+        # animals of other farms are never offered
+        results = MultipleAnimalsField().get_results(self.get_request(), term='other', page='1', context='')
+        self.assertEqual([], results[2])
+        self.assertNotIn(other.id, [pk for pk, label in results[2]])
+
+    def test_animal_pages(self):
+        for number in range(30):
+            mommy.make('animals.Animal', ear_tag='KE-%02d' % number, name='Cow %02d' % number,
+                       sex=Animal.SEX_CHOICES.female, farm=self.farm)
+
+        err, more, results = MultipleAnimalsField().get_results(self.get_request(), term='cow', page=1, context='')
+        self.assertTrue(more)
+        self.assertEqual(['Cow %02d' % number for number in range(20)], [label for pk, label in results])
+        err, more, results = MultipleAnimalsField().get_results(self.get_request(), term='cow', page=2, context='')
+        self.assertFalse(more)
+        self.assertEqual(10, len(results))
+
+        # ear tags and the start of full names match too
+        err, more, results = MultipleAnimalsField().get_results(self.get_request(), term='ke-1', page=1, context='')
+        self.assertEqual(['Cow %02d' % number for number in range(10, 20)], [label for pk, label in results])
+        err, more, results = MultipleAnimalsField().get_results(self.get_request(), term='cow 2', page=1, context='')
+        self.assertEqual(['Cow %02d' % number for number in range(20, 30)], [label for pk, label in results])
+
+        # changes to the animals of the farm are picked up
+        animal = Animal.objects.get(ear_tag='KE-29')
+        animal.name = 'Daisy'
+        animal.save()
+        err, more, results = MultipleAnimalsField().get_results(self.get_request(), term='dai', page=1, context='')
+        self.assertEqual([(animal.id, 'Daisy')], results)
+        animal.delete()
+        err, more, results = MultipleAnimalsField().get_results(self.get_request(), term='dai', page=1, context='')
+        self.assertEqual([], results)
+
+    def test_first_page_cached(self):
+        MultipleAnimalsField().get_results(self.get_request(), term='', page=1, context='')
+        with self.assertNumQueries(0):
+            err, more, results = MultipleAnimalsField().get_results(self.get_request(), term='', page=1, context='')
+        self.assertEqual([(self.animal.id, u'tagie')], results)
 
     def test_sire_field(self):
-        request = self.factory.get(reverse('django_select2_central_json'))
-        # result looks like this: ('nil', False, [(4L, u'123', {})])
-        results = BullField().get_results(request, term='s', page='1', context='')
-        self.assertEqual((self.sire.id, self.sire.name, {}), results[2][0])
\ No newline at end of file
+        mommy.make('animals.Sire', name='someone elses', created_by=mommy.make('users.User'))
+        # result looks like this: ('nil', False, [(4L, u'sire')])
+        results = BullField().get_results(self.get_request(), term='s', page='1', context='')
+        self.assertEqual([(self.sire.id, self.sire.name)], results[2])
+
+    def test_color_field(self):
+        # colors are shared by every farm
+        black = mommy.make('animals.Color', name='Black', created_by=mommy.make('users.User'))
+        results = ColorField().get_results(self.get_request(), term='bl', page='1', context='')
+        self.assertEqual([(black.id, 'Black')], results[2])
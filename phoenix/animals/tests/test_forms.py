@@ -1,5 +1,6 @@
 from datetime import date
 from django.test import TestCase
+from model_mommy import mommy
 from phoenix.animals.forms import AnimalForm
 from phoenix.animals.models import Animal
 
@@ -19,3 +20,20 @@ class AnimalFormTestCase(TestCase):
         form = AnimalForm({})
         self.assertEqual(form.errors,
                          {'birth_date': [u'This field is required.'], 'name': [u'This field is required.'], 'ear_tag': [u'This field is required.'], 'sex': [u'This field is required.']})
+
+    def test_breed_choices(self):
+        jersey = mommy.make('animals.Breed', name='Jersey')
+        ayrshire = mommy.make('animals.Breed', name='Ayrshire')
+        # choices are served from the reference table of the process once loaded, in order of name
+        list(AnimalForm().fields['breed'].choices)
+        form = AnimalForm()
+        with self.assertNumQueries(0):
+            self.assertEqual([('', '---------'), (ayrshire.id, 'Ayrshire'), (jersey.id, 'Jersey')],
+                             list(form.fields['breed'].choices))
+
+        data = {'ear_tag': '102M', 'sex': Animal.SEX_CHOICES.female, 'birth_date': date.today(), 'name': 'sasa'}
+        form = AnimalForm(dict(data, breed=jersey.id))
+        self.assertTrue(form.is_valid())
+        self.assertEqual(jersey, form.cleaned_data['breed'])
+        form = AnimalForm(dict(data, breed=jersey.id + ayrshire.id))
+        self.assertIn('breed', form.errors)
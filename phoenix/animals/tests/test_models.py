@@ -1,7 +1,26 @@
+import numpy as np
 import pytest
-from django.test import TestCase
+from StringIO import StringIO
+from datetime import date, timedelta
+from decimal import Decimal
+from django.db import DatabaseError
+from django.test import TestCase, TransactionTestCase, RequestFactory
+from django.core.management import call_command
+from django.core.files.base import ContentFile
+from django.core.cache import cache
 from model_mommy import mommy
-from phoenix.animals.models import Animal, Dam, Sire
+from phoenix.animals import autocomplete
+from phoenix.animals.fertility import FertilityEngine
+from phoenix.animals.fields import AutocompleteFieldMixin
+from phoenix.animals.genetics import InbreedingEngine
+from phoenix.animals.imports import HerdImporter, read_rows
+from phoenix.animals.lactation_curves import LactationCurves, fit_curves
+from phoenix.animals.matings import MatingPlanner
+from phoenix.animals.milk_series import get_series
+from phoenix.animals.models import (Animal, AnimalImport, AnimalStats, Breed, Dam, Sire, PregnancyCheck, MilkProduction,
+                                    MilkRollup, MatingRecommendation, Pedigree, DueEvent, LactationPeriod,
+                                    MilkStats, MilkAlert)
+from phoenix.animals.reproduction import ReproductiveCalendar
 from phoenix.utils import test_utils
 
 pytestmark = pytest.mark.django_db
@@ -31,3 +50,702 @@ class AnimalTestCase(TestCase):
         self.dam.save()
         self.assertEqual('disposed', self.dam.state)
 
+    def test_search_text(self):
+        breed = mommy.make('animals.Breed', name='Friesian')
+        sire = mommy.make('animals.Sire', name='Bull')
+        animal = mommy.make('animals.Animal', ear_tag='KE-201', name='Daisy', breed=breed, sire=sire,
+                            sex=Animal.SEX_CHOICES.female)
+        self.assertEqual('ke-201 daisy friesian bull', animal.search_text)
+
+        animal.name = 'Bella'
+        animal.save(update_fields=['name'])
+        self.assertEqual('ke-201 bella friesian bull', Animal.objects.get(pk=animal.pk).search_text)
+
+        # renaming the breed or sire of animals changes what they're found by
+        breed.name = 'Holstein'
+        breed.save()
+        sire.name = 'Samson'
+        sire.save()
+        self.assertEqual('ke-201 bella holstein samson', Animal.objects.get(pk=animal.pk).search_text)
+
+        # saving them without a rename doesn't go through their animals
+        Animal.objects.filter(pk=animal.pk).update(search_text='')
+        breed.save()
+        sire.save()
+        self.assertEqual('', Animal.objects.get(pk=animal.pk).search_text)
+
+
+class AnimalStatsTestCase(TestCase):
+    def setUp(self):
+        self.cow = mommy.make('animals.Animal', ear_tag='789', name='cow', sex=Animal.SEX_CHOICES.female)
+        self.bull = mommy.make('animals.Sire', name='bull')
+
+    def test_no_services(self):
+        self.assertEqual('', self.cow.date_of_first_service)
+        self.assertEqual(0, self.cow.number_of_services)
+        self.assertEqual(0, self.cow.number_of_successful_services)
+        self.assertEqual(0, self.cow.number_of_failed_services)
+
+    def test_recording(self):
+        self.assertTrue(AnimalStats.objects.filter(animal=self.cow).exists())
+        first = mommy.make('animals.Service', animal=self.cow, sire=self.bull, date=date(2015, 3, 1))
+        check = mommy.make('animals.PregnancyCheck', animal=self.cow, service=first, result=PregnancyCheck.RESULT_CHOICES.open)
+        second = mommy.make('animals.Service', animal=self.cow, sire=self.bull, date=date(2015, 4, 1))
+        mommy.make('animals.PregnancyCheck', animal=self.cow, service=second, result=PregnancyCheck.RESULT_CHOICES.pregnant)
+
+        cow = Animal.objects.get(pk=self.cow.pk)
+        self.assertEqual(date(2015, 3, 1), cow.date_of_first_service)
+        self.assertEqual(2, cow.number_of_services)
+        self.assertEqual(1, cow.number_of_successful_services)
+        self.assertEqual(1, cow.number_of_failed_services)
+
+        # edits and deletes count her again
+        first.date = date(2015, 5, 1)
+        first.save()
+        check.delete()
+        cow = Animal.objects.get(pk=self.cow.pk)
+        self.assertEqual(date(2015, 4, 1), cow.date_of_first_service)
+        self.assertEqual(0, cow.number_of_failed_services)
+
+    def test_rebuild(self):
+        service = mommy.make('animals.Service', animal=self.cow, sire=self.bull, date=date(2015, 3, 1))
+        mommy.make('animals.PregnancyCheck', animal=self.cow, service=service, result=PregnancyCheck.RESULT_CHOICES.pregnant)
+        mommy.make('animals.PregnancyCheck', animal=self.cow, result=PregnancyCheck.RESULT_CHOICES.open)
+
+        call_command('rebuild_animal_stats')
+
+        stats = AnimalStats.objects.get(animal=self.cow)
+        self.assertEqual(date(2015, 3, 1), stats.date_of_first_service)
+        self.assertEqual(1, stats.number_of_services)
+        self.assertEqual(1, stats.number_of_successful_services)
+        self.assertEqual(0, stats.number_of_failed_services)
+
+
+class MilkTestMixin(object):
+    """
+    A cow on a farm, for the tests of what is kept from her milk records
+    """
+    def setUp(self):
+        super(MilkTestMixin, self).setUp()
+        self.farm = mommy.make('users.User')
+        self.cow = mommy.make('animals.Animal', ear_tag='789', name='cow', sex=Animal.SEX_CHOICES.female, farm=self.farm)
+
+    def make_milk(self, day, amount, butterfat=None, time=MilkProduction.TIME_CHOICES.am):
+        return mommy.make('animals.MilkProduction', animal=self.cow, date=day, time=time, amount=amount,
+                          butterfat=butterfat)
+
+
+class MilkRollupTestCase(MilkTestMixin, TestCase):
+    def test_rollups(self):
+        self.make_milk(date(2015, 11, 2), 10, butterfat=Decimal('3.5'))
+        evening = self.make_milk(date(2015, 11, 2), 8, time=MilkProduction.TIME_CHOICES.pm)
+        self.make_milk(date(2015, 12, 1), 12, butterfat=Decimal('4.5'))
+
+        self.assertEqual(Decimal(30), self.cow.all_time_production)
+        self.assertEqual(Decimal(30), MilkProduction.get_farm_production(self.farm))
+        self.assertEqual(Decimal(18), MilkProduction.get_farm_production(self.farm, MilkRollup.PERIOD_CHOICES.day, date(2015, 11, 2)))
+
+        month = self.cow.milk_rollups.get(period=MilkRollup.PERIOD_CHOICES.month, start_date=date(2015, 11, 1))
+        self.assertEqual(Decimal(18), month.amount)
+        self.assertEqual(2, month.count)
+        self.assertEqual(Decimal('3.5'), month.mean_butterfat)
+
+        # week of the 2nd starts on Sunday the 1st
+        self.assertEqual([(date(2015, 11, 1), Decimal(18)), (date(2015, 11, 29), Decimal(12))],
+                         MilkProduction.get_graph_data(self.cow))
+
+        # updates move the amount, deletes remove it
+        evening.amount = 5
+        evening.save()
+        self.assertEqual(Decimal(27), self.cow.all_time_production)
+        evening.delete()
+        self.assertEqual(Decimal(22), self.cow.all_time_production)
+        self.assertEqual(Decimal(22), MilkProduction.get_farm_production(self.farm))
+
+    def test_rebuild(self):
+        self.make_milk(date(2015, 11, 2), 10)
+        self.make_milk(date(2015, 11, 3), 8)
+        self.cow.milk_rollups.all().delete()
+
+        call_command('rebuild_milk_rollups')
+        self.assertEqual(Decimal(18), self.cow.all_time_production)
+        self.assertEqual(Decimal(18), MilkProduction.get_farm_production(self.farm))
+
+
+class MilkSeriesTestCase(MilkTestMixin, TestCase):
+    def test_series(self):
+        self.make_milk(date(2015, 11, 2), 8, time=MilkProduction.TIME_CHOICES.pm)
+        self.make_milk(date(2015, 11, 2), 10, butterfat=Decimal('3.5'))
+        self.make_milk(date(2015, 11, 1), 9)
+
+        with self.assertNumQueries(1):
+            series = get_series([self.cow.id])[self.cow.id]
+        self.assertEqual(3 * 13, series.nbytes)
+        self.assertEqual([date(2015, 11, 1).toordinal()] + [date(2015, 11, 2).toordinal()] * 2, list(series['date']))
+        self.assertEqual([0, 0, 1], list(series['time']))
+        self.assertEqual([9, 10, 8], list(series['amount']))
+        self.assertAlmostEqual(3.5, series['butterfat'][1], places=5)
+        self.assertTrue(np.isnan(series['butterfat'][2]))
+
+        # an animal without records has an empty series
+        self.assertEqual(0, len(get_series([self.cow.id + 1000])[self.cow.id + 1000]))
+
+
+class MilkStatsTestCase(MilkTestMixin, TestCase):
+    def setUp(self):
+        super(MilkStatsTestCase, self).setUp()
+        self.start = date(2015, 11, 1)
+
+    def make_milk(self, day, amount, time=MilkProduction.TIME_CHOICES.am):
+        # days are counted from the start
+        return super(MilkStatsTestCase, self).make_milk(self.start + timedelta(day), amount, time=time)
+
+    def test_alerts(self):
+        amounts = [10, 11, 10, 9, 10, 11, 10, 9, 10, 11]
+        for day, amount in enumerate(amounts):
+            self.make_milk(day, amount)
+        # the evenings are kept apart from the mornings
+        self.make_milk(0, 4, time=MilkProduction.TIME_CHOICES.pm)
+
+        stats = MilkStats.objects.get(animal=self.cow, time=MilkProduction.TIME_CHOICES.am)
+        self.assertEqual(10, stats.count)
+        self.assertAlmostEqual(np.mean(amounts), stats.mean)
+        self.assertAlmostEqual(np.std(amounts, ddof=1), stats.std)
+        self.assertEqual(1, MilkStats.objects.get(animal=self.cow, time=MilkProduction.TIME_CHOICES.pm).count)
+
+        self.make_milk(10, Decimal('9.5'))
+        self.assertFalse(MilkAlert.objects.exists())
+        self.make_milk(11, 5)
+        alert = MilkAlert.objects.get()
+        self.assertEqual((self.cow, self.farm, self.start + timedelta(11), Decimal(5)),
+                         (alert.animal, alert.farm, alert.date, alert.amount))
+        self.assertLess(alert.z_score, -3)
+
+        # a whole session is taken in with the same result
+        other = mommy.make('animals.Animal', ear_tag='790', sex=Animal.SEX_CHOICES.female, farm=self.farm)
+        MilkProduction.record_session(self.start + timedelta(12), MilkProduction.TIME_CHOICES.am,
+                                      [MilkProduction(animal=self.cow, amount=4), MilkProduction(animal=other, amount=9)],
+                                      self.farm)
+        self.assertEqual(2, MilkAlert.objects.filter(farm=self.farm).count())
+        self.assertEqual(13, MilkStats.objects.get(animal=self.cow, time=MilkProduction.TIME_CHOICES.am).count)
+        self.assertEqual(1, MilkStats.objects.get(animal=other).count)
+
+        stats = MilkStats.objects.get(animal=self.cow, time=MilkProduction.TIME_CHOICES.am)
+        MilkStats.rebuild()
+        rebuilt = MilkStats.objects.get(animal=self.cow, time=MilkProduction.TIME_CHOICES.am)
+        self.assertEqual(stats.count, rebuilt.count)
+        self.assertAlmostEqual(stats.mean, rebuilt.mean)
+        self.assertAlmostEqual(stats.ewma, rebuilt.ewma)
+
+
+class LactationTestCase(MilkTestMixin, TestCase):
+    def make_calf(self):
+        return mommy.make('animals.Animal', sex=Animal.SEX_CHOICES.female, farm=self.farm)
+
+    def test_calving(self):
+        first = LactationPeriod.record_calving(self.cow, self.make_calf(), date(2015, 1, 1), self.farm)
+        self.assertEqual('lactating', Animal.objects.get(pk=self.cow.pk).state)
+
+        # a twin born the next day joins the same lactation
+        twin = LactationPeriod.record_calving(self.cow, self.make_calf(), date(2015, 1, 2), self.farm)
+        self.assertEqual(first, twin)
+        self.assertEqual(2, first.calves.count())
+
+        # the next calving closes the lactation she was still in
+        second = LactationPeriod.record_calving(self.cow, self.make_calf(), date(2016, 1, 1), self.farm)
+        self.assertEqual(date(2015, 12, 31), LactationPeriod.objects.get(pk=first.pk).end_date)
+        self.assertIsNone(second.end_date)
+
+        second.dry_off(date(2016, 9, 1), self.farm)
+        self.assertEqual('open', Animal.objects.get(pk=self.cow.pk).state)
+
+    def test_backdated_calving(self):
+        current = LactationPeriod.record_calving(self.cow, self.make_calf(), date(2016, 1, 1), self.farm)
+
+        # a calving entered late closes before the lactation she is in now, which stays open
+        earlier = LactationPeriod.record_calving(self.cow, self.make_calf(), date(2015, 1, 1), self.farm)
+        self.assertEqual(date(2015, 12, 31), earlier.end_date)
+        self.assertIsNone(LactationPeriod.objects.get(pk=current.pk).end_date)
+        self.assertEqual(1, LactationPeriod.objects.filter(animal=self.cow, end_date=None).count())
+        self.assertEqual('lactating', Animal.objects.get(pk=self.cow.pk).state)
+
+    def test_yields(self):
+        lactation = LactationPeriod.record_calving(self.cow, self.make_calf(), date(2015, 1, 1), self.farm)
+        before = self.make_milk(date(2014, 12, 1), 4)
+        self.assertIsNone(before.lactation)
+
+        morning = self.make_milk(date(2015, 1, 11), 10, butterfat=Decimal('3.5'))
+        self.assertEqual(lactation, morning.lactation)
+        self.assertEqual(10, morning.days_in_milk)
+        self.make_milk(date(2015, 1, 11), 8, butterfat=Decimal('4.5'), time=MilkProduction.TIME_CHOICES.pm)
+        late = self.make_milk(date(2015, 11, 20), 6)
+
+        lactation = LactationPeriod.objects.get(pk=lactation.pk)
+        self.assertEqual(Decimal(24), lactation.total_yield)
+        # only the first 305 days count towards the standard yield
+        self.assertEqual(Decimal(18), lactation.standard_yield)
+        self.assertEqual(Decimal(18), lactation.peak_yield)
+        self.assertEqual(Decimal(4), lactation.mean_butterfat)
+        self.assertEqual(3, lactation.count)
+
+        # lowering the peak day finds the peak again
+        morning.amount = 2
+        morning.save()
+        lactation = LactationPeriod.objects.get(pk=lactation.pk)
+        self.assertEqual(Decimal(16), lactation.total_yield)
+        self.assertEqual(Decimal(10), lactation.peak_yield)
+        late.delete()
+        lactation = LactationPeriod.objects.get(pk=lactation.pk)
+        self.assertEqual(Decimal(10), lactation.total_yield)
+        self.assertEqual(2, lactation.count)
+
+        # records already there are linked to a lactation added later on
+        earlier = mommy.make('animals.LactationPeriod', animal=self.cow, start_date=date(2014, 11, 1),
+                             end_date=date(2014, 12, 31))
+        earlier = LactationPeriod.objects.get(pk=earlier.pk)
+        self.assertEqual(Decimal(4), earlier.total_yield)
+        self.assertEqual(earlier, MilkProduction.objects.get(pk=before.pk).lactation)
+
+
+class LactationCurvesTestCase(TestCase):
+    def setUp(self):
+        self.farm = mommy.make('users.User')
+        self.cow = mommy.make('animals.Animal', ear_tag='789', name='cow', sex=Animal.SEX_CHOICES.female, farm=self.farm)
+        calf = mommy.make('animals.Animal', sex=Animal.SEX_CHOICES.female, farm=self.farm)
+        self.lactation = LactationPeriod.record_calving(self.cow, calf, date(2015, 1, 1), self.farm)
+
+    def wood(self, t, a=20.0, b=0.2, c=0.004):
+        return a * t ** b * np.exp(-c * t)
+
+    def test_fit_curves(self):
+        # two lactations on a curve each and one with too few days to fit
+        days = np.array([1, 10, 30, 60, 90, 150, 200] * 2 + [1, 2], dtype=np.int64)
+        index = np.array([0] * 7 + [1] * 7 + [2] * 2, dtype=np.int64)
+        yields = np.concatenate([self.wood(days[:7]), self.wood(days[7:14], a=15, b=0.1, c=0.002), [5, 6]])
+
+        a, b, c = fit_curves(index, days, yields, 3)
+        np.testing.assert_allclose([20, 15], a[:2])
+        np.testing.assert_allclose([0.2, 0.1], b[:2])
+        np.testing.assert_allclose([0.004, 0.002], c[:2])
+        self.assertTrue(np.isnan(a[2]))
+
+    def test_fit(self):
+        for day in range(1, 100, 7):
+            mommy.make('animals.MilkProduction', animal=self.cow, date=date(2015, 1, 1) + timedelta(day - 1),
+                       time=MilkProduction.TIME_CHOICES.am, amount=Decimal('%.2f' % self.wood(day)))
+        self.assertTrue(LactationPeriod.objects.get(pk=self.lactation.pk).curve_stale)
+
+        self.assertEqual(1, LactationCurves(farm=self.farm).fit())
+        lactation = LactationPeriod.objects.get(pk=self.lactation.pk)
+        self.assertFalse(lactation.curve_stale)
+        self.assertAlmostEqual(0.2, lactation.curve_b, places=2)
+        self.assertAlmostEqual(0.004, lactation.curve_c, places=3)
+        expected = self.wood(np.arange(1, 306)).sum()
+        self.assertAlmostEqual(1, float(lactation.projected_yield) / expected, places=2)
+        self.assertAlmostEqual(-1.2 * np.log(0.004), lactation.persistency, places=1)
+
+        # only lactations with new records are fitted again
+        self.assertEqual(0, LactationCurves(farm=self.farm).fit())
+        mommy.make('animals.MilkProduction', animal=self.cow, date=date(2015, 5, 1), time=MilkProduction.TIME_CHOICES.am,
+                   amount=20)
+        self.assertEqual(1, LactationCurves(farm=self.farm).fit())
+
+
+class AnimalImportTestCase(TestCase):
+    CSV = ('ear_tag,name,sex,breed,sire,dam,birth_date,birth_weight\n'
+           '100,Daisy,female,Friesian,Bull,Mama,2014-01-02,30\n'
+           '101,Rocky,Male,friesian,Bull,,,\n'
+           '102,Bella,female,Ayrshire,,,02/01/2014,\n'
+           ',Nameless,female,,,,,\n'
+           '100,Again,female,,,,,\n'
+           '103,Molly,female,,,Mama,,x\n'
+           '104,Rose,female,Ayrshire,,,,\n')
+
+    def setUp(self):
+        self.farm = mommy.make('users.User')
+        mommy.make('animals.Animal', ear_tag='1', name='Mama', sex=Animal.SEX_CHOICES.female, farm=self.farm)
+        mommy.make('animals.Breed', name='Friesian')
+
+    def test_importer(self):
+        importer = HerdImporter(self.farm, self.farm, batch_size=2)
+        importer.run(read_rows(StringIO(self.CSV), 'herd.csv'))
+
+        self.assertEqual(7, importer.rows)
+        self.assertEqual(3, importer.created)
+        self.assertEqual([4, 5, 6, 7], [row for row, message in importer.errors])
+
+        daisy = Animal.objects.get(farm=self.farm, ear_tag='100')
+        self.assertEqual(date(2014, 1, 2), daisy.birth_date)
+        self.assertEqual(30, daisy.birth_weight)
+        self.assertEqual('Bull', daisy.sire.name)
+        self.assertEqual(daisy.sire, Animal.objects.get(ear_tag='101').sire)
+        self.assertEqual('male', Animal.objects.get(ear_tag='101').sex)
+
+        # breeds are matched regardless of case and new ones are created once
+        self.assertEqual(1, Breed.objects.filter(name__iexact='friesian').count())
+        self.assertEqual(1, Breed.objects.filter(name='Ayrshire').count())
+
+        # females get their dam record, the same as animals created one at a time
+        self.assertTrue(Dam.objects.filter(animal=daisy, name='Daisy').exists())
+        self.assertFalse(Dam.objects.filter(animal__ear_tag='101').exists())
+        self.assertEqual([daisy], list(Animal.objects.filter(ear_tag='1').first().get_offspring()))
+        self.assertEqual('100 daisy friesian bull mama', daisy.search_text)
+
+    def test_failed_batch(self):
+        class FailingImporter(HerdImporter):
+            failed = False
+
+            def build_pedigree(self, animal_ids):
+                if not self.failed:
+                    self.failed = True
+                    raise DatabaseError('batch failed')
+                super(FailingImporter, self).build_pedigree(animal_ids)
+
+        importer = FailingImporter(self.farm, self.farm, batch_size=2)
+        importer.run(read_rows(StringIO(self.CSV), 'herd.csv'))
+        self.assertIsNone(importer.errors[0][0])
+        self.assertFalse(Animal.objects.filter(name__in=['Daisy', 'Rocky']).exists())
+
+        # the sire first named by the failed batch was rolled back with it rather than left behind
+        self.assertFalse(Sire.objects.filter(name='Bull').exists())
+        self.assertNotIn('bull', importer.lookups[Sire])
+
+        # its ear tags are free again for the later batch, which creates its own new breed
+        self.assertEqual(2, importer.created)
+        self.assertEqual('Again', Animal.objects.get(farm=self.farm, ear_tag='100').name)
+        self.assertEqual(Breed.objects.get(name='Ayrshire'), Animal.objects.get(ear_tag='104').breed)
+
+    def test_run(self):
+        animal_import = AnimalImport.objects.create(farm=self.farm, created_by=self.farm, modified_by=self.farm,
+                                                    file=ContentFile(self.CSV, name='herd.csv'))
+        animal_import.run()
+
+        animal_import = AnimalImport.objects.get(pk=animal_import.pk)
+        self.assertEqual(AnimalImport.STATUS_CHOICES.complete, animal_import.status)
+        self.assertEqual(7, animal_import.rows_processed)
+        self.assertEqual(3, animal_import.animals_created)
+        self.assertEqual("row 5: Ear tag is required", animal_import.get_errors()[1])
+        animal_import.file.delete()
+
+
+class PedigreeTestCase(TestCase):
+    def setUp(self):
+        self.granddam = mommy.make('animals.Animal', ear_tag='1', name='granddam', sex=Animal.SEX_CHOICES.female)
+        self.bull = mommy.make('animals.Animal', ear_tag='2', name='bull', sex=Animal.SEX_CHOICES.male)
+        self.sire = mommy.make('animals.Sire', name='bull', animal=self.bull)
+        self.dam = self.make_calf('3', 'dam', Animal.SEX_CHOICES.female, dam=self.granddam)
+        self.calf = self.make_calf('4', 'calf', Animal.SEX_CHOICES.male, sire=self.sire, dam=self.dam)
+
+    def make_calf(self, ear_tag, name, sex, sire=None, dam=None):
+        dam = Dam.objects.filter(animal=dam).first() if dam else None
+        return mommy.make('animals.Animal', ear_tag=ear_tag, name=name, sex=sex, sire=sire, dam=dam)
+
+    def test_links(self):
+        self.assertEqual([self.dam], list(self.granddam.get_offspring()))
+        self.assertEqual(set([self.dam, self.calf]), set(self.granddam.get_descendants()))
+        self.assertEqual([self.calf], list(self.bull.get_offspring()))
+        self.assertEqual([(self.dam, 1), (self.bull, 1), (self.granddam, 2)],
+                         [(link.ancestor, link.depth) for link in self.calf.get_pedigree()])
+        self.assertEqual([(self.dam, 1)], [(link.ancestor, link.depth) for link in self.calf.get_pedigree(generations=1)
+                                           if link.ancestor.sex == Animal.SEX_CHOICES.female])
+
+    def test_relink(self):
+        other = mommy.make('animals.Animal', ear_tag='5', name='other', sex=Animal.SEX_CHOICES.female)
+        self.dam.dam = Dam.objects.filter(animal=other).first()
+        self.dam.save()
+
+        self.assertEqual([], list(self.granddam.get_descendants()))
+        self.assertEqual(set([self.dam, self.calf]), set(other.get_descendants()))
+
+        # renaming the sire leaves the links of its offspring alone
+        links = set(Pedigree.objects.values_list('id', flat=True))
+        self.sire.name = 'samson'
+        self.sire.save()
+        self.assertEqual(links, set(Pedigree.objects.values_list('id', flat=True)))
+
+        # linking the sire to another animal moves its offspring
+        self.sire.animal = other
+        self.sire.save()
+        self.assertEqual([], list(self.bull.get_offspring()))
+        self.assertEqual(2, other.get_offspring().count())
+
+    def test_rebuild(self):
+        expected = set(Pedigree.objects.values_list('ancestor', 'descendant', 'depth'))
+        Pedigree.objects.all().delete()
+        call_command('rebuild_pedigree')
+        self.assertEqual(expected, set(Pedigree.objects.values_list('ancestor', 'descendant', 'depth')))
+        self.assertEqual(8, len(expected))
+
+
+class InbreedingEngineTestCase(TestCase):
+    def tearDown(self):
+        cache.clear()
+
+    def test_coefficients(self):
+        # 3 and 4 are full sibs, 5 is their calf, 6 is from a sire on his own daughter and 10 from half sibs
+        parents = {1: (None, None), 2: (None, None), 3: (1, 2), 4: (1, 2), 5: (3, 4), 6: (1, 3), 8: (1, 9),
+                   9: (None, None), 10: (8, 4), 11: (5, 6)}
+        engine = InbreedingEngine.from_parents(parents)
+
+        self.assertEqual({1: 0, 2: 0, 3: 0, 4: 0, 5: 0.25, 6: 0.25, 8: 0, 9: 0, 10: 0.125, 11: 0.3125},
+                         engine.coefficients())
+        self.assertEqual(0.5, engine.relationship(3, 4))
+        self.assertEqual(0.25, engine.relationship(8, 4))
+        self.assertEqual(1.25, engine.relationship(5, 5))
+        self.assertIsNone(engine.relationship(5, 99))
+        self.assertEqual({4: 0.5, 1: 0.5}, engine.relationships(3, [4, 1, 99]))
+
+        engine.append(12, 3, 4)
+        self.assertEqual(0.25, engine.coefficient(12))
+
+    def test_farm_cache(self):
+        farm = mommy.make('users.User')
+        bull = mommy.make('animals.Animal', ear_tag='1', name='bull', sex=Animal.SEX_CHOICES.male, farm=farm)
+        sire = mommy.make('animals.Sire', name='bull', animal=bull)
+        cow = mommy.make('animals.Animal', ear_tag='2', name='cow', sex=Animal.SEX_CHOICES.female, farm=farm)
+        heifer = mommy.make('animals.Animal', ear_tag='3', name='heifer', sex=Animal.SEX_CHOICES.female, farm=farm,
+                            sire=sire, dam=Dam.objects.filter(animal=cow).first())
+        self.assertEqual(0, InbreedingEngine.for_farm(farm).coefficient(heifer.id))
+
+        # a calf is appended to the cached engine rather than starting it over
+        calf = mommy.make('animals.Animal', ear_tag='4', name='calf', sex=Animal.SEX_CHOICES.male, farm=farm,
+                          sire=sire, dam=Dam.objects.filter(animal=heifer).first())
+        with self.assertNumQueries(1):
+            engine = InbreedingEngine.for_farm(farm)
+        self.assertEqual(0.25, engine.coefficient(calf.id))
+        self.assertEqual(calf.id, engine.ids[-1])
+        self.assertEqual(calf.id, cache.get('inbreeding:%d' % farm.id).ids[-1])
+
+        # as does an engine cached without one of the animals it is asked about
+        cache.set('inbreeding:%d' % farm.id, InbreedingEngine.from_parents({bull.id: (None, None)}))
+        self.assertEqual(0.25, InbreedingEngine.for_farm(farm, [calf.id]).coefficient(calf.id))
+
+        # a change of parents starts over
+        calf.sire = None
+        calf.save()
+        self.assertIsNone(cache.get('inbreeding:%d' % farm.id))
+        self.assertEqual(0, InbreedingEngine.for_farm(farm).coefficient(calf.id))
+
+
+class MatingPlannerMixin(object):
+    def setUp(self):
+        self.farm = mommy.make('users.User')
+        self.bull = mommy.make('animals.Animal', ear_tag='1', name='bull', sex=Animal.SEX_CHOICES.male, farm=self.farm)
+        self.herd_sire = mommy.make('animals.Sire', name='herd sire', animal=self.bull)
+        self.proven = mommy.make('animals.Sire', name='proven', created_by=self.farm)
+        self.unproven = mommy.make('animals.Sire', name='unproven', created_by=self.farm)
+        # another farm's bull that this one can't pick
+        mommy.make('animals.Sire', name='stranger', created_by=mommy.make('users.User'))
+        self.cow = mommy.make('animals.Animal', ear_tag='2', name='cow', sex=Animal.SEX_CHOICES.female, farm=self.farm)
+        self.heifer = mommy.make('animals.Animal', ear_tag='3', name='heifer', sex=Animal.SEX_CHOICES.female,
+                                 farm=self.farm, sire=self.herd_sire)
+        mommy.make('animals.Animal', ear_tag='4', name='pregnant', sex=Animal.SEX_CHOICES.female, farm=self.farm,
+                   state='pregnant')
+
+        for result in (PregnancyCheck.RESULT_CHOICES.pregnant, PregnancyCheck.RESULT_CHOICES.pregnant,
+                       PregnancyCheck.RESULT_CHOICES.open):
+            service = mommy.make('animals.Service', animal=self.cow, sire=self.proven)
+            mommy.make('animals.PregnancyCheck', animal=self.cow, service=service, result=result)
+
+    def tearDown(self):
+        cache.clear()
+
+
+class MatingPlannerTestCase(MatingPlannerMixin, TestCase):
+    def test_run(self):
+        self.assertEqual(2, MatingPlanner(self.farm, processes=1).run())
+
+        recommendations = MatingRecommendation.objects.filter(animal=self.cow)
+        self.assertEqual([self.proven, self.herd_sire, self.unproven], [r.sire for r in recommendations])
+        self.assertEqual(0.6, recommendations[0].conception_rate)
+        self.assertEqual(0.5, recommendations[1].conception_rate)
+
+        # the heifer's own sire goes last whatever his record
+        recommendations = MatingRecommendation.objects.filter(animal=self.heifer)
+        self.assertEqual([self.proven, self.unproven, self.herd_sire], [r.sire for r in recommendations])
+        self.assertEqual(0.25, recommendations[2].expected_inbreeding)
+
+
+class MatingPlannerPoolTestCase(MatingPlannerMixin, TransactionTestCase):
+    """
+    Outside of a transaction, where the cows are ranked across a pool of processes
+    """
+    def test_pool(self):
+        self.assertEqual(2, MatingPlanner(self.farm, processes=2, chunk_size=1).run())
+
+        recommendations = MatingRecommendation.objects.filter(animal=self.cow)
+        self.assertEqual([self.proven, self.herd_sire, self.unproven], [r.sire for r in recommendations])
+        recommendations = MatingRecommendation.objects.filter(animal=self.heifer)
+        self.assertEqual([self.proven, self.unproven, self.herd_sire], [r.sire for r in recommendations])
+        self.assertEqual(0.25, recommendations[2].expected_inbreeding)
+
+
+class ReproductiveCalendarTestCase(TestCase):
+    def setUp(self):
+        self.farm = mommy.make('users.User')
+        self.today = date(2015, 11, 2)
+        self.sire = mommy.make('animals.Sire', name='sire')
+
+    def make_cow(self, name, **kwargs):
+        return mommy.make('animals.Animal', ear_tag=name, name=name, sex=Animal.SEX_CHOICES.female, farm=self.farm,
+                          **kwargs)
+
+    def serve(self, cow, days_ago):
+        return mommy.make('animals.Service', animal=cow, sire=self.sire, date=self.today - timedelta(days_ago))
+
+    def check(self, service, days_ago, result):
+        return mommy.make('animals.PregnancyCheck', animal=service.animal, service=service, result=result,
+                          date=self.today - timedelta(days_ago))
+
+    def get_events(self, cow):
+        return dict(DueEvent.objects.filter(animal=cow).values_list('event', 'date'))
+
+    def test_refresh(self):
+        served = self.make_cow('served')
+        self.serve(served, 10)
+        pregnant = self.make_cow('pregnant')
+        self.check(self.serve(pregnant, 100), 50, PregnancyCheck.RESULT_CHOICES.pregnant)
+        empty = self.make_cow('empty')
+        self.check(self.serve(empty, 50), 5, PregnancyCheck.RESULT_CHOICES.open)
+        calved = self.make_cow('calved')
+        self.serve(calved, 400)
+        mommy.make('animals.LactationPeriod', animal=calved, start_date=self.today - timedelta(100))
+        heifer = self.make_cow('heifer')
+        mommy.make('animals.Animal', ear_tag='bull', name='bull', sex=Animal.SEX_CHOICES.male, farm=self.farm)
+
+        self.assertEqual(6, ReproductiveCalendar(self.farm, today=self.today).refresh())
+        self.assertEqual({'pregnancy_check': self.today + timedelta(35), 'heat': self.today + timedelta(11)},
+                         self.get_events(served))
+        self.assertEqual({'calving': self.today + timedelta(183), 'dry_off': self.today + timedelta(123)},
+                         self.get_events(pregnant))
+        # back in heat on the next cycle after the service that failed
+        self.assertEqual({'heat': self.today + timedelta(13)}, self.get_events(empty))
+        # the service before the calving is done with, her first heat after it is long past so the next is due
+        self.assertEqual({'heat': self.today + timedelta(13)}, self.get_events(calved))
+        self.assertEqual({}, self.get_events(heifer))
+
+        # what's due this week is a range of the farm's events
+        due = DueEvent.objects.filter(farm=self.farm, date__range=(self.today, self.today + timedelta(13)))
+        self.assertEqual([('heat', served), ('heat', empty), ('heat', calved)], [(e.event, e.animal) for e in due])
+
+    def test_patched(self):
+        cow = self.make_cow('cow')
+        service = self.serve(cow, 30)
+        # each service or check works the cow's events out again
+        self.assertEqual(set(['heat', 'pregnancy_check']), set(self.get_events(cow)))
+        self.check(service, 0, PregnancyCheck.RESULT_CHOICES.pregnant)
+        self.assertEqual(set(['calving', 'dry_off']), set(self.get_events(cow)))
+        service.pregnancy_checks.all().delete()
+        self.assertEqual(set(['heat', 'pregnancy_check']), set(self.get_events(cow)))
+
+        cow.disposed()
+        cow.save()
+        ReproductiveCalendar(self.farm).refresh()
+        self.assertFalse(DueEvent.objects.exists())
+
+        # deleting a cow deletes her services and checks without her events being worked out again
+        other = self.make_cow('other')
+        self.serve(other, 3)
+        other.delete()
+        self.assertFalse(DueEvent.objects.exists())
+
+
+class FertilityEngineTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.farm = mommy.make('users.User')
+        self.proven = mommy.make('animals.Sire', name='proven')
+        self.young = mommy.make('animals.Sire', name='young')
+        self.daisy = mommy.make('animals.Animal', ear_tag='1', name='daisy', sex=Animal.SEX_CHOICES.female,
+                                farm=self.farm, birth_date=date(2010, 1, 1))
+        self.bella = mommy.make('animals.Animal', ear_tag='2', name='bella', sex=Animal.SEX_CHOICES.female,
+                                farm=self.farm)
+
+        # daisy calves, takes two services to conceive again and calves a year after
+        mommy.make('animals.LactationPeriod', animal=self.daisy, start_date=date(2012, 1, 1))
+        self.serve(self.daisy, self.young, date(2012, 3, 1), PregnancyCheck.RESULT_CHOICES.open)
+        self.serve(self.daisy, self.proven, date(2012, 3, 22), PregnancyCheck.RESULT_CHOICES.pregnant)
+        mommy.make('animals.LactationPeriod', animal=self.daisy, start_date=date(2012, 12, 31))
+        # bella conceives on her first, the second is unchecked
+        self.serve(self.bella, self.proven, date(2012, 6, 1), PregnancyCheck.RESULT_CHOICES.pregnant)
+        self.serve(self.bella, self.young, date(2013, 6, 1))
+
+    def tearDown(self):
+        cache.clear()
+
+    def serve(self, animal, sire, day, result=None):
+        service = mommy.make('animals.Service', animal=animal, sire=sire, date=day)
+        if result:
+            mommy.make('animals.PregnancyCheck', animal=animal, service=service, result=result,
+                       date=day + timedelta(45))
+        return service
+
+    def test_kpis(self):
+        engine = FertilityEngine.for_farm(self.farm)
+        daisy = engine.get_animal(self.daisy.id)
+        self.assertEqual(2, daisy['services'])
+        self.assertEqual(0.5, daisy['conception_rate'])
+        self.assertEqual(2, daisy['services_per_conception'])
+        self.assertEqual(81, daisy['days_open'])
+        self.assertEqual(365, daisy['calving_interval'])
+        self.assertEqual(730, daisy['age_at_first_calving'])
+
+        herd = engine.get_herd()
+        self.assertEqual(4, herd['services'])
+        self.assertEqual(2.0 / 3, herd['conception_rate'])
+        self.assertEqual(2, herd['services_per_conception'])
+        self.assertEqual(81, herd['days_open'])
+
+        sires = dict(engine.get_sires())
+        self.assertEqual(1, sires[self.proven.id]['conception_rate'])
+        self.assertEqual(0, sires[self.young.id]['conception_rate'])
+        self.assertEqual(None, sires[self.young.id]['calving_interval'])
+        self.assertEqual([self.daisy.id, self.bella.id], [animal_id for animal_id, kpis in engine.get_animals()])
+
+        # groups are made of the KPIs of their members
+        group = mommy.make('groups.Group', farm=self.farm, sex=Animal.SEX_CHOICES.female,
+                           start_birth_date=date(2009, 1, 1))
+        groups = dict(FertilityEngine.for_farm(self.farm).get_groups())
+        self.assertEqual(daisy, groups[group.id])
+
+    def test_cached(self):
+        FertilityEngine.for_farm(self.farm)
+        with self.assertNumQueries(0):
+            FertilityEngine.for_farm(self.farm)
+
+        # until a service, check or calving of the farm changes
+        self.serve(self.bella, self.proven, date(2013, 7, 1), PregnancyCheck.RESULT_CHOICES.pregnant)
+        self.assertEqual(5, FertilityEngine.for_farm(self.farm).get_herd()['services'])
+        # or an animal does
+        self.daisy.birth_date = date(2011, 1, 1)
+        self.daisy.save()
+        self.assertEqual(365, FertilityEngine.for_farm(self.farm).get_herd()['age_at_first_calving'])
+
+
+class AutocompleteTestCase(TestCase):
+    def setUp(self):
+        self.farm = mommy.make('users.User')
+        for ear_tag in range(25):
+            mommy.make('animals.Animal', ear_tag='%d' % ear_tag, name='Cow %02d' % ear_tag,
+                       sex=Animal.SEX_CHOICES.female, farm=self.farm)
+        mommy.make('animals.Animal', ear_tag='99', name='Stranger', sex=Animal.SEX_CHOICES.female,
+                   farm=mommy.make('users.User'))
+
+    def test_search(self):
+        has_more, results = autocomplete.animals.search(self.farm, 'cow', 2)
+        self.assertFalse(has_more)
+        self.assertEqual(['Cow 20', 'Cow 21', 'Cow 22', 'Cow 23', 'Cow 24'], [label for pk, label in results])
+        self.assertEqual([], autocomplete.animals.search(self.farm, 'stranger', 1)[1])
+
+    def test_field_page(self):
+        class Field(AutocompleteFieldMixin):
+            autocomplete = autocomplete.animals
+
+        request = RequestFactory().get('/')
+        request.user = self.farm
+        first_page = Field().get_results(request, '', '1', None)
+        # pages that aren't numbers or start before the first are the first page
+        self.assertEqual(first_page, Field().get_results(request, '', 'foo', None))
+        self.assertEqual(first_page, Field().get_results(request, '', '-1', None))
+        self.assertTrue(first_page[1])
+        self.assertEqual(20, len(first_page[2]))
@@ -1,15 +1,26 @@
-from datetime import date
+import json
+from datetime import date, timedelta
+from decimal import Decimal
+from django.db import connection
 from django.test import TestCase
 from django.test.client import RequestFactory
 from django.core.urlresolvers import reverse
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
 from django.contrib.auth.models import Permission
 from model_mommy import mommy
-from phoenix.animals.models import Animal, PregnancyCheck, Service, Dam
+from phoenix.animals.models import (Animal, AnimalImport, PregnancyCheck, Service, Dam, MilkProduction, Breed, Color, Breeder,
+                                    DueEvent, LactationPeriod, MatingRecommendation)
 from phoenix.animals import views
+from phoenix.animals.tasks import plan_all_matings
 from phoenix.utils import test_utils
+from phoenix.utils.query_utils import QueryBudgetMiddleware, get_recorders
+from phoenix.utils.reference_utils import get_table
 
 
-class AnimalCRUDLTestCase(TestCase):
+class AnimalCRUDLTestCase(test_utils.QueryBudgetMixin, TestCase):
+    query_budgets = {'animals.animal_read': 11, 'animals.animal_fragment': 13}
+
     def setUp(self):
         self.bull = mommy.make('animals.Sire')
         self.cow = mommy.make('animals.Dam')
@@ -54,10 +65,142 @@ class AnimalCRUDLTestCase(TestCase):
 
         url = reverse('animals.animal_read', args=[dufour.id])
         response = self.client.get(url, follow=True)
+        self.assertContains(response, reverse('animals.animal_fragment', args=[dufour.id, 'services']))
+
+        response = self.client.get(reverse('animals.animal_fragment', args=[dufour.id, 'services']))
         self.assertContains(response, "Dufour's service")
+        response = self.client.get(reverse('animals.animal_fragment', args=[dufour.id, 'pregnancies']))
         self.assertContains(response, 'Pregnant')
-        #self.assertContains(response, 'Dufour calf')
+        response = self.client.get(reverse('animals.animal_fragment', args=[dufour.id, 'milkproduction']))
         self.assertContains(response, '20')
+        response = self.client.get(reverse('animals.animal_fragment', args=[dufour.id, 'notes']))
+        self.assertContains(response, 'Dufour note')
+
+        response = self.client.get(reverse('animals.animal_fragment', args=[dufour.id, 'unknown']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_animal_fragment_revalidation(self):
+        user = test_utils.create_logged_in_user(self)
+        user.user_permissions.add(Permission.objects.get(codename='animal_read'))
+        user.user_permissions.add(Permission.objects.get(codename='service_list'))
+        service = mommy.make('animals.Service', animal=self.animal, sire=self.bull, date=date.today(), notes='First')
+
+        url = reverse('animals.animal_fragment', args=[self.animal.id, 'services'])
+        response = self.client.get(url)
+        self.assertContains(response, 'First')
+        self.assertTrue(response.has_header('Last-Modified'))
+        etag = response['ETag']
+
+        # nothing changed, so the browser's copy is still good
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        service.notes = 'Second'
+        service.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Second')
+        self.assertNotEqual(response['ETag'], etag)
+
+        mommy.make('animals.Service', animal=self.animal, sire=self.bull, date=date.today(), notes='Third')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertContains(response, 'Third')
+
+        # a check changes the status of its service without touching the service
+        mommy.make('animals.PregnancyCheck', animal=self.animal, service=service,
+                   result=PregnancyCheck.RESULT_CHOICES.pregnant)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertContains(response, 'Pregnant')
+
+    def test_animal_fragment_cache(self):
+        user = test_utils.create_logged_in_user(self)
+        for codename in ('animal_read', 'service_list', 'treatment_list'):
+            user.user_permissions.add(Permission.objects.get(codename=codename))
+        service = mommy.make('animals.Service', animal=self.animal, sire=self.bull, date=date.today(), notes='First')
+        cache.clear()
+
+        url = reverse('animals.animal_fragment', args=[self.animal.id, 'services'])
+        self.assertContains(self.client.get(url), 'First')
+
+        # an update that skips the signals isn't seen, the list comes from the cache
+        Service.objects.filter(pk=service.pk).update(notes='Skipped')
+        self.assertContains(self.client.get(url), 'First')
+
+        service.notes = 'Second'
+        service.save()
+        self.assertContains(self.client.get(url), 'Second')
+
+        url = reverse('animals.animal_fragment', args=[self.animal.id, 'treatment'])
+        self.assertNotContains(self.client.get(url), 'Dewormed')
+        treatment = mommy.make('health.Treatment', description='Dewormed')
+        treatment.animals.add(self.animal)
+        self.assertContains(self.client.get(url), 'Dewormed')
+        self.animal.treatments.clear()
+        self.assertNotContains(self.client.get(url), 'Dewormed')
+
+    def test_animal_read_query_budget(self):
+        user = test_utils.create_logged_in_user(self)
+        for codename in ('animal_read', 'animal_list', 'service_list', 'pregnancycheck_list', 'note_list',
+                         'milkproduction_list', 'treatment_list'):
+            user.user_permissions.add(Permission.objects.get(codename=codename))
+
+        def add_records(animal, count):
+            dam = Dam.objects.get(animal=animal)
+            for i in range(count):
+                service = mommy.make('animals.Service', animal=animal, sire=self.bull, date=date.today())
+                mommy.make('animals.PregnancyCheck', animal=animal, service=service, date=date.today(),
+                           result=PregnancyCheck.RESULT_CHOICES.pregnant)
+                mommy.make('animals.MilkProduction', animal=animal, amount=20, time=MilkProduction.TIME_CHOICES.am,
+                           date=date.today())
+                mommy.make('animals.Animal', farm=user, dam=dam, sex=Animal.SEX_CHOICES.male, birth_date=date.today())
+                mommy.make('health.Treatment', animals=[animal], date=date.today())
+                mommy.make('records.Note', animals=[animal], date=date.today())
+
+        def count_queries(animal):
+            cache.clear()
+            urls = [('animals.animal_read', reverse('animals.animal_read', args=[animal.id]))]
+            urls += [('animals.animal_fragment', reverse('animals.animal_fragment', args=[animal.id, fragment]))
+                     for fragment in ('services', 'pregnancies', 'treatment', 'notes', 'milkproduction', 'offsprings')]
+            counts = []
+            for name, url in urls:
+                with self.assertQueryBudget(name) as queries:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                counts.append(len(queries))
+            return counts
+
+        small = mommy.make('animals.Animal', farm=user, birth_date=date.today(), sex=Animal.SEX_CHOICES.female)
+        large = mommy.make('animals.Animal', farm=user, birth_date=date.today(), sex=Animal.SEX_CHOICES.female)
+        add_records(small, 1)
+        add_records(large, 30)
+
+        # the page and each of its fragments take the same queries whatever the number of rows
+        self.assertEqual(count_queries(small), count_queries(large))
+
+        # and the lists of the large one are paged
+        cache.clear()
+        for fragment in ('services', 'treatment', 'notes', 'offsprings'):
+            response = self.client.get(reverse('animals.animal_fragment', args=[large.id, fragment]))
+            self.assertEqual(25, len(response.context['object_list']))
+
+    def test_animal_search(self):
+        user = test_utils.create_logged_in_user(self)
+        user.user_permissions.add(Permission.objects.get(codename='animal_list'))
+        friesian = mommy.make('animals.Breed', name='Friesian')
+        daisy = mommy.make('animals.Animal', farm=user, ear_tag='KE-201', name='Daisy', breed=friesian,
+                           sex=Animal.SEX_CHOICES.female)
+        dolly = mommy.make('animals.Animal', farm=user, ear_tag='KE-202', name='Dolly', sex=Animal.SEX_CHOICES.female)
+        mommy.make('animals.Animal', farm=mommy.make('users.User'), ear_tag='KE-203', name='Daisy',
+                   sex=Animal.SEX_CHOICES.female)
+
+        def search(text):
+            response = self.client.get(reverse('animals.animal_list') + '?search=%s' % text)
+            return set(response.context_data['object_list'])
+
+        self.assertEqual(set([daisy, dolly]), search('ke'))
+        self.assertEqual(set([daisy]), search('dai'))
+        self.assertEqual(set([daisy]), search('friesian'))
+        self.assertEqual(set([dolly]), search('KE 202'))
+        self.assertEqual(set(), search('dolly friesian'))
 
     def test_offspring_animal_id_and_service(self):
         user = test_utils.create_logged_in_user(self)
@@ -108,6 +251,12 @@ class AnimalCRUDLTestCase(TestCase):
         offspring = Animal.objects.latest('created_on')
         self.assertEqual(offspring.ear_tag, '104M')
 
+        # the calving opens a lactation for the mother rather than the calf
+        lactation = LactationPeriod.objects.get(animal=self.animal)
+        self.assertEqual(date.today(), lactation.start_date)
+        self.assertEqual([offspring], list(lactation.calves.all()))
+        self.assertEqual('lactating', Animal.objects.get(pk=self.animal.pk).state)
+
 
 class ServiceCRUDLTestCase(TestCase):
     def setUp(self):
@@ -138,6 +287,31 @@ class ServiceCRUDLTestCase(TestCase):
         response = self.client.get(url, follow=True)
         self.assertNotContains(response, 'Animal Id is required')
 
+    def test_recommendations(self):
+        cache.clear()
+        user = test_utils.create_logged_in_user(self)
+        user.user_permissions.add(Permission.objects.get(codename='service_create'))
+        self.shauna.farm = user
+        self.shauna.save()
+        self.bull.created_by = user
+        self.bull.save()
+        url = reverse('animals.service_create') + '?animal=' + str(self.shauna.id)
+
+        # showing the form doesn't rank the herd, the nightly task does
+        response = self.client.get(url)
+        self.assertEqual([], response.context_data['recommendations'])
+        self.assertFalse(MatingRecommendation.objects.exists())
+
+        self.assertEqual(1, plan_all_matings())
+        response = self.client.get(url)
+        self.assertEqual([self.bull], [r.sire for r in response.context_data['recommendations']])
+        self.assertEqual(self.bull, response.context_data['form'].fields['sire'].initial)
+        self.assertContains(response, 'Recommended Sires')
+        # the expected inbreeding keeps its fraction of a percent, 6.25% isn't rounded to 6%
+        recommendation = response.context_data['recommendations'][0]
+        self.assertContains(response, '<td>%.2f%%</td>' % (recommendation.expected_inbreeding * 100))
+        cache.clear()
+
     def test_adding_service(self):
         user = test_utils.create_logged_in_user(self)
         user.user_permissions.add(Permission.objects.get(codename='animal_read'))
@@ -146,18 +320,28 @@ class ServiceCRUDLTestCase(TestCase):
         user.user_permissions.add(Permission.objects.get(codename='service_list'))
 
         self.phoenix = mommy.make('animals.Animal', ear_tag='PNX', sex=Animal.SEX_CHOICES.female)
+        url = reverse('animals.service_create') + '?animal=' + str(self.phoenix.id)
 
+        # a sire of another farm isn't accepted
+        stranger = mommy.make('animals.Sire', name='Stranger', created_by=mommy.make('users.User'))
         post_data = {
             'method': Service.METHOD_CHOICES.artificial_insemination,
-            'sire': self.bull.id,
+            'sire': stranger.id,
             'date': date.today()
         }
+        response = self.client.post(url, post_data)
+        self.assertTrue(response.context_data['form'].errors['sire'])
+        self.assertFalse(Service.objects.filter(animal=self.phoenix).exists())
 
-        url = reverse('animals.service_create') + '?animal=' + str(self.phoenix.id)
+        self.bull.created_by = user
+        self.bull.save()
+        post_data['sire'] = self.bull.id
         response = self.client.post(url, post_data, follow=True)
         service = Service.objects.latest('created_on')
         self.assertEqual(service.animal, self.phoenix)
+        self.assertEqual(Animal.objects.get(pk=self.phoenix.pk).stats.number_of_services, 1)
         self.assertRedirects(response, reverse('animals.animal_read', args=[self.phoenix.id]))
+        response = self.client.get(reverse('animals.animal_fragment', args=[self.phoenix.id, 'services']))
         self.assertContains(response, 'Artificial Insemination')
 
     def test_service_read(self):
@@ -212,15 +396,14 @@ class PregnancyCheckCRDULTestCase(TestCase):
         pregnancy_response = views.PregnancyCheckCRUDL().view_for_action('list').as_view()(request)
         self.assertIn(self.shauna_pd, pregnancy_response.context_data['pregnancycheck_list'])
 
-        url = reverse('animals.animal_read', args=[self.shauna.id])
-        response = self.client.get(url, follow=True)
+        url = reverse('animals.animal_fragment', args=[self.shauna.id, 'pregnancies'])
+        response = self.client.get(url)
         self.assertContains(response, 'Open')
 
         # pregnancy check with a service
         service = mommy.make('animals.Service', animal=self.shauna)
         mommy.make('animals.PregnancyCheck', animal=self.shauna, result=PregnancyCheck.RESULT_CHOICES.pregnant, service=service)
-        url = reverse('animals.animal_read', args=[self.shauna.id])
-        response = self.client.get(url, follow=True)
+        response = self.client.get(url)
         self.assertContains(response, 'Pregnant')
 
 
@@ -266,3 +449,335 @@ class TreatmentCRUDLTestCase(TestCase):
         response = self.client.get(url, follow=True)
         self.assertContains(response, reverse('animals.animal_read', args=[self.shauna.id]))
         self.assertContains(response, reverse('animals.animal_read', args=[self.laryn.id]))
+
+
+class MilkProductionCRUDLTestCase(TestCase):
+    def test_session(self):
+        user = test_utils.create_logged_in_user(self)
+        user.user_permissions.add(Permission.objects.get(codename='milkproduction_session'))
+        daisy = mommy.make('animals.Animal', ear_tag='1', sex=Animal.SEX_CHOICES.female, state='lactating', farm=user)
+        bella = mommy.make('animals.Animal', ear_tag='2', sex=Animal.SEX_CHOICES.female, state='lactating', farm=user)
+        dry = mommy.make('animals.Animal', ear_tag='3', sex=Animal.SEX_CHOICES.female, state='pregnant', farm=user)
+        mommy.make('animals.MilkProduction', animal=daisy, date=date(2015, 11, 2), time='am', amount=5)
+
+        url = reverse('animals.milkproduction_session')
+        response = self.client.get(url + '?date=2015-11-02&time=am')
+        self.assertEqual([daisy, bella], response.context_data['form'].animals)
+        self.assertEqual(5, response.context_data['form'].initial['amount_%d' % daisy.id])
+
+        # a bad date or time falls back to this morning's session
+        response = self.client.get(url + '?date=foo&time=noon')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(date.today(), response.context_data['form'].initial['date'])
+        self.assertEqual('am', response.context_data['form'].initial['time'])
+
+        # batch validation reports every bad row
+        post_data = {'date': '2015-11-02', 'time': 'am', 'amount_%d' % daisy.id: '-1', 'butterfat_%d' % bella.id: '3.5'}
+        response = self.client.post(url, post_data)
+        self.assertIn('amount_%d' % daisy.id, response.context_data['form'].errors)
+        self.assertIn('amount_%d' % bella.id, response.context_data['form'].errors)
+
+        post_data = {'date': '2015-11-02', 'time': 'am', 'amount_%d' % daisy.id: '12.5',
+                     'amount_%d' % bella.id: '10', 'butterfat_%d' % bella.id: '3.5'}
+        response = self.client.post(url, post_data, follow=True)
+        self.assertContains(response, 'The milking session has been recorded.')
+
+        self.assertEqual(2, MilkProduction.objects.filter(date=date(2015, 11, 2), time='am').count())
+        self.assertEqual(Decimal('12.5'), MilkProduction.objects.get(animal=daisy).amount)
+        self.assertEqual(Decimal('3.5'), MilkProduction.objects.get(animal=bella).butterfat)
+        self.assertEqual(Decimal('12.5'), daisy.all_time_production)
+        self.assertEqual(Decimal('10'), bella.all_time_production)
+        self.assertIsNone(dry.all_time_production)
+
+    def test_list_pages(self):
+        user = test_utils.create_logged_in_user(self)
+        user.user_permissions.add(Permission.objects.get(codename='milkproduction_list'))
+        daisy = mommy.make('animals.Animal', sex=Animal.SEX_CHOICES.female, farm=user)
+        for day in range(60):
+            mommy.make('animals.MilkProduction', animal=daisy, date=date(2015, 1, 1) + timedelta(days=day),
+                       time='am', amount=day % 7)
+        ids = list(MilkProduction.objects.order_by('-id').values_list('id', flat=True))
+        url = reverse('animals.milkproduction_list')
+
+        response = self.client.get(url)
+        first = response.context_data['page_obj']
+        self.assertTrue(first.keyset)
+        self.assertEqual(ids[:25], [row.id for row in first.object_list])
+        self.assertFalse(first.has_previous())
+        self.assertContains(response, '60 results')
+
+        # further pages are sought from the last row of the one before
+        second = self.client.get(url + '?_after=%d' % first.next_cursor()).context_data['page_obj']
+        self.assertEqual(ids[25:50], [row.id for row in second.object_list])
+        third = self.client.get(url + '?_after=%d' % second.next_cursor()).context_data['page_obj']
+        self.assertEqual(ids[50:], [row.id for row in third.object_list])
+        self.assertFalse(third.has_next())
+
+        back = self.client.get(url + '?_before=%d' % third.previous_cursor()).context_data['page_obj']
+        self.assertEqual(ids[25:50], [row.id for row in back.object_list])
+        self.assertTrue(back.has_previous())
+        self.assertTrue(back.has_next())
+
+        # a cursor with nothing past it leads back to the first page
+        response = self.client.get(url + '?_after=%d' % ids[-1])
+        self.assertEqual(ids[:25], [row.id for row in response.context_data['page_obj'].object_list])
+        self.assertFalse(response.context_data['page_obj'].has_previous())
+
+        # other columns are keyed along with the id to break their ties
+        ordered = list(MilkProduction.objects.order_by('amount', 'id').values_list('id', flat=True))
+        rows, query = [], '?_order=amount'
+        while True:
+            page = self.client.get(url + query).context_data['page_obj']
+            rows += [row.id for row in page.object_list]
+            if not page.has_next():
+                break
+            query = '?_order=amount&_after=%d' % page.next_cursor()
+        self.assertEqual(ordered, rows)
+
+        # relations are paged by offset
+        page = self.client.get(url + '?_order=animal&page=2').context_data['page_obj']
+        self.assertFalse(getattr(page, 'keyset', False))
+        self.assertEqual(2, page.number)
+
+
+class AnimalImportCRUDLTestCase(TestCase):
+    def test_import(self):
+        user = test_utils.create_logged_in_user(self)
+        user.user_permissions.add(Permission.objects.get(codename='animalimport_create'))
+        user.user_permissions.add(Permission.objects.get(codename='animalimport_read'))
+
+        upload = SimpleUploadedFile('herd.txt', 'ear_tag,name,sex\n1,Daisy,female\n')
+        response = self.client.post(reverse('animals.animalimport_create'), {'file': upload})
+        self.assertIn('file', response.context_data['form'].errors)
+
+        upload = SimpleUploadedFile('herd.csv', 'ear_tag,name,sex\n1,Daisy,female\n2,,male\n')
+        response = self.client.post(reverse('animals.animalimport_create'), {'file': upload}, follow=True)
+        animal_import = AnimalImport.objects.get()
+        self.assertEqual(AnimalImport.STATUS_CHOICES.complete, animal_import.status)
+        self.assertEqual(user, animal_import.farm)
+        self.assertContains(response, 'row 3: Name is required')
+        self.assertTrue(Animal.objects.filter(farm=user, ear_tag='1', name='Daisy').exists())
+        animal_import.file.delete()
+
+        # another farm's import can't be read
+        other = mommy.make('animals.AnimalImport', farm=mommy.make('users.User'), file='imports/herd.csv')
+        response = self.client.get(reverse('animals.animalimport_read', args=[other.pk]))
+        self.assertEqual(404, response.status_code)
+
+
+class FertilityTestCase(TestCase):
+    def test_fertility(self):
+        user = test_utils.create_logged_in_user(self)
+        user.user_permissions.add(Permission.objects.get(codename='animal_fertility'))
+        cow = mommy.make('animals.Animal', ear_tag='1', name='Daisy', sex=Animal.SEX_CHOICES.female, farm=user)
+        service = mommy.make('animals.Service', animal=cow, sire=mommy.make('animals.Sire', name='Proven'))
+        mommy.make('animals.PregnancyCheck', animal=cow, service=service, result=PregnancyCheck.RESULT_CHOICES.pregnant)
+        mommy.make('groups.Group', name='Cows', farm=user, sex=Animal.SEX_CHOICES.female)
+
+        response = self.client.get(reverse('animals.animal_fertility'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(1, response.context['herd']['conception_rate'])
+        self.assertContains(response, 'Proven')
+        self.assertContains(response, 'Cows')
+
+
+class LactationPeriodCRUDLTestCase(TestCase):
+    def test_lactations(self):
+        user = test_utils.create_logged_in_user(self)
+        user.user_permissions.add(Permission.objects.get(codename='lactationperiod_list'))
+        user.user_permissions.add(Permission.objects.get(codename='lactationperiod_dry_off'))
+        cow = mommy.make('animals.Animal', ear_tag='1', name='Daisy', sex=Animal.SEX_CHOICES.female, farm=user)
+        calf = mommy.make('animals.Animal', ear_tag='2', sex=Animal.SEX_CHOICES.male, farm=user)
+        lactation = LactationPeriod.record_calving(cow, calf, date(2015, 1, 1), user)
+        mommy.make('animals.MilkProduction', animal=cow, date=date(2015, 1, 5), time='am', amount=12)
+        mommy.make('animals.LactationPeriod', animal=mommy.make('animals.Animal', sex=Animal.SEX_CHOICES.female,
+                                                                farm=mommy.make('users.User')))
+
+        response = self.client.get(reverse('animals.lactationperiod_list'))
+        self.assertEqual([lactation], list(response.context['object_list']))
+        self.assertContains(response, 'Daisy')
+
+        # she can't be dried off before she calved
+        response = self.client.post(reverse('animals.lactationperiod_dry_off', args=[lactation.pk]),
+                                    {'end_date': '2014-12-01'})
+        self.assertFormError(response, 'form', 'end_date', "A cow can't be dried off before she calved on 2015-01-01")
+        self.assertIsNone(LactationPeriod.objects.get(pk=lactation.pk).end_date)
+
+        response = self.client.post(reverse('animals.lactationperiod_dry_off', args=[lactation.pk]),
+                                    {'end_date': '2015-10-01'})
+        self.assertEqual(302, response.status_code)
+        self.assertEqual(date(2015, 10, 1), LactationPeriod.objects.get(pk=lactation.pk).end_date)
+        self.assertEqual('open', Animal.objects.get(pk=cow.pk).state)
+
+        # nor dried off twice
+        response = self.client.post(reverse('animals.lactationperiod_dry_off', args=[lactation.pk]),
+                                    {'end_date': '2015-11-01'})
+        self.assertFormError(response, 'form', 'end_date', 'This lactation was already dried off on 2015-10-01')
+        self.assertEqual(date(2015, 10, 1), LactationPeriod.objects.get(pk=lactation.pk).end_date)
+
+
+class MilkAlertCRUDLTestCase(TestCase):
+    def test_list(self):
+        user = test_utils.create_logged_in_user(self)
+        user.user_permissions.add(Permission.objects.get(codename='milkalert_list'))
+        cow = mommy.make('animals.Animal', ear_tag='1', name='Daisy', sex=Animal.SEX_CHOICES.female, farm=user)
+        alert = mommy.make('animals.MilkAlert', animal=cow, farm=user, time='am', amount=4, expected=10, z_score=-4)
+        other_farm = mommy.make('users.User')
+        other_cow = mommy.make('animals.Animal', ear_tag='2', sex=Animal.SEX_CHOICES.female, farm=other_farm)
+        mommy.make('animals.MilkAlert', animal=other_cow, farm=other_farm, time='am', expected=10, z_score=-4)
+
+        response = self.client.get(reverse('animals.milkalert_list'))
+        self.assertEqual([alert], list(response.context['object_list']))
+        self.assertContains(response, 'Daisy')
+
+
+class DueEventCRUDLTestCase(TestCase):
+    def test_list(self):
+        user = test_utils.create_logged_in_user(self)
+        user.user_permissions.add(Permission.objects.get(codename='dueevent_list'))
+        cow = mommy.make('animals.Animal', ear_tag='1', name='Daisy', sex=Animal.SEX_CHOICES.female, farm=user)
+        served = date.today() - timedelta(10)
+        mommy.make('animals.Service', animal=cow, sire=mommy.make('animals.Sire'), date=served)
+
+        # the events of the week of the given day
+        response = self.client.get(reverse('animals.dueevent_list') + '?date=%s' % (served + timedelta(21)))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(DueEvent.EVENT_CHOICES.heat, served + timedelta(21))],
+                         [(event.event, event.date) for event in response.context['object_list']])
+        self.assertContains(response, 'Daisy')
+        response = self.client.get(reverse('animals.dueevent_list') + '?date=%s' % (served + timedelta(45)))
+        self.assertEqual([(DueEvent.EVENT_CHOICES.pregnancy_check, served + timedelta(45))],
+                         [(event.event, event.date) for event in response.context['object_list']])
+
+
+class ExportTestCase(TestCase):
+    def setUp(self):
+        self.user = test_utils.create_logged_in_user(self)
+        for codename in ('animal_export', 'milkproduction_export', 'treatment_export'):
+            self.user.user_permissions.add(Permission.objects.get(codename=codename))
+        self.breed = mommy.make('animals.Breed', name='Friesian')
+        self.daisy = mommy.make('animals.Animal', ear_tag='1', name=u'Daisy\xe9', sex=Animal.SEX_CHOICES.female,
+                                breed=self.breed, farm=self.user)
+        mommy.make('animals.Animal', ear_tag='2', name='Other', sex=Animal.SEX_CHOICES.male, farm=mommy.make('users.User'))
+
+    def get_content(self, response):
+        self.assertEqual(200, response.status_code)
+        return ''.join(response.streaming_content)
+
+    def test_animal_export(self):
+        response = self.client.get(reverse('animals.animal_export'))
+        self.assertEqual('attachment; filename="animal.csv"', response['Content-Disposition'])
+        lines = self.get_content(response).splitlines()
+        self.assertEqual(2, len(lines))
+        self.assertTrue(lines[0].startswith('id,ear_tag,name,sex,state,breed'))
+        self.assertTrue(lines[1].startswith('%d,1,Daisy\xc3\xa9,female,open,Friesian,' % self.daisy.id))
+
+    def test_milk_export(self):
+        mommy.make('animals.MilkProduction', animal=self.daisy, date=date(2015, 11, 2), time='am', amount=Decimal('12.5'))
+        response = self.client.get(reverse('animals.milkproduction_export') + '?format=jsonl')
+        self.assertEqual('application/x-ndjson', response['Content-Type'])
+        row = json.loads(self.get_content(response))
+        self.assertEqual(dict(id=row['id'], ear_tag='1', animal=u'Daisy\xe9', date='2015-11-02', time='am',
+                              amount='12.50', butterfat=None), row)
+
+    def test_treatment_export(self):
+        treatment = mommy.make('health.Treatment', description='Deworming')
+        treatment.animals.add(self.daisy, Animal.objects.get(ear_tag='2'))
+        lines = self.get_content(self.client.get(reverse('health.treatment_export'))).splitlines()
+        self.assertEqual(['id,date,description,notes,ear_tag,animal', '%d,,Deworming,,1,Daisy\xc3\xa9' % treatment.id], lines)
+
+
+class ListQueryPlanTestCase(test_utils.QueryBudgetMixin, TestCase):
+    query_budgets = {'animals.animal_list': 11, 'animals.service_list': 12, 'animals.milkproduction_list': 11,
+                     'animals.sire_list': 11}
+
+    def setUp(self):
+        self.user = test_utils.create_logged_in_user(self)
+        for codename in ('animal_list', 'service_list', 'milkproduction_list', 'sire_list'):
+            self.user.user_permissions.add(Permission.objects.get(codename=codename))
+
+    def add_rows(self, count):
+        for i in range(count):
+            breeder = mommy.make('animals.Breeder')
+            sire = mommy.make('animals.Sire', breeder=breeder)
+            dam = mommy.make('animals.Dam')
+            animal = mommy.make('animals.Animal', farm=self.user, breed=mommy.make('animals.Breed'), sire=sire,
+                                dam=dam, sex=Animal.SEX_CHOICES.female)
+            service = mommy.make('animals.Service', animal=animal, sire=sire, date=date.today())
+            mommy.make('animals.PregnancyCheck', animal=animal, service=service, date=date.today(),
+                       result=PregnancyCheck.RESULT_CHOICES.pregnant)
+            mommy.make('animals.MilkProduction', animal=animal, amount=10, time=MilkProduction.TIME_CHOICES.am,
+                       date=date.today())
+
+    def load_references(self):
+        for model in (Breed, Color, Breeder):
+            get_table(model).get_rows()
+
+    def count_queries(self, name):
+        cache.clear()
+        self.load_references()
+        with self.assertQueryBudget(name) as queries:
+            response = self.client.get(reverse(name))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_list_queries(self):
+        names = ('animals.animal_list', 'animals.service_list', 'animals.milkproduction_list', 'animals.sire_list')
+        self.add_rows(2)
+        few = [self.count_queries(name) for name in names]
+        self.add_rows(20)
+        many = [self.count_queries(name) for name in names]
+        self.assertEqual(few, many)
+
+        response = self.client.get(reverse('animals.service_list'))
+        self.assertContains(response, 'Pregnant')
+
+    def test_reference_data(self):
+        self.add_rows(3)
+        breed = Breed.objects.first()
+        self.load_references()
+
+        # breeds are shown from the reference table rather than joined
+        with self.assertQueryBudget('animals.animal_list') as queries:
+            response = self.client.get(reverse('animals.animal_list'))
+        self.assertContains(response, breed.name)
+        self.assertFalse([query for query in queries.queries if 'animals_breed' in query['sql']])
+
+        # a renamed breed is shown as soon as it is saved
+        breed.name = 'Guernsey'
+        breed.save()
+        self.assertContains(self.client.get(reverse('animals.animal_list')), 'Guernsey')
+
+    def test_query_budget(self):
+        self.user.user_permissions.add(Permission.objects.get(codename='animal_read'))
+        self.add_rows(6)
+
+        # looking up the latest check of each service on its own is caught as an N+1
+        with self.assertRaises(AssertionError):
+            with self.assertQueryBudget('animals.service_list', max_queries=100):
+                for service in Service.objects.all():
+                    service.pregnancy_checks.latest('created_on')
+
+        # the queries are broken down by view and the related lists rendered in it
+        animal = Animal.objects.first()
+        with self.assertQueryBudget('animals.animal_fragment', max_queries=13) as queries:
+            response = self.client.get(reverse('animals.animal_fragment', args=[animal.id, 'services']))
+        self.assertEqual(response.status_code, 200)
+        sections = queries.get_sections()
+        self.assertIn('animals.animal_fragment', sections)
+        self.assertIn('animals.animal_fragment > animals.service_list', sections)
+        self.assertEqual(sum(count for count, time in sections.values()), len(queries))
+
+    def test_query_budget_exception(self):
+        # a view that raises leaves no section or forced debug cursor behind for the next request
+        middleware = QueryBudgetMiddleware()
+        request = RequestFactory().get('/')
+        request.resolver_match = None
+        force_debug_cursor = connection.force_debug_cursor
+        middleware.process_view(request, views.AnimalCRUDL, (), {})
+        self.assertTrue(connection.force_debug_cursor)
+
+        middleware.process_exception(request, ValueError())
+        self.assertEqual([], get_recorders())
+        self.assertEqual(force_debug_cursor, connection.force_debug_cursor)
+        self.assertIsNotNone(request.query_recorder.queries)
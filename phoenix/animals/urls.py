@@ -9,6 +9,8 @@ urlpatterns.extend(views.ServiceCRUDL().as_urlpatterns())
 urlpatterns.extend(views.PregnancyCheckCRUDL().as_urlpatterns())
 urlpatterns.extend(views.AnimalMilkProductionCRUDL().as_urlpatterns())
 urlpatterns.extend(views.MilkProductionCRUDL().as_urlpatterns())
+urlpatterns.extend(views.LactationPeriodCRUDL().as_urlpatterns())
+urlpatterns.extend(views.MilkAlertCRUDL().as_urlpatterns())
 urlpatterns.extend(views.AnimalTreatmentCRUDL().as_urlpatterns())
 urlpatterns.extend(views.BreedCRUDL().as_urlpatterns())
 urlpatterns.extend(views.ColorCRUDL().as_urlpatterns())
@@ -16,4 +18,6 @@ urlpatterns.extend(views.AnimalNoteCRUDL().as_urlpatterns())
 urlpatterns.extend(views.SireCRUDL().as_urlpatterns())
 urlpatterns.extend(views.DamCRUDL().as_urlpatterns())
 urlpatterns.extend(views.BreederCRUDL().as_urlpatterns())
+urlpatterns.extend(views.AnimalImportCRUDL().as_urlpatterns())
 
+urlpatterns.extend(views.DueEventCRUDL().as_urlpatterns())
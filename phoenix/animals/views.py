@@ -4,20 +4,47 @@ from django.template.loader import render_to_string
 from django.template.context import RequestContext
 from django.contrib import messages
 from django.shortcuts import redirect
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
 from django.views.generic import DetailView
-from django.db.models import Q
-from smartmin.views import SmartCRUDL, SmartView, SmartCreateView, SmartReadView, SmartUpdateView, SmartListView
+from django.db import transaction
+from smartmin.views import (SmartCRUDL, SmartView, SmartCreateView, SmartReadView, SmartUpdateView, SmartListView,
+                            SmartFormView, SmartTemplateView)
+from phoenix.groups.models import Group
 from phoenix.records.views import NoteCRUDL
 from phoenix.health.views import TreatmentCRUDL
-from .models import Animal, Breed, Service, PregnancyCheck, MilkProduction, Color, Dam, Sire, Breeder
-from .forms import AnimalForm, ServiceForm, PregnancyCheckForm, MilkProductionForm, SireForm, DamForm
+from phoenix.utils.datetime_utils import week_range
+from phoenix.utils.export_utils import SmartExportView
+from phoenix.utils.reference_utils import attach_references
+from phoenix.utils.view_utils import KeysetPaginationMixin, ListQueryPlanMixin, RelatedList, RelatedListFragmentMixin
+from .models import (Animal, AnimalImport, Breed, Service, PregnancyCheck, MilkProduction, Color, Dam, Sire, Breeder,
+                     MatingRecommendation, DueEvent, LactationPeriod, MilkAlert)
+from .fertility import FertilityEngine
+from .genetics import InbreedingEngine
+from .profile import AnimalProfile
+from .search import search_animals
+from .fields import ParentFieldMixin
+from .forms import (AnimalForm, AnimalImportForm, ServiceForm, PregnancyCheckForm, MilkProductionForm,
+                    MilkingSessionForm, SireForm, DamForm, DryOffForm)
+from .tasks import import_animals
+
+
+class FarmParentsMixin(object):
+    """
+    Limits the sire and dam fields of a form to the parents of the farm posting it
+    """
+    def customize_form_field(self, name, field):
+        field = super(FarmParentsMixin, self).customize_form_field(name, field)
+        if isinstance(field, ParentFieldMixin):
+            field.limit_to_farm(self.request.user)
+        return field
 
 
 class ServiceCRUDL(SmartCRUDL):
     model = Service
-    actions = ('create', 'read', 'update', 'list')
+    actions = ('create', 'read', 'update', 'list', 'export', 'fragment')
 
-    class Create(SmartCreateView):
+    class Create(FarmParentsMixin, SmartCreateView):
         form_class = ServiceForm
         fields = ('method', 'sire', 'date', 'notes',)
 
@@ -35,6 +62,25 @@ class ServiceCRUDL(SmartCRUDL):
                 return redirect(request.META.get('HTTP_REFERER', reverse('animals.animal_list')))
             return super(ServiceCRUDL.Create, self).get(request, *args, **kwargs)
 
+        def derive_recommendations(self):
+            if not hasattr(self, 'recommendations'):
+                animal_id = self.request.GET.get('animal')
+                # ranked nightly by the plan_all_matings task
+                self.recommendations = list(MatingRecommendation.objects.filter(animal=animal_id)
+                                                                .select_related('sire'))
+            return self.recommendations
+
+        def customize_form_field(self, name, field):
+            field = super(ServiceCRUDL.Create, self).customize_form_field(name, field)
+            if name == 'sire' and self.derive_recommendations():
+                field.initial = self.derive_recommendations()[0].sire
+            return field
+
+        def get_context_data(self, **kwargs):
+            context_data = super(ServiceCRUDL.Create, self).get_context_data(**kwargs)
+            context_data['recommendations'] = self.derive_recommendations()
+            return context_data
+
         def pre_save(self, obj):
             animal = Animal.objects.get(id=self.request.GET.get('animal'))
             obj.animal = animal
@@ -51,22 +97,15 @@ class ServiceCRUDL(SmartCRUDL):
     class Read(SmartReadView):
         fields = ('id', 'method', 'sire', 'date', 'notes', 'created_on', 'created_by')
 
-        def get_context_data(self, **kwargs):  # pragma: no cover
-            context_data = super(ServiceCRUDL.Read, self).get_context_data(**kwargs)
-            self.request.service = self.get_object()
-
-            pregnancychecks_response = PregnancyCheckCRUDL().view_for_action('list').as_view()(self.request)
-            if hasattr(pregnancychecks_response, 'context_data'):
-                context_data['pregnancychecks'] = render_to_string('animals/pregnancycheck_related_list.html', pregnancychecks_response.context_data, RequestContext(self.request))
-            return context_data
-
-    class List(SmartListView):
+    class List(KeysetPaginationMixin, ListQueryPlanMixin, SmartListView):
         fields = ('id', 'method', 'sire', 'date', 'status', 'notes')
+        prefetch_related = ('pregnancy_checks',)
         default_order = '-id'
 
         def get_status(self, obj):
-            if obj.pregnancy_checks.all():
-                return PregnancyCheck.RESULT_CHOICES[obj.pregnancy_checks.latest('created_on').result]
+            check = obj.get_latest_check()
+            if check:
+                return PregnancyCheck.RESULT_CHOICES[check.result]
             return ''
 
         def get_queryset(self, **kwargs):
@@ -86,9 +125,28 @@ class ServiceCRUDL(SmartCRUDL):
                 return Service.METHOD_CHOICES[obj.method]
             return ''
 
+    class Fragment(RelatedListFragmentMixin, SmartReadView):
+        permission = 'animals.service_read'
+
+        def get_related_list(self, name):
+            if name == 'pregnancychecks':
+                # a service only ever has a few checks
+                return RelatedList(PregnancyCheckCRUDL, 'list', 'animals/pregnancycheck_related_list.html',
+                                   self.object.pregnancy_checks.order_by('-id'), paginate=False)
+            return None
+
+    class Export(SmartExportView):
+        export_fields = (('id', 'id'), ('ear_tag', 'animal__ear_tag'), ('animal', 'animal__name'), ('method', 'method'),
+                         ('sire', 'sire__name'), ('date', 'date'), ('notes', 'notes'))
+        default_order = 'id'
+
+        def derive_queryset(self, **kwargs):
+            return super(ServiceCRUDL.Export, self).derive_queryset(**kwargs).filter(animal__farm=self.request.user)
+
 
 class PregnancyCheckCRUDL(SmartCRUDL):
     model = PregnancyCheck
+    actions = ('create', 'read', 'update', 'delete', 'list', 'export')
 
     class Create(SmartCreateView):
         form_class = PregnancyCheckForm
@@ -136,7 +194,7 @@ class PregnancyCheckCRUDL(SmartCRUDL):
     class Read(SmartReadView):
         fields = ('id', 'check_method', 'result', 'date', 'created', 'modified')
 
-    class List(SmartListView):
+    class List(ListQueryPlanMixin, SmartListView):
         fields = ('id', 'check_method', 'result', 'date')
         default_order = '-id'
 
@@ -162,6 +220,16 @@ class PregnancyCheckCRUDL(SmartCRUDL):
                 context_data['animal'] = self.request.animal
             return context_data
 
+    class Export(SmartExportView):
+        export_fields = (('id', 'id'), ('ear_tag', 'animal__ear_tag'), ('animal', 'animal__name'),
+                         ('service', 'service'), ('check_method', 'check_method'), ('result', 'result'),
+                         ('date', 'date'))
+        default_order = 'id'
+
+        def derive_queryset(self, **kwargs):
+            queryset = super(PregnancyCheckCRUDL.Export, self).derive_queryset(**kwargs)
+            return queryset.filter(animal__farm=self.request.user)
+
 
 class AnimalNoteCRUDL(NoteCRUDL):
 
@@ -255,7 +323,7 @@ class ColorCRUDL(SmartCRUDL):
 
 class MilkProductionCRUDL(SmartCRUDL):
     model = MilkProduction
-    actions = ('create', 'list')
+    actions = ('create', 'list', 'session', 'export')
 
     class Create(SmartCreateView):
         form_class = MilkProductionForm
@@ -269,8 +337,52 @@ class MilkProductionCRUDL(SmartCRUDL):
         def get_success_url(self):
             return reverse('animals.milkproduction_create')
 
-    class List(SmartListView):
-        fields = ('id', 'animal', 'time', 'amount', 'butterfat_ratio')
+    class Session(SmartFormView):
+        form_class = MilkingSessionForm
+        title = 'Milking Session'
+        success_message = 'The milking session has been recorded.'
+
+        def derive_animals(self):
+            if not hasattr(self, 'animals'):
+                self.animals = list(Animal.objects.filter(farm=self.request.user, state='lactating', is_active=True)
+                                                  .order_by('ear_tag'))
+            return self.animals
+
+        def derive_initial(self):
+            try:
+                date = datetime.datetime.strptime(self.request.GET.get('date', ''), '%Y-%m-%d').date()
+            except ValueError:
+                date = datetime.date.today()
+            time = self.request.GET.get('time', MilkProduction.TIME_CHOICES.am)
+            if time not in MilkProduction.TIME_CHOICES:
+                time = MilkProduction.TIME_CHOICES.am
+            initial = dict(date=date, time=time)
+
+            # prefill whatever was already recorded for this session
+            records = MilkProduction.objects.filter(animal__in=self.derive_animals(), date=date, time=time)
+            for animal_id, amount, butterfat in records.values_list('animal', 'amount', 'butterfat'):
+                initial['amount_%d' % animal_id] = amount
+                initial['butterfat_%d' % animal_id] = butterfat
+            return initial
+
+        def get_form_kwargs(self):
+            kwargs = super(MilkProductionCRUDL.Session, self).get_form_kwargs()
+            kwargs['animals'] = self.derive_animals()
+            return kwargs
+
+        def form_valid(self, form):
+            with transaction.atomic():
+                MilkProduction.record_session(form.cleaned_data['date'], form.cleaned_data['time'], form.get_records(),
+                                              self.request.user)
+            return super(MilkProductionCRUDL.Session, self).form_valid(form)
+
+        def get_success_url(self):
+            return '%s?date=%s&time=%s' % (reverse('animals.milkproduction_session'), self.form.cleaned_data['date'],
+                                           self.form.cleaned_data['time'])
+
+    class List(KeysetPaginationMixin, ListQueryPlanMixin, SmartListView):
+        fields = ('id', 'animal', 'time', 'amount', 'butterfat_ratio', 'days_in_milk')
+        select_related = ('lactation',)
         default_order = '-id'
 
         def get_time(self, obj):
@@ -282,6 +394,15 @@ class MilkProductionCRUDL(SmartCRUDL):
                 context_data['animal'] = self.request.animal
             return context_data
 
+    class Export(SmartExportView):
+        export_fields = (('id', 'id'), ('ear_tag', 'animal__ear_tag'), ('animal', 'animal__name'), ('date', 'date'),
+                         ('time', 'time'), ('amount', 'amount'), ('butterfat', 'butterfat'))
+        default_order = 'id'
+
+        def derive_queryset(self, **kwargs):
+            queryset = super(MilkProductionCRUDL.Export, self).derive_queryset(**kwargs)
+            return queryset.filter(animal__farm=self.request.user)
+
 
 class AnimalMilkProductionCRUDL(MilkProductionCRUDL):
     actions = ('animal_create', 'animal_list')
@@ -310,7 +431,8 @@ class AnimalMilkProductionCRUDL(MilkProductionCRUDL):
             return r'^{}/animal/create/$'.format(path, action)
 
     class AnimalList(MilkProductionCRUDL.List):
-        fields = ('id', 'time', 'amount', 'butterfat_ratio')
+        fields = ('id', 'time', 'amount', 'butterfat_ratio', 'days_in_milk')
+        permission = 'animals.milkproduction_list'
         default_order = '-id'
 
         def get_time(self, obj):
@@ -329,9 +451,10 @@ class AnimalMilkProductionCRUDL(MilkProductionCRUDL):
 
 class AnimalCRUDL(SmartCRUDL):
     model = Animal
-    actions = ('create', 'read', 'update', 'list', 'add_sire', 'add_offspring', 'dashboard')
+    actions = ('create', 'read', 'update', 'list', 'add_sire', 'add_offspring', 'dashboard', 'export', 'fragment',
+               'fertility')
 
-    class FormMixin(object):
+    class FormMixin(FarmParentsMixin):
 
         def __init__(self, **kwargs):
             self.form_class = AnimalForm
@@ -365,6 +488,10 @@ class AnimalCRUDL(SmartCRUDL):
             context_data['chartdata'] = chartdata
             context_data['extra'] = {'x_is_date': True, 'x_axis_format': '%U', 'tag_script_js': True, 'jquery_on_ready': True, }
 
+            if animal.farm:
+                context_data['fertility'] = FertilityEngine.for_farm(animal.farm).get_animal(animal.id)
+            context_data['milk_alerts'] = animal.milk_alerts.all()[:5]
+
             return context_data
 
         @classmethod
@@ -374,6 +501,24 @@ class AnimalCRUDL(SmartCRUDL):
             """
             return r'^%s/%s/(?P<pk>\d+)/$' % (path, action)
 
+    class Fertility(SmartTemplateView):
+        title = 'Herd Fertility'
+
+        def get_context_data(self, **kwargs):
+            context_data = super(AnimalCRUDL.Fertility, self).get_context_data(**kwargs)
+            engine = FertilityEngine.for_farm(self.request.user)
+            groups = Group.objects.in_bulk([group_id for group_id, kpis in engine.get_groups()])
+            sires = Sire.objects.in_bulk([sire_id for sire_id, kpis in engine.get_sires()])
+
+            context_data['herd'] = engine.get_herd()
+            context_data['sections'] = (
+                ('Herd', [('All animals', context_data['herd'])]),
+                ('By Group', [(groups[group_id], kpis) for group_id, kpis in engine.get_groups()
+                              if group_id in groups]),
+                ('By Sire', [(sires[sire_id], kpis) for sire_id, kpis in engine.get_sires()]),
+            )
+            return context_data
+
     class AddSire(FormMixin, SmartCreateView):
         fields = ('name', 'color', 'breed', 'sire', 'dam',
                   'birth_date', 'birth_weight', 'breeder')
@@ -425,15 +570,23 @@ class AnimalCRUDL(SmartCRUDL):
             return obj
 
         def post_save(self, obj):
-            obj.lactating()
-            obj.save()
-            return super(AnimalCRUDL.AddOffspring, self).post_save(obj)
+            obj = super(AnimalCRUDL.AddOffspring, self).post_save(obj)
+            # the calving opens a lactation for the mother
+            cow = Animal.objects.get(id=self.request.GET.get('animal'))
+            LactationPeriod.record_calving(cow, obj, obj.birth_date or datetime.date.today(), self.request.user)
+            return obj
 
         def get_success_url(self):
             return reverse('animals.animal_read', args=[self.request.GET.get('animal')])
 
     class Read(SmartReadView):
-        fields = ('ear_tag', 'name', 'birth_date', 'color', 'sex', 'breed', 'sire', 'dam',)
+        fields = ('ear_tag', 'name', 'birth_date', 'color', 'sex', 'breed', 'sire', 'dam', 'inbreeding')
+
+        def get_inbreeding(self, obj):
+            if not obj.farm:
+                return ''
+            coefficient = InbreedingEngine.for_farm(obj.farm, [obj.id]).coefficient(obj.id)
+            return '%.2f%%' % (coefficient * 100) if coefficient is not None else ''
 
         def get_breed(self, obj):
             if obj.breed:
@@ -450,63 +603,75 @@ class AnimalCRUDL(SmartCRUDL):
                 return obj.dam
             return ''
 
+        def derive_queryset(self, **kwargs):
+            queryset = super(AnimalCRUDL.Read, self).derive_queryset(**kwargs)
+            return queryset.select_related('sire', 'dam', 'farm')
+
+        def get_object(self, queryset=None):
+            # the breed and color come from the reference tables of the process
+            return attach_references(super(AnimalCRUDL.Read, self).get_object(queryset))
+
         def get_context_data(self, **kwargs):
             context_data = super(AnimalCRUDL.Read, self).get_context_data(**kwargs)
 
-            # Add related lists
-            self.request.animal = self.object
-
             # fertile
             context_data['fertile'] = False
             if self.object.sex == Animal.SEX_CHOICES.female:
                 context_data['fertile'] = True
 
-            service_response = ServiceCRUDL().view_for_action('list').as_view()(self.request)
-            if hasattr(service_response, 'context_data'):
-                context_data['services'] = render_to_string('animals/service_related_list.html', service_response.context_data, RequestContext(self.request))
-
-            pregnancy_response = PregnancyCheckCRUDL().view_for_action('list').as_view()(self.request)
-            if hasattr(pregnancy_response, 'context_data'):
-                context_data['pregnancies'] = render_to_string('animals/pregnancycheck_related_list.html', pregnancy_response.context_data, RequestContext(self.request))
-
-            treatment_response = AnimalTreatmentCRUDL().view_for_action('list').as_view()(self.request)
-            if hasattr(treatment_response, 'context_data'):
-                treatment_response.context_data['add_url'] = reverse('animals.treatment_create') + '?animal=' + str(self.request.animal.id)
-                context_data['treatment'] = render_to_string('health/treatment_related_list.html', treatment_response.context_data, RequestContext(self.request))
+            # the related lists are fragments loaded after the page
+            context_data['animal_documents'] = render_to_string('records/animaldocument_form.html',
+                                                                {'animal': self.object}, RequestContext(self.request))
 
-            note_response = NoteCRUDL().view_for_action('list').as_view()(self.request)
-            if hasattr(note_response, 'context_data'):
-                note_response.context_data['add_url'] = reverse('animals.note_create') + '?animal=' + str(self.request.animal.id)
-                context_data['notes'] = render_to_string('records/note_related_list.html', note_response.context_data, RequestContext(self.request))
-
-            context_data['animal_documents'] = render_to_string('records/animaldocument_form.html', {'animal': self.request.animal}, RequestContext(self.request))
-
-            milkproduction_response = AnimalMilkProductionCRUDL().view_for_action('animal_list').as_view()(self.request)
-            if hasattr(milkproduction_response, 'context_data'):
-                context_data['milkproduction'] = render_to_string('animals/animal_milkproduction_related_list.html', milkproduction_response.context_data, RequestContext(self.request))
+            return context_data
 
-            self.request.offsprings = True
-            offspring_response = AnimalCRUDL().view_for_action('list').as_view()(self.request)
-            if hasattr(offspring_response, 'context_data'):
-                context_data['offsprings'] = render_to_string('animals/offspring_related_list.html', offspring_response.context_data, RequestContext(self.request))
+    class Fragment(RelatedListFragmentMixin, SmartReadView):
+        permission = 'animals.animal_read'
+        cache_name = 'animal'
 
-            return context_data
+        def get_related_list(self, name):
+            self.request.animal = self.object
+            profile = AnimalProfile(self.object)
+            add_query = '?animal=%d' % self.object.id
+
+            related_lists = {
+                'services': RelatedList(ServiceCRUDL, 'list', 'animals/service_related_list.html', profile.services),
+                'pregnancies': RelatedList(PregnancyCheckCRUDL, 'list', 'animals/pregnancycheck_related_list.html',
+                                           profile.pregnancy_checks),
+                'treatment': RelatedList(AnimalTreatmentCRUDL, 'list', 'health/treatment_related_list.html',
+                                         profile.treatments, add_url=reverse('animals.treatment_create') + add_query),
+                'notes': RelatedList(AnimalNoteCRUDL, 'list', 'records/note_related_list.html', profile.notes,
+                                     add_url=reverse('animals.note_create') + add_query),
+                'milkproduction': RelatedList(AnimalMilkProductionCRUDL, 'animal_list',
+                                              'animals/animal_milkproduction_related_list.html',
+                                              profile.milk_production),
+                'offsprings': RelatedList(AnimalCRUDL, 'list', 'animals/offspring_related_list.html',
+                                          profile.offspring),
+            }
+            return related_lists.get(name)
 
     class Update(FormMixin, SmartUpdateView):
         pass
 
-    class List(SmartListView):
+    class List(KeysetPaginationMixin, ListQueryPlanMixin, SmartListView):
         fields = ('id', 'ear_tag', 'name', 'breed', 'sex', 'sire', 'dam')
         search_fields = ('name', 'breed__name', 'dam__name', 'sire__name', 'ear_tag')
+        default_order = '-id'
+
+        def derive_search_fields(self):
+            # searches go through search_animals over the search text rather than a lookup per field
+            return ()
 
         def get_queryset(self, **kwargs):
             queryset = super(AnimalCRUDL.List, self).get_queryset(**kwargs)
             queryset = queryset.filter(farm=self.request.user)
+            if self.request.GET.get('search'):
+                queryset = search_animals(queryset, self.request.GET['search'])
             if hasattr(self.request, 'offsprings') and self.request.offsprings:
-                queryset = queryset.filter(Q(dam__animal=self.request.animal))
+                queryset = queryset.filter(ancestor_links__ancestor=self.request.animal, ancestor_links__depth=1)
 
             if hasattr(self.request, 'group') and self.request.group:
-                queryset = self.request.group.get_animals_queryset()
+                queryset = queryset.filter(group_memberships__group=self.request.group)
 
             return queryset
 
@@ -531,11 +696,23 @@ class AnimalCRUDL(SmartCRUDL):
                 return obj.dam
             return ''
 
+    class Export(SmartExportView):
+        export_fields = (('id', 'id'), ('ear_tag', 'ear_tag'), ('name', 'name'), ('sex', 'sex'), ('state', 'state'),
+                         ('breed', 'breed__name'), ('color', 'color__name'), ('sire', 'sire__name'),
+                         ('dam', 'dam__name'), ('birth_date', 'birth_date'), ('birth_weight', 'birth_weight'),
+                         ('weaning_date', 'weaning_date'), ('weaning_weight', 'weaning_weight'),
+                         ('yearling_date', 'yearling_date'), ('yearling_weight', 'yearling_weight'))
+        search_fields = ('name', 'breed__name', 'dam__name', 'sire__name', 'ear_tag')
+        default_order = 'id'
+
+        def derive_queryset(self, **kwargs):
+            return super(AnimalCRUDL.Export, self).derive_queryset(**kwargs).filter(farm=self.request.user)
+
 
 class SireCRUDL(SmartCRUDL):
     model = Sire
 
-    class List(SmartListView):
+    class List(ListQueryPlanMixin, SmartListView):
         fields = ('id', 'name', 'code', 'breeder')
 
 
@@ -545,7 +722,7 @@ class DamCRUDL(SmartCRUDL):
     class Create(SmartCreateView):
         form_class = DamForm
 
-    class List(SmartListView):
+    class List(ListQueryPlanMixin, SmartListView):
         fields = ('id', 'name', 'code', 'breeder')
 
 
@@ -555,5 +732,150 @@ class BreederCRUDL(SmartCRUDL):
     class Create(SmartCreateView):
         form_class = SireForm
 
-    class List(SmartListView):
+    class List(ListQueryPlanMixin, SmartListView):
         fields = ('id', 'name')
+
+
+class LactationPeriodCRUDL(SmartCRUDL):
+    model = LactationPeriod
+    actions = ('read', 'list', 'dry_off')
+
+    class Read(SmartReadView):
+        fields = ('animal', 'start_date', 'end_date', 'days_in_milk', 'total_yield', 'standard_yield', 'peak_yield',
+                  'mean_butterfat', 'projected_yield', 'persistency')
+
+        def get_persistency(self, obj):
+            return '%.2f' % obj.persistency if obj.persistency is not None else ''
+
+    class List(ListQueryPlanMixin, SmartListView):
+        fields = ('id', 'animal', 'start_date', 'end_date', 'days_in_milk', 'total_yield', 'standard_yield',
+                  'peak_yield', 'mean_butterfat', 'projected_yield', 'persistency')
+        default_order = '-start_date'
+
+        def derive_queryset(self, **kwargs):
+            queryset = super(LactationPeriodCRUDL.List, self).derive_queryset(**kwargs)
+            return queryset.filter(animal__farm=self.request.user)
+
+        def get_mean_butterfat(self, obj):
+            mean = obj.mean_butterfat
+            return '%.3f' % mean if mean is not None else ''
+
+        def get_persistency(self, obj):
+            return '%.2f' % obj.persistency if obj.persistency is not None else ''
+
+    class DryOff(SmartUpdateView):
+        form_class = DryOffForm
+        fields = ('end_date',)
+        success_message = 'The cow has been dried off.'
+
+        def customize_form_field(self, name, field):
+            field = super(LactationPeriodCRUDL.DryOff, self).customize_form_field(name, field)
+            if name == 'end_date':
+                field.initial = datetime.date.today()
+            return field
+
+        def save(self, obj):
+            obj.dry_off(obj.end_date, self.request.user)
+
+        def get_success_url(self):
+            return reverse('animals.lactationperiod_read', args=[self.object.pk])
+
+
+class MilkAlertCRUDL(SmartCRUDL):
+    model = MilkAlert
+    actions = ('list',)
+
+    class List(ListQueryPlanMixin, SmartListView):
+        fields = ('date', 'time', 'animal', 'amount', 'expected', 'z_score')
+        default_order = ('-date', '-id')
+        field_config = {'expected': dict(label='Usual Amount'), 'z_score': dict(label='Deviations')}
+
+        def derive_queryset(self, **kwargs):
+            queryset = super(MilkAlertCRUDL.List, self).derive_queryset(**kwargs)
+            return queryset.filter(farm=self.request.user)
+
+        def get_time(self, obj):
+            return MilkProduction.TIME_CHOICES[obj.time]
+
+        def get_expected(self, obj):
+            return '%.1f' % obj.expected
+
+        def get_z_score(self, obj):
+            return '%.1f' % obj.z_score
+
+
+class DueEventCRUDL(SmartCRUDL):
+    model = DueEvent
+    actions = ('list',)
+
+    class List(ListQueryPlanMixin, SmartListView):
+        fields = ('date', 'event', 'animal')
+        default_order = 'date'
+
+        def get_week(self):
+            try:
+                date = datetime.datetime.strptime(self.request.GET.get('date', ''), '%Y-%m-%d').date()
+            except ValueError:
+                date = datetime.date.today()
+            return week_range(date)
+
+        def derive_title(self):
+            return 'Due from %s to %s' % self.get_week()
+
+        def derive_queryset(self, **kwargs):
+            queryset = super(DueEventCRUDL.List, self).derive_queryset(**kwargs)
+            return queryset.filter(farm=self.request.user, date__range=self.get_week())
+
+        def get_event(self, obj):
+            return DueEvent.EVENT_CHOICES[obj.event]
+
+
+class AnimalImportCRUDL(SmartCRUDL):
+    model = AnimalImport
+    actions = ('create', 'read', 'list')
+
+    class Create(SmartCreateView):
+        form_class = AnimalImportForm
+        success_message = 'Your file has been uploaded, the animals will be imported shortly.'
+
+        def pre_save(self, obj):
+            obj = super(AnimalImportCRUDL.Create, self).pre_save(obj)
+            obj.farm = self.request.user
+            return obj
+
+        def post_save(self, obj):
+            obj = super(AnimalImportCRUDL.Create, self).post_save(obj)
+            result = import_animals.delay(obj.pk)
+            AnimalImport.objects.filter(pk=obj.pk).update(task_id=result.id or '')
+            return obj
+
+        def get_success_url(self):
+            return reverse('animals.animalimport_read', args=[self.object.pk])
+
+    class Read(SmartReadView):
+        fields = ('file', 'status', 'rows_processed', 'animals_created', 'errors', 'created_on')
+
+        def derive_queryset(self):
+            # the errors show the ear tags and names of the farm's animals
+            return super(AnimalImportCRUDL.Read, self).derive_queryset().filter(farm=self.request.user)
+
+        def derive_refresh(self):
+            # keep polling until the task is done
+            return 0 if self.object.is_finished else 2000
+
+        def get_status(self, obj):
+            return AnimalImport.STATUS_CHOICES[obj.status]
+
+        def get_errors(self, obj):
+            return mark_safe('<br/>'.join(escape(error) for error in obj.get_errors()))
+
+    class List(ListQueryPlanMixin, SmartListView):
+        fields = ('id', 'file', 'status', 'rows_processed', 'animals_created', 'created_on')
+        link_fields = ('file',)
+        default_order = '-id'
+
+        def derive_queryset(self, **kwargs):
+            return super(AnimalImportCRUDL.List, self).derive_queryset(**kwargs).filter(farm=self.request.user)
+
+        def get_status(self, obj):
+            return AnimalImport.STATUS_CHOICES[obj.status]
@@ -2,8 +2,9 @@ from django import forms
 from bootstrap3_datetime.widgets import DateTimePicker
 from django_select2.fields import Select2ChoiceField
 from django_select2.widgets import AutoHeavySelect2Widget, Select2Widget
-from phoenix.animals.models import Animal
+from phoenix.animals.models import Animal, Breed
 from phoenix.animals.fields import BullField, CowField
+from phoenix.utils.reference_utils import ReferenceChoiceField
 from .models import Group
 
 
@@ -11,6 +12,7 @@ class GroupForm(forms.ModelForm):
     sex = Select2ChoiceField(required=False, choices=Animal.SEX_CHOICES, widget=Select2Widget(select2_options={'minimumInputLength': 0}))
     start_birth_date = forms.DateField(required=False, widget=DateTimePicker(options={'format': 'YYYY-MM-DD', 'pickTime': False}))
     end_birth_date = forms.DateField(required=False, widget=DateTimePicker(options={'format': 'YYYY-MM-DD', 'pickTime': False}))
+    breed = ReferenceChoiceField(Breed, required=False)
     sire = BullField(required=False, widget=AutoHeavySelect2Widget(select2_options={'minimumInputLength': 0}))
     dam = CowField(required=False, widget=AutoHeavySelect2Widget(select2_options={'minimumInputLength': 0}))
 
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.conf import settings
+
+
+def add_members(apps, schema_editor):
+    Animal = apps.get_model('animals', 'Animal')
+    Group = apps.get_model('groups', 'Group')
+    GroupMembership = apps.get_model('groups', 'GroupMembership')
+
+    for group in Group.objects.all():
+        group.farm_id = group.created_by_id
+        animals = Animal.objects.filter(farm=group.farm_id)
+        if group.sex:
+            animals = animals.filter(sex=group.sex)
+        if group.breed_id:
+            animals = animals.filter(breed=group.breed_id)
+        if group.start_birth_date:
+            animals = animals.filter(birth_date__gte=group.start_birth_date)
+        if group.end_birth_date:
+            animals = animals.filter(birth_date__lte=group.end_birth_date)
+        if group.sire_id:
+            animals = animals.filter(sire__animal=group.sire_id)
+        if group.dam_id:
+            animals = animals.filter(dam__animal=group.dam_id)
+
+        members = list(animals.values_list('id', flat=True))
+        GroupMembership.objects.bulk_create([GroupMembership(group=group, animal_id=animal_id) for animal_id in members],
+                                            batch_size=1000)
+        group.number_of_animals = len(members)
+        group.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('animals', '0013_matingrecommendation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('groups', '0003_auto_20151101_0325'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupMembership',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('animal', models.ForeignKey(related_name='group_memberships', to='animals.Animal')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='farm',
+            field=models.ForeignKey(related_name='animal_groups', blank=True, to=settings.AUTH_USER_MODEL, null=True),
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='number_of_animals',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='groupmembership',
+            name='group',
+            field=models.ForeignKey(related_name='memberships', to='groups.Group'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='groupmembership',
+            unique_together=set([('group', 'animal')]),
+        ),
+        migrations.RunPython(add_members, migrations.RunPython.noop),
+    ]
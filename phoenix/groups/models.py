@@ -1,6 +1,11 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
 from smartmin.models import SmartModel
-from phoenix.animals.models import Animal
+from phoenix.utils.cache_utils import bump_generations
+from phoenix.animals.fertility import bump_fertility
+from phoenix.animals.models import Animal, Dam, Sire
 
 
 class Group(SmartModel):
@@ -11,23 +16,145 @@ class Group(SmartModel):
     end_birth_date = models.DateField(null=True, blank=True)
     sire = models.ForeignKey('animals.Animal', null=True, blank=True, related_name='sire_groups')
     dam = models.ForeignKey('animals.Animal', null=True, blank=True, related_name='dam_groups')
+    farm = models.ForeignKey('users.User', null=True, blank=True, related_name='animal_groups')
+    number_of_animals = models.PositiveIntegerField(default=0)
 
     def __unicode__(self):
         return self.name
 
     def get_animals_queryset(self):
+        return Animal.objects.filter(group_memberships__group=self)
+
+    def get_matching_queryset(self):
+        """
+        Returns the animals that match the criteria of this group, which get_animals_queryset has stored
+        """
         queryset = Animal.objects.all()
+        if self.farm_id:
+            queryset = queryset.filter(farm=self.farm_id)
         if self.sex:
             queryset = queryset.filter(sex=self.sex)
-        if self.breed:
-            queryset = queryset.filter(breed=self.breed)
+        if self.breed_id:
+            queryset = queryset.filter(breed=self.breed_id)
         if self.start_birth_date:
             queryset = queryset.filter(birth_date__gte=self.start_birth_date)
         if self.end_birth_date:
-            queryset = queryset.filter(birth_date__lte=self.start_birth_date)
-        if self.sire:
-            queryset = queryset.filter(sire=self.sire)
-        if self.dam:
-            queryset = queryset.filter(dam=self.dam)
+            queryset = queryset.filter(birth_date__lte=self.end_birth_date)
+        if self.sire_id:
+            queryset = queryset.filter(sire__animal=self.sire_id)
+        if self.dam_id:
+            queryset = queryset.filter(dam__animal=self.dam_id)
+        return queryset
+
+    def matches(self, animal, sire_animal_id, dam_animal_id):
+        """
+        Whether the given animal, whose sire and dam are the given animals, matches the criteria of this group
+        """
+        if self.farm_id and animal.farm_id != self.farm_id:
+            return False
+        if self.sex and animal.sex != self.sex:
+            return False
+        if self.breed_id and animal.breed_id != self.breed_id:
+            return False
+        if self.start_birth_date and (not animal.birth_date or animal.birth_date < self.start_birth_date):
+            return False
+        if self.end_birth_date and (not animal.birth_date or animal.birth_date > self.end_birth_date):
+            return False
+        if self.sire_id and sire_animal_id != self.sire_id:
+            return False
+        if self.dam_id and dam_animal_id != self.dam_id:
+            return False
+        return True
+
+    def update_members(self):
+        """
+        Brings the stored members in line with the criteria of this group
+        """
+        matching = set(self.get_matching_queryset().values_list('id', flat=True))
+        current = set(self.memberships.values_list('animal', flat=True))
+
+        with transaction.atomic():
+            self.memberships.filter(animal__in=current - matching).delete()
+            GroupMembership.objects.bulk_create([GroupMembership(group=self, animal_id=animal_id)
+                                                 for animal_id in matching - current], batch_size=1000)
+            self.number_of_animals = len(matching)
+            Group.objects.filter(pk=self.pk).update(number_of_animals=self.number_of_animals)
+        if matching != current:
+            bump_generations('group', [self.pk])
+            # the KPIs of the group are those of its members
+            bump_fertility(Animal.objects.filter(pk__in=matching ^ current).values_list('farm', flat=True))
+
+    @classmethod
+    def update_animal(cls, animal):
+        """
+        Adds or removes a new or changed animal from the groups of its farm
+        """
+        groups = cls.objects.filter(models.Q(farm=animal.farm_id) | models.Q(farm=None))
+        sire_animal_id, dam_animal_id = Animal.objects.filter(pk=animal.pk).values_list('sire__animal',
+                                                                                      'dam__animal').first()
+        matching = set(group.pk for group in groups if group.matches(animal, sire_animal_id, dam_animal_id))
+        current = set(animal.group_memberships.values_list('group', flat=True))
+
+        if current - matching:
+            GroupMembership.objects.filter(animal=animal, group__in=current - matching).delete()
+            cls.objects.filter(pk__in=current - matching).update(number_of_animals=F('number_of_animals') - 1)
+        if matching - current:
+            GroupMembership.objects.bulk_create([GroupMembership(group_id=group_id, animal=animal)
+                                                 for group_id in matching - current])
+            cls.objects.filter(pk__in=matching - current).update(number_of_animals=F('number_of_animals') + 1)
+        bump_generations('group', matching | current)
+
+    @classmethod
+    def update_farm(cls, farm):
+        for group in cls.objects.filter(models.Q(farm=farm) | models.Q(farm=None)):
+            group.update_members()
+
+
+class GroupMembership(models.Model):
+    """
+    An animal that currently matches the criteria of a group
+    """
+    group = models.ForeignKey(Group, related_name='memberships')
+    animal = models.ForeignKey('animals.Animal', related_name='group_memberships')
+
+    class Meta:
+        unique_together = ('group', 'animal')
+
+
+@receiver(post_save, sender=Group)
+def update_group_members(sender, instance, raw=False, **kwargs):
+    if not raw:
+        instance.update_members()
+
+
+@receiver(post_save, sender=Animal)
+def update_animal_groups(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    criteria = set(['sex', 'breed_id', 'birth_date', 'sire_id', 'dam_id', 'farm_id'])
+    if created or instance.get_changed_fields() & criteria:
+        Group.update_animal(instance)
+    else:
+        # the animal lists of its groups show it
+        bump_generations('group', instance.group_memberships.values_list('group', flat=True))
+
+
+@receiver(post_save, sender=Sire)
+@receiver(post_save, sender=Dam)
+def update_offspring_groups(sender, instance, created, raw=False, **kwargs):
+    # groups by sire or dam match offspring through the animal the sire or dam is linked to
+    if created or raw or 'animal_id' not in instance.get_changed_fields():
+        return
+    field = 'sire' if sender == Sire else 'dam'
+    farms = set(Animal.objects.filter(**{field: instance}).values_list('farm', flat=True)) - set([None])
+    groups = Group.objects.filter(models.Q(farm__in=farms) | models.Q(farm=None), **{'%s__isnull' % field: False})
+    for group in groups:
+        group.update_members()
+
 
-        return queryset
\ No newline at end of file
+@receiver(pre_delete, sender=Animal)
+def remove_animal_from_groups(sender, instance, **kwargs):
+    # the memberships themselves go with the animal
+    groups = list(Group.objects.filter(memberships__animal=instance).values_list('id', flat=True))
+    Group.objects.filter(pk__in=groups).update(number_of_animals=F('number_of_animals') - 1)
+    bump_generations('group', groups)
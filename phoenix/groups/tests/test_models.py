@@ -0,0 +1,68 @@
+import pytest
+from datetime import date
+from django.test import TestCase
+from model_mommy import mommy
+from phoenix.animals.models import Animal
+from phoenix.groups.models import Group
+
+pytestmark = pytest.mark.django_db
+
+
+class GroupTestCase(TestCase):
+    def setUp(self):
+        self.farm = mommy.make('users.User')
+        self.breed = mommy.make('animals.Breed', name='Friesian')
+        self.heifer = mommy.make('animals.Animal', ear_tag='1', name='heifer', sex=Animal.SEX_CHOICES.female,
+                                 breed=self.breed, birth_date=date(2015, 3, 1), farm=self.farm)
+        self.cow = mommy.make('animals.Animal', ear_tag='2', name='cow', sex=Animal.SEX_CHOICES.female,
+                              birth_date=date(2012, 3, 1), farm=self.farm)
+        mommy.make('animals.Animal', ear_tag='3', name='bull', sex=Animal.SEX_CHOICES.male, farm=self.farm)
+        mommy.make('animals.Animal', ear_tag='4', name='other', sex=Animal.SEX_CHOICES.female,
+                   birth_date=date(2015, 3, 1), farm=mommy.make('users.User'))
+
+    def get_group(self, group):
+        return Group.objects.get(pk=group.pk)
+
+    def test_membership(self):
+        group = mommy.make('groups.Group', name='heifers', sex=Animal.SEX_CHOICES.female, farm=self.farm,
+                           start_birth_date=date(2014, 1, 1), end_birth_date=date(2015, 12, 31))
+        self.assertEqual([self.heifer], list(group.get_animals_queryset()))
+        self.assertEqual(1, self.get_group(group).number_of_animals)
+
+        # animals move in and out as they change
+        self.cow.birth_date = date(2014, 6, 1)
+        self.cow.save()
+        self.heifer.sex = Animal.SEX_CHOICES.male
+        self.heifer.save()
+        calf = mommy.make('animals.Animal', ear_tag='5', name='calf', sex=Animal.SEX_CHOICES.female,
+                          birth_date=date(2015, 11, 1), farm=self.farm)
+        self.assertEqual(set([self.cow, calf]), set(group.get_animals_queryset()))
+        self.assertEqual(2, self.get_group(group).number_of_animals)
+
+        calf.delete()
+        self.assertEqual(1, self.get_group(group).number_of_animals)
+
+        # and the group follows its criteria
+        group.breed = self.breed
+        group.start_birth_date = None
+        group.sex = ''
+        group.save()
+        self.assertEqual([self.heifer], list(group.get_animals_queryset()))
+        self.assertEqual(1, self.get_group(group).number_of_animals)
+
+    def test_parents(self):
+        sire = mommy.make('animals.Sire', name='bull', animal=Animal.objects.get(ear_tag='3'))
+        group = mommy.make('groups.Group', name='calves', sex='', sire=sire.animal, farm=self.farm)
+        self.assertEqual(0, self.get_group(group).number_of_animals)
+
+        self.cow.sire = sire
+        self.cow.save()
+        self.assertEqual([self.cow], list(group.get_animals_queryset()))
+
+        # and leaves it when the sire is linked to another animal
+        other = mommy.make('animals.Animal', ear_tag='5', name='other bull', sex=Animal.SEX_CHOICES.male,
+                           farm=self.farm)
+        sire.animal = other
+        sire.save()
+        self.assertEqual([], list(group.get_animals_queryset()))
+        self.assertEqual(0, self.get_group(group).number_of_animals)
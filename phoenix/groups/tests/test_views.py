@@ -0,0 +1,33 @@
+from django.test import TestCase
+from django.core.urlresolvers import reverse
+from django.contrib.auth.models import Permission
+from model_mommy import mommy
+from phoenix.animals.models import Animal
+from phoenix.groups.models import Group
+from phoenix.utils import test_utils
+
+
+class GroupCRUDLTestCase(TestCase):
+    def test_group_read(self):
+        user = test_utils.create_logged_in_user(self)
+        user.user_permissions.add(Permission.objects.get(content_type__app_label='groups', codename='group_read'))
+        user.user_permissions.add(Permission.objects.get(codename='animal_list'))
+        mommy.make('animals.Animal', name='Heifer', sex=Animal.SEX_CHOICES.female, farm=user)
+        mommy.make('animals.Animal', name='Bull', sex=Animal.SEX_CHOICES.male, farm=user)
+        group = Group.objects.create(name='Heifers', sex=Animal.SEX_CHOICES.female, farm=user, created_by=user,
+                                     modified_by=user)
+
+        response = self.client.get(reverse('groups.group_read', args=[group.id]))
+        self.assertContains(response, reverse('groups.group_fragment', args=[group.id, 'animals']))
+
+        response = self.client.get(reverse('groups.group_fragment', args=[group.id, 'animals']))
+        self.assertContains(response, 'Heifer')
+        self.assertNotContains(response, 'Bull')
+
+        response = self.client.get(reverse('groups.group_fragment', args=[group.id, 'animals']),
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        # without the list permission the fragment is refused
+        response = self.client.get(reverse('groups.group_fragment', args=[group.id, 'notes']))
+        self.assertEqual(response.status_code, 403)
@@ -1,12 +1,14 @@
 from django.shortcuts import redirect
 from django.contrib import messages
 from django.core.urlresolvers import reverse
-from django.template.loader import render_to_string
-from django.template.context import RequestContext
 from smartmin.views import SmartCRUDL, SmartView, SmartCreateView, SmartReadView, SmartUpdateView, SmartListView
-from phoenix.animals.views import AnimalCRUDL
+from phoenix.animals.views import AnimalCRUDL, FarmParentsMixin
 from phoenix.health.views import TreatmentCRUDL
 from phoenix.records.views import NoteCRUDL
+from phoenix.health.models import Treatment
+from phoenix.records.models import Note
+from phoenix.utils.cache_utils import bump_generations
+from phoenix.utils.view_utils import ListQueryPlanMixin, RelatedList, RelatedListFragmentMixin
 from .models import Group
 from .forms import GroupForm
 
@@ -71,6 +73,14 @@ class GroupTreatmentCRUDL(TreatmentCRUDL):
             group = Group.objects.get(id=group_id)
             obj.group = group
             obj.save()
+
+            # the treatment applies to every animal in the group
+            Treated = Treatment.animals.through
+            animal_ids = list(group.memberships.values_list('animal', flat=True))
+            Treated.objects.bulk_create([Treated(treatment=obj, animal_id=animal_id) for animal_id in animal_ids],
+                                        batch_size=1000)
+            # bulk_create doesn't send m2m_changed
+            bump_generations('animal', animal_ids)
             return obj
 
         def get_success_url(self):
@@ -95,40 +105,45 @@ class GroupTreatmentCRUDL(TreatmentCRUDL):
 class GroupCRUDL(SmartCRUDL):
     model = Group
 
-    actions = ('create', 'read', 'update', 'list')
+    actions = ('create', 'read', 'update', 'list', 'fragment')
 
-    class Create(SmartCreateView):
+    class Create(FarmParentsMixin, SmartCreateView):
         form_class = GroupForm
 
+        def pre_save(self, obj):
+            obj = super(GroupCRUDL.Create, self).pre_save(obj)
+            obj.farm = self.request.user
+            return obj
+
     class Read(SmartReadView):
         fields = ('id', 'name', 'sex', 'breed', 'number_of_animals', 'start_birth_date', 'end_birth_date', 'created_on', 'created_by')
 
-        def get_number_of_animals(self, obj):
-            return obj.get_animals_queryset().count()
+    class Fragment(RelatedListFragmentMixin, SmartReadView):
+        permission = 'groups.group_read'
+        cache_name = 'group'
 
-        def get_context_data(self, **kwargs):
-            context_data = super(GroupCRUDL.Read, self).get_context_data(**kwargs)
+        def get_related_list(self, name):
             self.request.group = self.object
-
-            animal_response = AnimalCRUDL().view_for_action('list').as_view()(self.request)
-            if hasattr(animal_response, 'context_data'):
-                context_data['animals'] = render_to_string('groups/animal_related_list.html', animal_response.context_data, RequestContext(self.request))
-
-            treatment_response = GroupTreatmentCRUDL().view_for_action('list').as_view()(self.request)
-            if hasattr(treatment_response, 'context_data'):
-                treatment_response.context_data['add_url'] = reverse('groups.treatment_create') + '?group=' + str(self.request.group.id)
-                context_data['treatment'] = render_to_string('health/treatment_related_list.html', treatment_response.context_data, RequestContext(self.request))
-
-            note_response = GroupNoteCRUDL().view_for_action('list').as_view()(self.request)
-            if hasattr(note_response, 'context_data'):
-                note_response.context_data['add_url'] = reverse('groups.note_create') + '?group=' + str(self.request.group.id)
-                context_data['notes'] = render_to_string('records/note_related_list.html', note_response.context_data, RequestContext(self.request))
-
-            return context_data
-
-    class Update(SmartUpdateView):
+            add_query = '?group=%d' % self.object.id
+            animals = self.object.get_animals_queryset().select_related('breed', 'sire', 'dam').order_by('-id')
+
+            related_lists = {
+                'animals': RelatedList(AnimalCRUDL, 'list', 'groups/animal_related_list.html', animals),
+                'treatment': RelatedList(GroupTreatmentCRUDL, 'list', 'health/treatment_related_list.html',
+                                         Treatment.objects.filter(group=self.object).order_by('-id'),
+                                         add_url=reverse('groups.treatment_create') + add_query),
+                'notes': RelatedList(GroupNoteCRUDL, 'list', 'records/note_related_list.html',
+                                     Note.objects.filter(group=self.object).order_by('-id'),
+                                     add_url=reverse('groups.note_create') + add_query),
+            }
+            return related_lists.get(name)
+
+    class Update(FarmParentsMixin, SmartUpdateView):
         form_class = GroupForm
 
-    class List(SmartListView):
-        fields = ('id', 'name', 'sex', 'breed', 'start_birth_date', 'end_birth_date')
+    class List(ListQueryPlanMixin, SmartListView):
+        fields = ('id', 'name', 'sex', 'breed', 'number_of_animals', 'start_birth_date', 'end_birth_date')
+
+        def derive_queryset(self, **kwargs):
+            return super(GroupCRUDL.List, self).derive_queryset(**kwargs).filter(farm=self.request.user)
 
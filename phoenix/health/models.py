@@ -1,5 +1,8 @@
 from django.db import models
+from django.db.models.signals import post_save, pre_delete, m2m_changed
+from django.dispatch import receiver
 from smartmin.models import SmartModel
+from phoenix.utils.cache_utils import bump_record_generations, bump_record_animal_generations
 
 
 class Treatment(SmartModel):
@@ -7,4 +10,16 @@ class Treatment(SmartModel):
     description = models.TextField(blank=True)
     notes = models.TextField(blank=True)
     group = models.ForeignKey('groups.Group', null=True, blank=False)
-    animals = models.ManyToManyField('animals.Animal', null=False, blank=False, related_name='treatments')
\ No newline at end of file
+    animals = models.ManyToManyField('animals.Animal', null=False, blank=False, related_name='treatments')
+
+
+@receiver(post_save, sender=Treatment)
+@receiver(pre_delete, sender=Treatment)
+def bump_treatment_lists(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_record_generations(instance)
+
+
+@receiver(m2m_changed, sender=Treatment.animals.through)
+def bump_treated_animal_lists(sender, instance, action, reverse, model, pk_set, **kwargs):
+    bump_record_animal_generations(instance, action, reverse, model, pk_set)
@@ -1,12 +1,14 @@
 from django.core.urlresolvers import reverse
 from smartmin.views import SmartCRUDL, SmartCreateView, SmartReadView, SmartUpdateView, SmartListView
+from phoenix.utils.export_utils import SmartExportView
+from phoenix.utils.view_utils import ListQueryPlanMixin
 from .models import Treatment
 from .forms import TreatmentForm
 
 
 class TreatmentCRUDL(SmartCRUDL):
     model = Treatment
-    actions = ('create', 'read', 'update', 'list')
+    actions = ('create', 'read', 'update', 'list', 'export')
 
     class Create(SmartCreateView):
         form_class = TreatmentForm
@@ -37,9 +39,18 @@ class TreatmentCRUDL(SmartCRUDL):
 
             return field
 
-    class List(SmartListView):
+    class List(ListQueryPlanMixin, SmartListView):
         fields = ('id', 'date', 'description', 'notes')
 
         def get_queryset(self, **kwargs):
             queryset = super(TreatmentCRUDL.List, self).get_queryset(**kwargs)
-            return queryset
\ No newline at end of file
+            return queryset
+
+    class Export(SmartExportView):
+        # one row per treated animal
+        export_fields = (('id', 'id'), ('date', 'date'), ('description', 'description'), ('notes', 'notes'),
+                         ('ear_tag', 'animals__ear_tag'), ('animal', 'animals__name'))
+        default_order = 'id'
+
+        def derive_queryset(self, **kwargs):
+            return super(TreatmentCRUDL.Export, self).derive_queryset(**kwargs).filter(animals__farm=self.request.user)
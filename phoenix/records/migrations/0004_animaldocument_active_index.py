@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0003_auto_20151101_0325'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX records_animaldocument_active_animal ON records_animaldocument (animal_id) WHERE NOT deleted',
+            'DROP INDEX records_animaldocument_active_animal',
+        ),
+    ]
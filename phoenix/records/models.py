@@ -1,5 +1,8 @@
 from django.db import models
+from django.db.models.signals import post_save, pre_delete, m2m_changed
+from django.dispatch import receiver
 from smartmin.models import SmartModel
+from phoenix.utils.cache_utils import bump_generations, bump_record_generations, bump_record_animal_generations
 
 
 class Note(SmartModel):
@@ -21,3 +24,22 @@ class AnimalDocument(models.Model):
     def delete(self):
         self.deleted = True
         self.save()
+
+
+@receiver(post_save, sender=Note)
+@receiver(pre_delete, sender=Note)
+def bump_note_lists(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_record_generations(instance)
+
+
+@receiver(m2m_changed, sender=Note.animals.through)
+def bump_noted_animal_lists(sender, instance, action, reverse, model, pk_set, **kwargs):
+    bump_record_animal_generations(instance, action, reverse, model, pk_set)
+
+
+@receiver(post_save, sender=AnimalDocument)
+@receiver(pre_delete, sender=AnimalDocument)
+def bump_document_lists(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_generations('animal', [instance.animal_id])
@@ -1,5 +1,6 @@
 from smartmin.views import SmartCRUDL, SmartCreateView, SmartReadView, SmartListView, SmartUpdateView
 from phoenix.utils.upload.views import UploadView, UploadListView, UploadDeleteView
+from phoenix.utils.view_utils import ListQueryPlanMixin
 from .models import Note, AnimalDocument
 from .forms import NoteForm
 
@@ -41,7 +42,7 @@ class NoteCRUDL(SmartCRUDL):
         def get_file(self, obj):
             return '<a href=' + obj.file.url + '>' + obj.file.name + '</a>'
 
-    class List(SmartListView):
+    class List(ListQueryPlanMixin, SmartListView):
         fields = ('id', 'date', 'file', 'details')
 
         def get_file(self, obj):
@@ -4,12 +4,21 @@
       $(this).closest('.widget').slideUp("fast");
       return false;
     });
-    return $('.is-dropdown-menu').on("click", function() {
+    $('.is-dropdown-menu').on("click", function() {
       $(this).next("ul").slideToggle('fast', function() {
         return $(this).closest("li").toggleClass('active');
       });
       return false;
     });
+    return $('[data-fragment]').each(function() {
+      var fragment;
+      fragment = $(this);
+      fragment.load(fragment.data('fragment'));
+      return fragment.on("click", ".pagination a[href^='?']", function() {
+        fragment.load(fragment.data('fragment') + $(this).attr('href'));
+        return false;
+      });
+    });
   });
 
 }).call(this);
@@ -0,0 +1,113 @@
+from bisect import bisect_left
+from collections import OrderedDict
+from django.core.cache import cache
+from .cache_utils import bump_generations, get_generation
+
+GENERATION_NAME = 'autocomplete:%s'
+FIRST_PAGE_KEY = 'autocomplete:%s:%d:%d'
+FIRST_PAGE_TIMEOUT = 60 * 60 * 24
+
+# the indexes a process keeps, the least recently used go first
+MAX_INDEXES = 200
+
+
+def bump_autocomplete(name, owner_ids):
+    """
+    Marks the autocomplete indexes of the given owners as stale, for when a row in them is added, renamed or removed
+    """
+    bump_generations(GENERATION_NAME % name, owner_ids)
+
+
+class PrefixIndex(object):
+    """
+    The rows of an autocomplete sorted by label and by each word they are searched by, so those with a word starting
+    with a term are found by bisecting rather than by scanning every row.
+    """
+    def __init__(self, rows):
+        # rows are (id, label, text searched by)
+        rows = sorted(rows, key=lambda row: (row[1].lower(), row[0]))
+        self.results = [(row[0], row[1]) for row in rows]
+        words = set()
+        for position, row in enumerate(rows):
+            text = row[2].lower()
+            words.update((word, position) for word in text.split())
+            # so terms of several words match from the start of the label or text
+            words.update((' '.join(value.lower().split()), position) for value in (row[1], row[2]))
+        self.words = sorted(words)
+
+    def search(self, term, limit):
+        """
+        Returns up to limit (id, label) with a word starting with the term, in the order of the word they matched on.
+        Only as many words as it takes to find them are looked at, however many rows the term matches.
+        """
+        term = ' '.join(term.lower().split())
+        if not term:
+            return self.results[:limit]
+
+        positions, found = set(), []
+        index = bisect_left(self.words, (term,))
+        while index < len(self.words) and len(found) < limit and self.words[index][0].startswith(term):
+            position = self.words[index][1]
+            if position not in positions:
+                positions.add(position)
+                found.append(self.results[position])
+            index += 1
+        return found
+
+
+class Autocomplete(object):
+    """
+    Answers Select2 lookups for the rows of a farm, or for everyone's when it isn't scoped, from a PrefixIndex kept
+    in the memory of the process. Indexes are rebuilt once the generation of their farm is bumped by a change to
+    their rows, and the first page for an empty term, which is what every field shows when it is opened, is kept in
+    the cache where any process can serve it from.
+    """
+    page_size = 20
+
+    def __init__(self, name, get_rows, scoped=True):
+        """
+        get_rows is given a farm id, or 0 if this isn't scoped, and returns the (id, label, text searched by) of every
+        row of that farm, or of all
+        """
+        self.name = name
+        self.get_rows = get_rows
+        self.scoped = scoped
+        self.indexes = OrderedDict()
+
+    def get_owner_id(self, user):
+        return user.pk if self.scoped else 0
+
+    def get_index(self, owner_id, generation):
+        key = (owner_id, generation)
+        index = self.indexes.pop(key, None)
+        if index is None:
+            index = PrefixIndex(self.get_rows(owner_id))
+            # an older generation of the same farm is no use anymore
+            for stale in [stale for stale in self.indexes if stale[0] == owner_id]:
+                del self.indexes[stale]
+            while len(self.indexes) >= MAX_INDEXES:
+                self.indexes.popitem(last=False)
+        self.indexes[key] = index
+        return index
+
+    def search(self, user, term, page):
+        """
+        Returns whether there are more results after the given page, counted from 1, and the (id, label) on it
+        """
+        owner_id = self.get_owner_id(user)
+        generation = get_generation(GENERATION_NAME % self.name, owner_id)
+        first_page_key = FIRST_PAGE_KEY % (self.name, owner_id, generation)
+
+        first_page = not term.strip() and page == 1
+        if first_page:
+            cached = cache.get(first_page_key)
+            if cached is not None:
+                return cached
+
+        start = (page - 1) * self.page_size
+        # one more than the page to tell whether there are more
+        results = self.get_index(owner_id, generation).search(term, start + self.page_size + 1)
+        found = (len(results) > start + self.page_size, results[start:start + self.page_size])
+        if first_page:
+            cache.set(first_page_key, found, FIRST_PAGE_TIMEOUT)
+        return found
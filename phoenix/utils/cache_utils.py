@@ -0,0 +1,74 @@
+import hashlib
+import time
+from django.core.cache import cache
+
+GENERATION_KEY = 'generation:%s:%d'
+COUNT_KEY = 'count:%s'
+COUNT_TIMEOUT = 60 * 5
+
+
+def get_generation(name, pk):
+    """
+    Returns the current generation of the named object. Anything cached under a key that includes it goes stale
+    as soon as the object is bumped, without the old keys ever being looked for.
+    """
+    key = GENERATION_KEY % (name, pk)
+    generation = cache.get(key)
+    if generation is None:
+        # a counter that was evicted starts again from the clock rather than from 1, so that entries cached under
+        # its earlier values can't come back
+        cache.add(key, int(time.time() * 1000), None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_generations(name, pks):
+    for pk in set(pks):
+        # a null foreign key, 0 stands for things that aren't owned by anything in particular
+        if pk is None:
+            continue
+        try:
+            cache.incr(GENERATION_KEY % (name, pk))
+        except ValueError:
+            # nothing is cached against a counter that isn't there
+            pass
+
+
+def bump_record_generations(record, animal_ids=None):
+    """
+    Bumps the animals and the group of a treatment or note, its current animals unless animal_ids are given
+    """
+    bump_generations('animal', animal_ids if animal_ids is not None else record.animals.values_list('id', flat=True))
+    if record.group_id:
+        bump_generations('group', [record.group_id])
+
+
+def bump_record_animal_generations(instance, action, reverse, model, pk_set):
+    """
+    Bumps the lists that show the animals of treatments or notes as m2m_changed reports changes to them
+    """
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        bump_record_generations(instance, pk_set if action != 'pre_clear' else None)
+    else:
+        # the records of an animal were changed from its side
+        bump_generations('animal', [instance.pk])
+        if action == 'pre_clear':
+            records = model.objects.filter(animals=instance)
+        else:
+            records = model.objects.filter(pk__in=pk_set)
+        bump_generations('group', records.values_list('group', flat=True))
+
+
+def get_cached_count(queryset, timeout=COUNT_TIMEOUT):
+    """
+    Returns the number of rows of the queryset, counted at most once every timeout seconds for the same query
+    """
+    sql = repr(queryset.order_by().query.sql_with_params())
+    key = COUNT_KEY % hashlib.md5(sql.encode('utf-8')).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, timeout)
+    return count
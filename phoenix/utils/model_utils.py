@@ -1,5 +1,7 @@
 import os
 from uuid import uuid4
+from django.db import connection
+from django.db.models.expressions import RawSQL
 
 
 def unique_filename(path):
@@ -13,4 +15,44 @@ def unique_filename(path):
             filename = '%s%s' % (uuid4().hex, ext)
         # return the whole path to the file
         return os.path.join(path, filename)
-    return wrapper
\ No newline at end of file
+    return wrapper
+
+
+def values_by_pk(model, values, field):
+    """
+    Returns an expression that evaluates to values[pk] on each row, so that many rows can be updated to
+    different values with a single UPDATE. Only rows whose primary key is in values may be updated with it.
+    """
+    when = ' WHEN %%s THEN CAST(%%s AS %s)' % field.db_type(connection)
+    sql = 'CASE %s%s END' % (connection.ops.quote_name(model._meta.pk.column), when * len(values))
+    params = []
+    for pk, value in values.items():
+        params += [pk, value]
+    return RawSQL(sql, params, output_field=field)
+
+
+class TrackedFieldsMixin(object):
+    """
+    Remembers the values of the fields in TRACKED_FIELDS as they were loaded or last saved, so post_save signals can
+    tell what a save changed. Models using it connect remember_tracked_fields to their post_init.
+    """
+    TRACKED_FIELDS = ()
+
+    def save(self, *args, **kwargs):
+        super(TrackedFieldsMixin, self).save(*args, **kwargs)
+        self._original = self.get_tracked_values()
+
+    def get_tracked_values(self):
+        # read from __dict__ so deferred loads don't query for them
+        return dict((field, self.__dict__.get(field)) for field in self.TRACKED_FIELDS)
+
+    def get_changed_fields(self):
+        """
+        Returns the tracked fields that changed since the object was loaded or last saved
+        """
+        original = getattr(self, '_original', {})
+        return set(field for field, value in self.get_tracked_values().items() if original.get(field) != value)
+
+
+def remember_tracked_fields(sender, instance, **kwargs):
+    instance._original = instance.get_tracked_values()
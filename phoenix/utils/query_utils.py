@@ -0,0 +1,213 @@
+import logging
+import re
+import threading
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.utils.functional import cached_property
+
+logger = logging.getLogger(__name__)
+
+# how many times the same query may run in a request before it is taken for an N+1
+QUERY_REPEAT_LIMIT = 5
+
+SECTION_SEPARATOR = ' > '
+
+_local = threading.local()
+
+# sqlite logs its queries unformatted, as QUERY = '...' - PARAMS = (...)
+UNFORMATTED_RE = re.compile(r'^QUERY = u?([\'"])(.*)\1 - PARAMS = ', re.DOTALL)
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'(?<![\w."])-?\d+(?:\.\d+)?\b')
+PLACEHOLDER_RE = re.compile(r'%s')
+IN_RE = re.compile(r'\bIN \((?:\s*\?\s*,)*\s*\?\s*\)', re.IGNORECASE)
+SPACE_RE = re.compile(r'\s+')
+
+
+def get_repeat_limit():
+    return getattr(settings, 'QUERY_REPEAT_LIMIT', QUERY_REPEAT_LIMIT)
+
+
+def get_query_shape(sql):
+    """
+    Returns the SQL of a query with its values taken out, so queries that differ only in them share a shape
+    """
+    unformatted = UNFORMATTED_RE.match(sql)
+    if unformatted:
+        sql = unformatted.group(2)
+    sql = PLACEHOLDER_RE.sub('?', NUMBER_RE.sub('?', STRING_RE.sub('?', sql)))
+    return SPACE_RE.sub(' ', IN_RE.sub('IN (...)', sql)).strip()
+
+
+def get_recorders():
+    if not hasattr(_local, 'recorders'):
+        _local.recorders = []
+    return _local.recorders
+
+
+def push_section(name):
+    for recorder in get_recorders():
+        recorder.push(name)
+
+
+def pop_section():
+    for recorder in get_recorders():
+        recorder.pop()
+
+
+@contextmanager
+def query_section(name):
+    """
+    Counts the queries run inside the block against the named section of any recorder that is running, within
+    whatever section it is already in
+    """
+    push_section(name)
+    try:
+        yield
+    finally:
+        pop_section()
+
+
+class QueryRecorder(object):
+    """
+    Records the queries run on a connection between start and stop, along with the section each was run in.
+    Sections are the views that served requests made while recording and the related lists nested inside them.
+    """
+    def __init__(self, name=None, using=DEFAULT_DB_ALIAS):
+        self.name = name
+        self.connection = connections[using]
+        self.stack = []
+        self.marks = []
+        self.queries = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        self.force_debug_cursor = self.connection.force_debug_cursor
+        self.connection.force_debug_cursor = True
+        self.start_query = self.get_last_query()
+        get_recorders().append(self)
+
+    def stop(self):
+        recorders = get_recorders()
+        if self in recorders:
+            recorders.remove(self)
+        self.connection.force_debug_cursor = self.force_debug_cursor
+
+        # the log is capped, once full its length stays the same so queries are found from the last one before
+        log = list(self.connection.queries_log)
+        self.queries = log
+        for index in range(len(log) - 1, -1, -1):
+            if log[index] is self.start_query:
+                self.queries = log[index + 1:]
+                break
+
+    def get_last_query(self):
+        return self.connection.queries_log[-1] if self.connection.queries_log else None
+
+    def push(self, name):
+        self.stack.append(name)
+        self.mark()
+
+    def pop(self):
+        # sections opened before this recorder started are closed after it stops
+        if self.stack:
+            self.stack.pop()
+            self.mark()
+
+    def mark(self):
+        self.marks.append((self.get_last_query(), SECTION_SEPARATOR.join(self.stack)))
+
+    def __len__(self):
+        return len(self.queries)
+
+    @cached_property
+    def time(self):
+        return sum(float(query['time']) for query in self.queries)
+
+    @cached_property
+    def shapes(self):
+        return Counter(get_query_shape(query['sql']) for query in self.queries)
+
+    def get_sections(self):
+        """
+        Returns the number of queries and their time in seconds for each section, in the order they were entered
+        """
+        queries = self.queries or []
+        positions = dict((id(query), index + 1) for index, query in enumerate(queries))
+        # each mark takes effect from the query after the last one run before it
+        marks = [(positions.get(id(query), 0), section) for query, section in self.marks]
+
+        sections = OrderedDict()
+        section = ''
+        for index, query in enumerate(queries):
+            while marks and marks[0][0] <= index:
+                section = marks.pop(0)[1]
+            count, time = sections.get(section, (0, 0.0))
+            sections[section] = (count + 1, time + float(query['time']))
+        return sections
+
+    def get_repeated(self, limit=None):
+        """
+        Returns the shapes run more than limit times with how many times each was, the most repeated first
+        """
+        limit = get_repeat_limit() if limit is None else limit
+        return [(shape, count) for shape, count in self.shapes.most_common() if count > limit]
+
+    def format(self, limit=None):
+        lines = ['%d queries in %.1fms' % (len(self), self.time * 1000)]
+        for section, (count, time) in self.get_sections().items():
+            lines.append('  %s: %d queries in %.1fms' % (section or '(outside any view)', count, time * 1000))
+        for shape, count in self.get_repeated(limit):
+            lines.append('  repeated %d times: %s' % (count, shape))
+        return '\n'.join(lines)
+
+
+class QueryBudgetMiddleware(object):
+    """
+    Records the queries of each request by the view that served it and the related lists it rendered, logging
+    shapes repeated more than QUERY_REPEAT_LIMIT times as possible N+1s. With DEBUG on, the number of queries and
+    their time are also sent back in the X-Query-Count and X-Query-Time headers.
+    """
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        name = request.resolver_match.url_name if request.resolver_match else None
+        request.query_recorder = QueryRecorder(name or view_func.__name__)
+        request.query_recorder.start()
+        # recorders already running, like those of tests, see the view as a section of their own
+        push_section(request.query_recorder.name)
+
+    def stop_recording(self, request):
+        """
+        Stops the recorder of the request and closes its section, returning it or None if it had stopped already
+        """
+        recorder = getattr(request, 'query_recorder', None)
+        if recorder is None or recorder.queries is not None:
+            return None
+        pop_section()
+        recorder.stop()
+        return recorder
+
+    def process_exception(self, request, exception):
+        # otherwise the section and the forced debug cursor would outlive a view that raised, on this thread
+        self.stop_recording(request)
+
+    def process_response(self, request, response):
+        recorder = self.stop_recording(request)
+        if recorder is None:
+            return response
+
+        if recorder.get_repeated():
+            logger.warning('Possible N+1 queries in %s %s\n%s', request.method, request.path, recorder.format())
+        else:
+            logger.debug('%s %s: %s', request.method, request.path, recorder.format())
+
+        if settings.DEBUG:
+            response['X-Query-Count'] = len(recorder)
+            response['X-Query-Time'] = '%.1fms' % (recorder.time * 1000)
+        return response
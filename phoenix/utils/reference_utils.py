@@ -0,0 +1,129 @@
+import time
+from django import forms
+from django.core.exceptions import ValidationError
+from django.db.models.signals import post_delete, post_save
+from .cache_utils import bump_generations, get_generation
+
+REFERENCE_NAME = 'reference:%s.%s'
+
+# how often a process asks the cache whether its tables are still current, a change made in another process can
+# take this many seconds to show
+VERSION_CHECK_INTERVAL = 5
+
+_tables = {}
+_fields = {}
+
+
+class ReferenceTable(object):
+    """
+    The rows of a small table that rarely changes, held by each process as a map of id to row that is replaced
+    whole rather than changed. Saving or deleting a row bumps the version of the table in the cache, which the
+    process that did so picks up straight away and the others the next time they check theirs.
+    """
+    def __init__(self, model):
+        self.model = model
+        self.name = REFERENCE_NAME % (model._meta.app_label, model._meta.model_name)
+        self.rows = None
+        self.version = None
+        self.checked = 0
+
+    def get_rows(self):
+        now = time.time()
+        if self.rows is None or now - self.checked > VERSION_CHECK_INTERVAL:
+            version = get_generation(self.name, 0)
+            if self.rows is None or version != self.version:
+                self.rows = dict((row.pk, row) for row in self.model.objects.all())
+                self.version = version
+            self.checked = now
+        return self.rows
+
+    def get(self, pk):
+        return self.get_rows().get(pk) if pk is not None else None
+
+    def get_sorted(self):
+        return sorted(self.get_rows().values(), key=lambda row: (u'%s' % row).lower())
+
+    def invalidate(self, **kwargs):
+        self.rows = None
+        bump_generations(self.name, [0])
+
+
+def register(model):
+    """
+    Holds the rows of the given model as reference data, for foreign keys to it to be looked up without queries
+    """
+    table = ReferenceTable(model)
+    _tables[model] = table
+    _fields.clear()
+    post_save.connect(table.invalidate, sender=model, weak=False, dispatch_uid=table.name)
+    post_delete.connect(table.invalidate, sender=model, weak=False, dispatch_uid=table.name)
+    return table
+
+
+def get_table(model):
+    return _tables.get(model)
+
+
+def get_reference_fields(model):
+    """
+    Returns the foreign keys of the given model to reference data
+    """
+    if model not in _fields:
+        _fields[model] = [field for field in model._meta.concrete_fields
+                          if field.many_to_one and field.related_model in _tables]
+    return _fields[model]
+
+
+def attach_references(obj):
+    """
+    Sets the rows foreign keys of an object to reference data point to, so following them doesn't query for them
+    """
+    for field in get_reference_fields(type(obj)):
+        cache_name = field.get_cache_name()
+        # a row joined by select_related is as good, and a deferred key would be loaded by reading it
+        if not hasattr(obj, cache_name) and field.attname in obj.__dict__:
+            setattr(obj, cache_name, _tables[field.related_model].get(getattr(obj, field.attname)))
+    return obj
+
+
+class ReferenceChoiceIterator(object):
+    """
+    The choices of a ReferenceChoiceField, read from its table each time they are rendered rather than when the
+    form is declared
+    """
+    def __init__(self, field):
+        self.field = field
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ('', self.field.empty_label)
+        for row in self.field.table.get_sorted():
+            yield (row.pk, self.field.label_from_instance(row))
+
+    def __len__(self):
+        return len(self.field.table.get_rows()) + (1 if self.field.empty_label is not None else 0)
+
+
+class ReferenceChoiceField(forms.ModelChoiceField):
+    """
+    A choice of a row of reference data, with its choices and cleaning served from the table held by the process
+    """
+    def __init__(self, model, *args, **kwargs):
+        self.table = get_table(model)
+        super(ReferenceChoiceField, self).__init__(model.objects.all(), *args, **kwargs)
+
+    def _get_choices(self):
+        return ReferenceChoiceIterator(self)
+
+    choices = property(_get_choices, forms.ChoiceField._set_choices)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            row = self.table.get(int(value))
+        except (TypeError, ValueError):
+            row = None
+        if row is None:
+            raise ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
+        return row
@@ -9,4 +9,12 @@ def select2(form_field):
     select2s = (Select2MultipleChoiceField, Select2ChoiceField, HeavySelect2FieldBaseMixin, HeavyMultipleChoiceField, HeavySelect2MultipleChoiceField)
     if issubclass(form_field.field.__class__, select2s):
         return True
-    return False
\ No newline at end of file
+    return False
+
+
+@register.filter
+def percentage(value):
+    """
+    Turns a ratio into a percentage, for floatformat to round rather than widthratio which only gives whole numbers
+    """
+    return value * 100 if value is not None else None
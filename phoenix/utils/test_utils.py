@@ -1,4 +1,6 @@
+from contextlib import contextmanager
 from model_mommy import mommy
+from .query_utils import QueryRecorder
 
 
 def login_user(test_case, user, password):
@@ -12,4 +14,29 @@ def create_logged_in_user(test_case, username='mary', password='marypassword'):
     user.set_password(password)
     user.save()
     login_user(test_case, user, password)
-    return user
\ No newline at end of file
+    return user
+
+
+class QueryBudgetMixin(object):
+    """
+    Lets a test case declare query_budgets, the most queries each view may run keyed by its url name, and check the
+    requests made in a block against them with assertQueryBudget. The block also fails if the same query is run
+    more than query_repeat_limit times, which is how an N+1 usually shows up.
+    """
+    query_budgets = {}
+    query_repeat_limit = None
+
+    @contextmanager
+    def assertQueryBudget(self, name, max_queries=None, repeat_limit=None):
+        if max_queries is None:
+            max_queries = self.query_budgets[name]
+        if repeat_limit is None:
+            repeat_limit = self.query_repeat_limit
+
+        with QueryRecorder(name) as recorder:
+            yield recorder
+
+        if len(recorder) > max_queries:
+            self.fail('%s ran over its budget of %d queries: %s' % (name, max_queries, recorder.format(repeat_limit)))
+        if recorder.get_repeated(repeat_limit):
+            self.fail('%s repeated queries: %s' % (name, recorder.format(repeat_limit)))
@@ -1,3 +1,24 @@
+import hashlib
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Page, Paginator
+from django.db.models.fields import FieldDoesNotExist
+from django.db.models import Count, Max, Q
+from django.http import Http404, HttpResponse
+from django.template.context import RequestContext
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+from .cache_utils import get_cached_count, get_generation
+from .query_utils import query_section
+from .reference_utils import attach_references, get_table
+
+FRAGMENT_KEY = 'fragment:%s:%d:%d:%s'
+FRAGMENT_TIME_KEY = 'fragment_time:%s:%d:%d'
+FRAGMENT_TIMEOUT = 60 * 60 * 24
+
+
 class AjaxTemplateMixin(object):
     ajax_template_name = ''
     template_name = ''
@@ -10,4 +31,384 @@ class AjaxTemplateMixin(object):
             self.ajax_template_name = ''.join(split)
         if request.is_ajax():
             self.template_name = self.ajax_template_name
-        return super(AjaxTemplateMixin, self).dispatch(request, *args, **kwargs)
\ No newline at end of file
+        return super(AjaxTemplateMixin, self).dispatch(request, *args, **kwargs)
+
+
+def get_related_list_view(request, crudl, action):
+    """
+    Returns the list view of the given action set up for the request, or None if the user isn't allowed to see it
+    """
+    view = crudl().view_for_action(action)()
+    view.request, view.args, view.kwargs = request, (), {}
+
+    # the permissions of the user are cached on it, the full check looks up the anonymous user every time
+    if not request.user.has_perm(view.permission) and not view.has_permission(request):
+        return None
+    return view
+
+
+def render_related_list(request, crudl, action, template, object_list, paginate=True, count=None, **kwargs):
+    """
+    Renders a related list template with the list view of the given action, fed with the given rows rather than
+    dispatching the view to query them. Returns None if the user isn't allowed to see the list. Rows are paged as
+    the view pages them, lists with only ever a few rows can leave paginate off. Callers that have already counted
+    the rows pass the count so the paginator doesn't count them again.
+    """
+    with query_section(crudl().url_name_for_action(action)):
+        view = get_related_list_view(request, crudl, action)
+        if view is None:
+            return None
+        view.object_list = object_list
+        view.row_count = count
+        if not paginate:
+            view.paginate_by = None
+        return render_to_string(template, view.get_context_data(**kwargs), RequestContext(request))
+
+
+class RelatedList(object):
+    """
+    A related list of a read page, the list view action of crudl rendering object_list with template. Lists given
+    a cache_owner, a (name, pk) pair, keep their HTML in the cache under the generation of that object, which the
+    signals of the rows in the list bump whenever one of them changes.
+    """
+    def __init__(self, crudl, action, template, object_list, paginate=True, cache_owner=None, **context):
+        self.crudl = crudl
+        self.action = action
+        self.template = template
+        self.object_list = object_list
+        self.paginate = paginate
+        self.cache_owner = cache_owner
+        self.context = context
+
+    def get_generation(self):
+        if not self.cache_owner:
+            return None
+        if not hasattr(self, 'generation'):
+            self.generation = get_generation(*self.cache_owner)
+        return self.generation
+
+    def get_generation_time(self):
+        """
+        Returns when the current generation of the owner was first seen, which whatever bumped it happened before
+        """
+        generation = self.get_generation()
+        if generation is None:
+            return None
+        key = FRAGMENT_TIME_KEY % (self.cache_owner[0], self.cache_owner[1], generation)
+        cache.add(key, timezone.now(), FRAGMENT_TIMEOUT)
+        return cache.get(key)
+
+    def get_cache_key(self, request):
+        generation = self.get_generation()
+        if generation is None:
+            return None
+        path = hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest()
+        return FRAGMENT_KEY % (self.cache_owner[0], self.cache_owner[1], generation, path)
+
+    def get_last_modified(self):
+        """
+        Returns the number of rows and when the list last changed, the newest modified_on among them in one query or
+        the time the generation of the owner was bumped to if that is later. The rows show things that aren't part
+        of them, like the checks of services or the names of sires, and only the generation moves when those do.
+        """
+        if not hasattr(self, 'last_modified'):
+            values = self.object_list.order_by().aggregate(count=Count('pk'), last_modified=Max('modified_on'))
+            times = [time for time in (values['last_modified'], self.get_generation_time()) if time]
+            self.count, self.last_modified = values['count'], max(times) if times else None
+        return self.count, self.last_modified
+
+    def get_etag(self, request):
+        # the path tells apart the object, the list and any page or search of it
+        count, last_modified = self.get_last_modified()
+        key = '%s:%d:%s:%s' % (request.get_full_path(), count, last_modified.isoformat() if last_modified else '',
+                               self.get_generation() or '')
+        return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+    def render(self, request):
+        # the fragments have counted the rows for their ETag already
+        count = getattr(self, 'count', None)
+        if not self.cache_owner:
+            return render_related_list(request, self.crudl, self.action, self.template, self.object_list,
+                                       paginate=self.paginate, count=count, **self.context)
+
+        # the user's permissions are checked before anything is served from the cache
+        if get_related_list_view(request, self.crudl, self.action) is None:
+            return None
+        key = self.get_cache_key(request)
+        content = cache.get(key) if key else None
+        if content is None:
+            content = render_related_list(request, self.crudl, self.action, self.template, self.object_list,
+                                          paginate=self.paginate, count=count, **self.context)
+            if key:
+                cache.set(key, content, FRAGMENT_TIMEOUT)
+        return content
+
+
+class RelatedListFragmentMixin(object):
+    """
+    Serves one related list of a read page, named in the url, so the page can be sent without its lists and
+    each of them loaded after it on its own. Fragments carry an ETag and a Last-Modified from the newest modified_on
+    of their rows, so a list that hasn't changed is revalidated with a 304 rather than rendered again. Views with a
+    cache_name also keep the rendered lists in the cache under the generation of their object, which their ETag and
+    Last-Modified then follow too.
+    """
+    cache_name = None
+
+    @classmethod
+    def derive_url_pattern(cls, path, action):
+        return r'^%s/%s/(?P<pk>\d+)/(?P<fragment>\w+)/$' % (path, action)
+
+    def get_related_list(self, name):
+        """
+        Returns the RelatedList of the given name for self.object, or None if there is no such list. Views name
+        their lists by overriding this, there are none otherwise.
+        """
+        return None
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        related_list = self.get_related_list(kwargs['fragment'])
+        if related_list is None:
+            raise Http404('No %s list' % kwargs['fragment'])
+        if self.cache_name:
+            related_list.cache_owner = (self.cache_name, self.object.pk)
+
+        @condition(etag_func=lambda request, *args, **kwargs: related_list.get_etag(request),
+                   last_modified_func=lambda request, *args, **kwargs: related_list.get_last_modified()[1])
+        def fragment(request):
+            content = related_list.render(request)
+            if content is None:
+                raise PermissionDenied()
+            return HttpResponse(content)
+
+        response = fragment(request)
+        # browsers keep the fragment but check it is still current each time
+        patch_cache_control(response, private=True, max_age=0, must_revalidate=True)
+        return response
+
+
+class ListQueryPlanMixin(object):
+    """
+    Plans the queryset of a SmartListView from its fields. Foreign keys listed in fields are joined with
+    select_related and reverse or many to many relations are prefetched, so the rows of a page cost the same
+    queries however many there are. Relations that getters follow without them being listed are declared with
+    select_related and prefetch_related. Foreign keys to reference data aren't joined, their rows are attached from
+    the tables held by the process instead.
+
+    When every field is a column or relation of the model, only those columns are loaded. A getter of a column is
+    expected to read that column, any others it needs are declared with only_fields.
+    """
+    prefetch_related = None
+    only_fields = ()
+
+    def get_model_field(self, name):
+        try:
+            return self.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+
+    def derive_select_related(self):
+        related = list(super(ListQueryPlanMixin, self).derive_select_related() or ())
+        for name in self.fields or ():
+            field = self.get_model_field(name)
+            if field and (field.many_to_one or field.one_to_one) and field.concrete and name not in related:
+                if get_table(field.related_model) is None:
+                    related.append(name)
+        return related
+
+    def derive_prefetch_related(self):
+        prefetch = list(self.prefetch_related or ())
+        for name in self.fields or ():
+            field = self.get_model_field(name)
+            if field and (field.one_to_many or field.many_to_many) and name not in prefetch:
+                prefetch.append(name)
+        return prefetch
+
+    def derive_only_fields(self):
+        """
+        Returns the columns to load, or None if a field isn't part of the model so what its getter reads is unknown
+        """
+        if not self.fields:
+            return None
+        columns = [self.model._meta.pk.name]
+        for name in self.fields:
+            field = self.get_model_field(name)
+            if field is None:
+                return None
+            if field.concrete and not field.many_to_many:
+                columns.append(name)
+        if self.get_model_field('is_active'):
+            # the list templates mark inactive rows
+            columns.append('is_active')
+        return columns + list(self.only_fields)
+
+    def plan_queryset(self, queryset):
+        prefetch = self.derive_prefetch_related()
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        columns = self.derive_only_fields()
+        if columns is not None:
+            # anything joined has to be loaded too
+            joined = [name.split('__')[0] for name in self.derive_select_related()]
+            queryset = queryset.only(*(columns + [name for name in joined if name not in columns]))
+        return queryset
+
+    def derive_queryset(self, **kwargs):
+        return self.plan_queryset(super(ListQueryPlanMixin, self).derive_queryset(**kwargs))
+
+    def lookup_field_value(self, context, obj, field):
+        return super(ListQueryPlanMixin, self).lookup_field_value(context, attach_references(obj), field)
+
+
+class CachedCountPaginator(Paginator):
+    """
+    A paginator whose count is cached for a few minutes rather than counted again for every page, or given to it by a
+    caller that has counted the rows already
+    """
+    def __init__(self, object_list, per_page, count=None, **kwargs):
+        super(CachedCountPaginator, self).__init__(object_list, per_page, **kwargs)
+        self._count = count
+
+    def _get_count(self):
+        if self._count is None:
+            self._count = get_cached_count(self.object_list)
+        return self._count
+    count = property(_get_count)
+
+
+class ModelList(list):
+    """
+    Rows of a model already fetched, for the list templates that look up the model of their rows
+    """
+    def __init__(self, model, rows):
+        super(ModelList, self).__init__(rows)
+        self.model = model
+
+
+class KeysetPage(Page):
+    keyset = True
+
+    def __init__(self, object_list, paginator, has_previous, has_next):
+        super(KeysetPage, self).__init__(object_list, None, paginator)
+        self._has_previous = has_previous
+        self._has_next = has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_next(self):
+        return self._has_next
+
+    def previous_cursor(self):
+        return self.object_list[0].pk if self.object_list else None
+
+    def next_cursor(self):
+        return self.object_list[-1].pk if self.object_list else None
+
+
+class KeysetPaginator(CachedCountPaginator):
+    """
+    Pages a queryset ordered on one column by seeking past the (column, id) of the row a page starts after or ends
+    before, rather than by offset, so a page deep into the list costs what the first does. Pages are found by
+    their cursor, the id of that row, and the count is only ever shown.
+    """
+    def __init__(self, object_list, per_page, column, descending, count=None):
+        super(KeysetPaginator, self).__init__(object_list, per_page, count=count)
+        self.column = column
+        self.descending = descending
+
+    def seek(self, cursor, forward):
+        """
+        Returns the rows after or before the row with the given id in the order of the list, and whether there
+        are more beyond them. Returns None if that row isn't in the list.
+        """
+        queryset = self.object_list
+        down = self.descending == forward
+        lookup = 'lt' if down else 'gt'
+
+        if cursor is not None:
+            condition = Q(**{'pk__%s' % lookup: cursor})
+            if self.column != queryset.model._meta.pk.name:
+                value = queryset.filter(pk=cursor).values_list(self.column, flat=True).first()
+                if value is None:
+                    return None
+                condition = Q(**{'%s__%s' % (self.column, lookup): value}) | Q(condition, **{self.column: value})
+            queryset = queryset.filter(condition)
+
+        order = [('-%s' if down else '%s') % name for name in (self.column, 'pk')]
+        if self.column == queryset.model._meta.pk.name:
+            order = order[:1]
+        rows = list(queryset.order_by(*order)[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        return (rows if forward else rows[::-1]), more
+
+    def keyset_page(self, after=None, before=None):
+        model = self.object_list.model
+        if before is not None:
+            seek = self.seek(before, False)
+            if seek and seek[0]:
+                return KeysetPage(ModelList(model, seek[0]), self, seek[1], True)
+        elif after is not None:
+            seek = self.seek(after, True)
+            if seek and seek[0]:
+                return KeysetPage(ModelList(model, seek[0]), self, True, seek[1])
+
+        # the first page, also where cursors to rows that are gone or with nothing past them lead
+        rows, more = self.seek(None, True)
+        return KeysetPage(ModelList(model, rows), self, False, more)
+
+
+class KeysetPaginationMixin(object):
+    """
+    Pages a list ordered on a single column that can't be null with KeysetPaginator, following the cursors in the
+    _after and _before parameters, which smartmin leaves out of those it builds page links from. Lists in any
+    other order are paged by offset, with their count cached by CachedCountPaginator. Either is given row_count
+    when whoever set the rows has counted them already.
+    """
+    paginator_class = CachedCountPaginator
+    row_count = None
+
+    def get_paginator(self, queryset, per_page, **kwargs):
+        kwargs.setdefault('count', self.row_count)
+        return super(KeysetPaginationMixin, self).get_paginator(queryset, per_page, **kwargs)
+
+    def get_keyset_order(self, queryset):
+        """
+        Returns the column the queryset is ordered on and whether it's descending, or None if it can't be keyed
+        """
+        order = list(queryset.query.order_by) if queryset.ordered else []
+        if not order or not all(isinstance(name, basestring) for name in order):
+            return None
+
+        pk_name = queryset.model._meta.pk.name
+        names = [name.lstrip('-') for name in order]
+        # the id is what ties are broken on anyway
+        if len(order) == 2 and names[1] in ('pk', pk_name) and order[0][0] == order[1][0]:
+            order, names = order[:1], names[:1]
+        if len(order) != 1 or '__' in names[0] or names[0] == '?':
+            return None
+
+        column = pk_name if names[0] == 'pk' else names[0]
+        try:
+            field = queryset.model._meta.get_field(column)
+        except FieldDoesNotExist:
+            return None
+        if not field.concrete or field.is_relation or field.null:
+            return None
+        return column, order[0].startswith('-')
+
+    def get_cursor(self, name):
+        try:
+            return int(self.request.GET.get(name, ''))
+        except ValueError:
+            return None
+
+    def paginate_queryset(self, queryset, page_size):
+        keyset = self.get_keyset_order(queryset)
+        if keyset is None:
+            return super(KeysetPaginationMixin, self).paginate_queryset(queryset, page_size)
+
+        paginator = KeysetPaginator(queryset, page_size, *keyset, count=self.row_count)
+        page = paginator.keyset_page(after=self.get_cursor('_after'), before=self.get_cursor('_before'))
+        return paginator, page, page.object_list, page.has_other_pages()